@@ -1,23 +1,29 @@
 # this file is meant to connect claude model via aws bedrock
-import json, time
+import asyncio
+import time
+import logging
 import os
-from typing import Optional, Dict, List
-from functools import lru_cache
+import threading
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Iterator, Optional, Dict, List
 from dotenv import load_dotenv
 
 load_dotenv()
 
-import boto3
-from botocore.exceptions import BotoCoreError, NoCredentialsError
+from llm_cache import companion_cache_key, get_companion_cache
+from metrics import count, record_span
+
+logger = logging.getLogger(__name__)
+
+# botocore and boto3 load on the first real call, see get_bedrock_client
+if TYPE_CHECKING:
+    from bedrock_client import BedrockClient
 
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 BEDROCK_MODEL_ID = ("arn:aws:bedrock:us-east-1:862567259910:inference-profile/us.anthropic.claude-3-5-sonnet-20241022-v2:0")
 
-_bedrock_client = None
-
-# rate limiting variables to avoid throttling
-_last_call_time: float = 0.0
-rate_limit_secs: int = 3
+_bedrock_client: Optional["BedrockClient"] = None
+_bedrock_lock = threading.Lock()
 
 # system prompt for the journaling companion
 SYSTEM_PROMPT = """
@@ -48,17 +54,26 @@ Daily Prompts Rules:
 """
 
 # Get or create the Bedrock client
-def get_bedrock_client():
+def get_bedrock_client() -> "BedrockClient":
     global _bedrock_client
-    if _bedrock_client is None:
-        _bedrock_client = boto3.client(
-            'bedrock-runtime',
-            region_name=os.getenv("AWS_REGION", "us-east-1")
-        )
+    if _bedrock_client is not None:
+        return _bedrock_client
+    with _bedrock_lock:
+        if _bedrock_client is None:
+            from bedrock_client import BedrockClient, build_runtime_client
+
+            _bedrock_client = BedrockClient(build_runtime_client(AWS_REGION))
     return _bedrock_client
 
+# Swap in a different client, e.g. one wrapping StubBedrockRuntime for local testing
+def set_bedrock_client(client: Optional["BedrockClient"]) -> None:
+    global _bedrock_client
+    _bedrock_client = client
+
 # Check if Claude model is available
 def has_claude() -> bool:
+    from botocore.exceptions import BotoCoreError, NoCredentialsError
+
     if not BEDROCK_MODEL_ID:
         return False
     try:
@@ -69,23 +84,13 @@ def has_claude() -> bool:
     except Exception:
         return False
 
-# Call the Claude model via Bedrock
-def _call_companion(user_prompt: str, max_tokens: int = 250) -> Optional[str]:
-    if not has_claude():
-        print("Claude not available")
-        return None
-    
-    body = {
+# Build the invoke_model request body for a companion call
+def _companion_body(user_prompt: str, max_tokens: int) -> Dict:
+    return {
             "anthropic_version": "bedrock-2023-05-31",
             "max_tokens": max_tokens,
             "system": SYSTEM_PROMPT,
             "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": SYSTEM_PROMPT}
-                    ]
-                },
                 {
                     "role": "user",
                     "content": [
@@ -95,60 +100,80 @@ def _call_companion(user_prompt: str, max_tokens: int = 250) -> Optional[str]:
             ],
         }
 
-    try:
-        client = get_bedrock_client()
+# Pull the reply text out of an invoke_model payload
+def _payload_text(payload: Dict) -> Optional[str]:
+    if "content" in payload and payload["content"]:
+        for block in payload["content"]:
+            if block.get("type") == "text":
+                return block["text"].strip()
+
+    logger.warning("Claude response missing text content: %s", payload)
+    return None
 
-        response = client.invoke_model(
-            modelId=BEDROCK_MODEL_ID,
-            body=json.dumps(body),
-            contentType="application/json",
-            accept="application/json",
-        )
-
-        payload = json.loads(response["body"].read())
-        #content = payload.get("content", [])
-
-        #if content and content[0].get("type") == "text":
-           #return content[0]["text"].strip()
-
-        if "content" in payload and payload["content"]:
-            for block in payload["content"]:
-                if block.get("type") == "text":
-                    return block["text"].strip()
-        
-        print("Claude response missing text content", payload)
+# Compare the estimated input tokens of a call with what the response usage reports
+def _log_input_tokens(user_prompt: str, usage: Optional[Dict]) -> None:
+    from context_builder import estimate_tokens
+
+    actual = (usage or {}).get("input_tokens")
+    estimated = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user_prompt)
+    if isinstance(actual, int):
+        logger.info("Companion input tokens: estimated %d, actual %d (%+.0f%%)",
+                    estimated, actual, (estimated - actual) / max(actual, 1) * 100)
+
+# Call the Claude model via Bedrock
+def _call_companion(user_prompt: str, max_tokens: int = 250) -> Optional[str]:
+    if not has_claude():
+        logger.info("Claude not available")
         return None
 
+    try:
+        client = get_bedrock_client()
+        payload = client.invoke(BEDROCK_MODEL_ID, _companion_body(user_prompt, max_tokens))
+        _log_input_tokens(user_prompt, payload.get("usage"))
+        return _payload_text(payload)
+
     except Exception as e:
-        print("Claude error:", e)
+        logger.error("Claude error: %s", e)
         return None
 
-#caching companion calls to avoid rate limits
-@lru_cache(maxsize=32)
-def _cache_companion_call(prompt: str, max_tokens: int = 250) -> Optional[str]:
-    return _call_companion(prompt, max_tokens)
-
-# Public function to call the companion model
+# Public function to call the companion model, replies are cached on disk across restarts
 def call_companion(user_prompt: str, max_tokens: int = 250) -> Optional[str]:
-    global _last_call_time
-
     if not has_claude():
-        print("Claude not available")
+        logger.info("Claude not available")
         return None
 
-    return _cache_companion_call(user_prompt, max_tokens)
+    cache = get_companion_cache()
+    key = companion_cache_key(BEDROCK_MODEL_ID, SYSTEM_PROMPT, user_prompt, max_tokens)
+    cached_reply = cache.get(key)
+    if cached_reply is not None:
+        return cached_reply
 
-# Generate companion response to a journal entry
-def generate_companion_response(entry: Dict) -> Optional[str]:
-    if not has_claude():
-        return None
-    
+    response = _call_companion(user_prompt, max_tokens)
+    if response:
+        cache.put(key, response)
+    return response
+
+# Start a companion call on the client's worker pool, the future resolves to the reply or None
+def submit_companion(user_prompt: str, max_tokens: int = 250) -> Future:
+    return get_bedrock_client().submit_task(call_companion, user_prompt, max_tokens)
+
+# Await a companion call from asyncio code without blocking the event loop
+async def call_companion_async(user_prompt: str, max_tokens: int = 250) -> Optional[str]:
+    return await asyncio.wrap_future(submit_companion(user_prompt, max_tokens))
+
+# Run several companion calls at once, replies come back in prompt order
+def call_companion_many(user_prompts: List[str], max_tokens: int = 250) -> List[Optional[str]]:
+    futures = [submit_companion(prompt, max_tokens) for prompt in user_prompts]
+    return [future.result() for future in futures]
+
+# Build the user prompt asking for a reply to a journal entry
+def _companion_response_prompt(entry: Dict) -> str:
     text = entry.get("text", "")
     sentiment = entry.get("sentiment_label", "neutral")
     themes = ", ".join(entry.get("themes", [])) if entry.get("themes") else "General"
     created_at = entry.get("created_at", "today")
 
-    user_prompt = f"""
+    return f"""
 You are an empathetic journaling companion. This user has just written a journal entry.:
 Date: {created_at}
 Themes: {themes}
@@ -163,9 +188,66 @@ Please provide a warm, validating, and gentle response (under 150 words):
 - Keep it warm and converational, not formal or clinical.
     """.strip()
 
+# Generate companion response to a journal entry
+def generate_companion_response(entry: Dict) -> Optional[str]:
+    if not has_claude():
+        return None
+
+    user_prompt = _companion_response_prompt(entry)
+
     response = call_companion(user_prompt, max_tokens=220)
     if response and not response.startswith("Companion"):
         return response.strip()
     
     return None
 
+# Stream a companion call, yielding text deltas as they arrive, a cached reply comes back as one delta,
+# a stream that breaks off raises after its partial text
+def stream_companion(user_prompt: str, max_tokens: int = 250) -> Iterator[str]:
+    if not has_claude():
+        logger.info("Claude not available")
+        return
+
+    cache = get_companion_cache()
+    key = companion_cache_key(BEDROCK_MODEL_ID, SYSTEM_PROMPT, user_prompt, max_tokens)
+    cached_reply = cache.get(key)
+    if cached_reply is not None:
+        yield cached_reply
+        return
+
+    started = time.perf_counter()
+    first_token_at: Optional[float] = None
+    parts: List[str] = []
+    try:
+        events = get_bedrock_client().invoke_stream(BEDROCK_MODEL_ID, _companion_body(user_prompt, max_tokens))
+        for event in events:
+            if event.get("type") == "message_start":
+                _log_input_tokens(user_prompt, event.get("message", {}).get("usage"))
+            if event.get("type") == "message_stop" and parts:
+                # only a stream that ran to its end is a whole reply worth caching
+                cache.put(key, "".join(parts).strip())
+            if event.get("type") != "content_block_delta":
+                continue
+            delta = event.get("delta", {})
+            if delta.get("type") == "text_delta" and delta.get("text"):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    record_span("companion.first_token", first_token_at - started)
+                    logger.info("Claude time to first token: %.0f ms", (first_token_at - started) * 1000)
+                parts.append(delta["text"])
+                yield delta["text"]
+
+    except Exception as e:
+        # the text yielded so far is not a reply, callers must treat the whole call as failed
+        count("companion.stream_failed", error=type(e).__name__)
+        logger.error("Claude stream failed after %d chunks: %s", len(parts), e)
+        raise
+
+    record_span("companion.stream", time.perf_counter() - started, {"chunks": len(parts)})
+    logger.info("Claude stream finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+# Stream the companion response to a journal entry, yielding text deltas
+def generate_companion_response_stream(entry: Dict) -> Iterator[str]:
+    if not has_claude():
+        return iter(())
+    return stream_companion(_companion_response_prompt(entry), max_tokens=220)
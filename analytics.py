@@ -0,0 +1,309 @@
+# this file aggregates sentiment by theme and day with NumPy over (timestamp, score, theme_mask) arrays
+import math
+import sqlite3
+import threading
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import (
+    FRAME_FETCH_SIZE,
+    _FRAME_SQL,
+    _range_clause,
+    get_connection,
+    get_write_generation,
+    load_daily_sentiment,
+    theme_mask_clause,
+)
+from metrics import timed
+from nlp import GENERAL_THEME, THEME_NAMES, theme_filter_mask, theme_mask
+
+DAY_MS = 86_400_000
+ROLLING_WINDOWS = (7, 30)
+
+# Parallel arrays of entries sorted by time: epoch milliseconds, sentiment score and theme bitmask
+class EntryArrays:
+    __slots__ = ("ts", "score", "mask")
+
+    def __init__(self, ts: np.ndarray, score: np.ndarray, mask: np.ndarray):
+        self.ts = ts
+        self.score = score
+        self.mask = mask
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    # Entries with start <= time < end, a view found by binary search rather than a copy
+    def between(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> "EntryArrays":
+        lo = 0 if start is None else int(np.searchsorted(self.ts, _epoch_ms(start), side="left"))
+        hi = len(self.ts) if end is None else int(np.searchsorted(self.ts, _epoch_ms(end), side="left"))
+        return EntryArrays(self.ts[lo:hi], self.score[lo:hi], self.mask[lo:hi])
+
+    # Entries tagged with any, all or none of the themes, General meaning no taxonomy theme as in theme_mask_clause
+    def with_themes(self, themes: Sequence[str], match: str = "any") -> "EntryArrays":
+        if match not in ("any", "all", "none"):
+            raise ValueError(f"match must be any, all or none, not {match!r}")
+        mask, general = theme_filter_mask(themes)
+        bits = np.int64(mask)
+        hits = self.mask & bits
+        untagged = self.mask == 0
+        if match == "any":
+            keep = (hits != 0) | untagged if general else hits != 0
+        elif match == "all":
+            # a General entry has no other theme, so it can only match General on its own
+            keep = (untagged if not mask else np.zeros(len(self), dtype=bool)) if general else hits == bits
+        else:
+            keep = (hits == 0) & ~untagged if general else hits == 0
+        return EntryArrays(self.ts[keep], self.score[keep], self.mask[keep])
+
+# Milliseconds since the epoch for a date or datetime, naive values are taken as UTC
+def _epoch_ms(value) -> int:
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    elif value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+# Build arrays from entry dicts such as load_entries returns
+def arrays_from_entries(entries: List[Dict]) -> EntryArrays:
+    ts = np.array([_epoch_ms(datetime.fromisoformat(entry["created_at"])) for entry in entries], dtype=np.int64)
+    order = np.argsort(ts, kind="stable")
+    score = np.array([entry["sentiment_score"] for entry in entries], dtype=np.float64)
+    mask = np.array([theme_mask(entry["themes"]) for entry in entries], dtype=np.int64)
+    return EntryArrays(ts[order], score[order], mask[order])
+
+# Stream (timestamp, score, mask) rows matching where straight into typed buffers
+def _fetch_arrays(connection: sqlite3.Connection, where: str, params: List) -> EntryArrays:
+    cursor = connection.execute(
+        f"""
+        SELECT {_FRAME_SQL['created_at']}, sentiment_score, theme_mask
+        FROM journal_entries
+        WHERE {where}
+        ORDER BY created_at
+        """,
+        params,
+    )
+    ts, score, mask = array("q"), array("d"), array("q")
+    while True:
+        rows = cursor.fetchmany(FRAME_FETCH_SIZE)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        ts.extend(columns[0])
+        score.extend(columns[1])
+        mask.extend(columns[2])
+    return EntryArrays(
+        np.frombuffer(ts, dtype=np.int64),
+        np.frombuffer(score, dtype=np.float64),
+        np.frombuffer(mask, dtype=np.int64),
+    )
+
+# Load arrays for a range and optional theme filter straight from SQL
+@timed("db.load_entry_arrays")
+def load_arrays(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                themes: Optional[Sequence[str]] = None, match: str = "any") -> EntryArrays:
+    where, params = _range_clause(start, end)
+    if themes:
+        theme_where, theme_params = theme_mask_clause(themes, match)
+        where, params = f"{where} AND {theme_where}", params + theme_params
+    # served from the (created_at, sentiment_score, theme_mask) covering index
+    return _fetch_arrays(get_connection(), where, params)
+
+# Every entry held in memory, with the totals it was checked against when it was built
+class _Snapshot:
+    __slots__ = ("generation", "arrays", "max_id", "count", "score_total", "mask_total")
+
+    def __init__(self, generation: Tuple[str, int], arrays: EntryArrays, max_id: int, count: int,
+                 score_total: float, mask_total: float):
+        self.generation = generation
+        self.arrays = arrays
+        self.max_id = max_id
+        self.count = count
+        self.score_total = score_total
+        self.mask_total = mask_total
+
+_snapshot: Optional[_Snapshot] = None
+_snapshot_lock = threading.Lock()
+
+# Bring the snapshot up to date, appending new rows when the totals show nothing older changed
+@timed("analytics.refresh_snapshot")
+def _refresh_snapshot(previous: Optional[_Snapshot], generation: Tuple[str, int]) -> _Snapshot:
+    connection = get_connection()
+    # one read transaction so the totals and the rows describe the same database state
+    connection.execute("BEGIN")
+    try:
+        count, max_id, score_total, mask_total = connection.execute(
+            """
+            SELECT COUNT(*), COALESCE(MAX(id), 0), TOTAL(sentiment_score), TOTAL(theme_mask)
+            FROM journal_entries
+            """
+        ).fetchone()
+
+        arrays = None
+        if previous is not None and previous.generation[0] == generation[0]:
+            added = _fetch_arrays(connection, "id > ?", [previous.max_id])
+            # a rescored, deleted or back-dated older row shows up as a mismatch in one of the totals
+            unchanged = (
+                previous.count + len(added) == count
+                and math.isclose(previous.mask_total + float(added.mask.sum()), mask_total, rel_tol=1e-12)
+                and math.isclose(previous.score_total + float(added.score.sum()), score_total,
+                                 rel_tol=1e-9, abs_tol=1e-6)
+            )
+            if unchanged:
+                arrays = _append(previous.arrays, added)
+        if arrays is None:
+            arrays = _fetch_arrays(connection, "1", [])
+    finally:
+        connection.execute("COMMIT")
+    return _Snapshot(generation, arrays, max_id, count, score_total, mask_total)
+
+# Add rows to sorted arrays, re-sorting only if some of them are older than the newest existing row
+def _append(arrays: EntryArrays, added: EntryArrays) -> EntryArrays:
+    if not len(added):
+        return arrays
+    ts = np.concatenate((arrays.ts, added.ts))
+    score = np.concatenate((arrays.score, added.score))
+    mask = np.concatenate((arrays.mask, added.mask))
+    if len(arrays) and added.ts[0] < arrays.ts[-1]:
+        order = np.argsort(ts, kind="stable")
+        ts, score, mask = ts[order], score[order], mask[order]
+    return EntryArrays(ts, score, mask)
+
+# Arrays for a range and optional theme filter, sliced from the in-memory snapshot
+def entry_arrays(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 themes: Optional[Sequence[str]] = None, match: str = "any") -> EntryArrays:
+    global _snapshot
+    generation = get_write_generation()
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.generation != generation:
+            _snapshot = _refresh_snapshot(_snapshot, generation)
+        arrays = _snapshot.arrays
+    arrays = arrays.between(start, end)
+    return arrays.with_themes(themes, match) if themes else arrays
+
+# Boolean matrix with one row per entry and one column per taxonomy theme
+def theme_matrix(mask: np.ndarray) -> np.ndarray:
+    return ((mask[:, None] >> np.arange(len(THEME_NAMES), dtype=np.int64)) & 1).astype(bool)
+
+# Entries per taxonomy theme, in taxonomy order
+def theme_frequencies(arrays: EntryArrays) -> np.ndarray:
+    return theme_matrix(arrays.mask).sum(axis=0)
+
+# Mean sentiment of the entries tagged with each theme, NaN for themes without entries
+def theme_mean_sentiment(arrays: EntryArrays) -> np.ndarray:
+    matrix = theme_matrix(arrays.mask)
+    counts = matrix.sum(axis=0)
+    sums = arrays.score @ matrix
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+# How often each pair of themes appears in the same entry, the diagonal is each theme's count
+def theme_cooccurrence(arrays: EntryArrays) -> np.ndarray:
+    matrix = theme_matrix(arrays.mask).astype(np.float64)
+    return np.rint(matrix.T @ matrix).astype(np.int64)
+
+# Per theme count and mean sentiment, most frequent first, in the shape load_theme_sentiment returns
+def theme_stats(arrays: EntryArrays) -> List[Dict]:
+    matrix = theme_matrix(arrays.mask)
+    counts = matrix.sum(axis=0)
+    sums = arrays.score @ matrix
+
+    stats = [
+        {"theme": theme, "count": int(counts[index]), "avg_sentiment": float(sums[index] / counts[index])}
+        for index, theme in enumerate(THEME_NAMES)
+        if counts[index]
+    ]
+    general = arrays.mask == 0
+    if general.any():
+        stats.append({
+            "theme": GENERAL_THEME,
+            "count": int(general.sum()),
+            "avg_sentiment": float(arrays.score[general].mean()),
+        })
+    stats.sort(key=lambda stat: (-stat["count"], stat["theme"]))
+    return stats
+
+# Entry count and mean sentiment
+def sentiment_stats(arrays: EntryArrays) -> Dict:
+    return {
+        "count": len(arrays),
+        "avg_sentiment": float(arrays.score.mean()) if len(arrays) else 0.0,
+    }
+
+# Daily mean sentiment plus trailing rolling means over each window of days, weighted by entry
+def rolling_daily_sentiment(arrays: EntryArrays, windows: Sequence[int] = ROLLING_WINDOWS,
+                            first_day: Optional[date] = None) -> Dict[str, np.ndarray]:
+    return rolling_day_sums(arrays.ts // DAY_MS, np.ones(len(arrays)), arrays.score, windows, first_day)
+
+# Rolling means from (day number, entry count, score sum) rows, one row per entry or per day, days in order
+def rolling_day_sums(day_index: np.ndarray, row_counts: np.ndarray, row_sums: np.ndarray,
+                     windows: Sequence[int] = ROLLING_WINDOWS, first_day: Optional[date] = None) -> Dict[str, np.ndarray]:
+    if not len(day_index):
+        return {"day": np.array([], dtype="datetime64[D]"), "count": np.array([], dtype=np.int64)}
+
+    origin = int(day_index[0])
+    offsets = (day_index - origin).astype(np.int64)
+    counts = np.rint(np.bincount(offsets, weights=row_counts)).astype(np.int64)
+    sums = np.bincount(offsets, weights=row_sums)
+
+    # trailing sums over the window from cumulative sums, one subtraction per day
+    count_cumsum = np.concatenate(([0], np.cumsum(counts)))
+    sum_cumsum = np.concatenate(([0.0], np.cumsum(sums)))
+    days = np.arange(len(counts))
+    result: Dict[str, np.ndarray] = {
+        "day": (origin + days).astype("datetime64[D]"),
+        "count": counts,
+    }
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result["avg_sentiment"] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+        for window in windows:
+            lower = np.maximum(days + 1 - window, 0)
+            window_counts = count_cumsum[days + 1] - count_cumsum[lower]
+            window_sums = sum_cumsum[days + 1] - sum_cumsum[lower]
+            result[f"rolling_{window}"] = np.where(window_counts > 0, window_sums / np.maximum(window_counts, 1), np.nan)
+
+    # days with no entries only existed to carry the windows along
+    keep = counts > 0
+    if first_day is not None:
+        keep &= result["day"] >= np.datetime64(first_day, "D")
+    return {key: values[keep] for key, values in result.items()}
+
+# Daily sentiment with rolling averages for the Trends tab, days with entries only, start and end inclusive
+# read from the daily rollup, so the cost grows with the number of days rather than entries
+def load_daily_sentiment_rolling(start: Optional[date] = None, end: Optional[date] = None,
+                                 windows: Sequence[int] = ROLLING_WINDOWS) -> List[Dict]:
+    # the windows need history from before the first day shown
+    history_start = start - timedelta(days=max(windows) - 1) if start is not None else None
+    days = load_daily_sentiment(history_start, end)
+    series = rolling_day_sums(
+        np.array([day["day"] for day in days], dtype="datetime64[D]").astype(np.int64),
+        np.array([day["count"] for day in days], dtype=np.float64),
+        np.array([day["sentiment_sum"] for day in days], dtype=np.float64),
+        windows,
+        first_day=start,
+    )
+    rows = []
+    for index, day in enumerate(series["day"]):
+        row = {
+            "day": str(day),
+            "avg_sentiment": float(series["avg_sentiment"][index]),
+            "count": int(series["count"][index]),
+        }
+        for window in windows:
+            row[f"rolling_{window}"] = float(series[f"rolling_{window}"][index])
+        rows.append(row)
+    return rows
+
+# Theme counts and means for a date range, in the shape load_theme_sentiment returns
+def load_theme_stats(start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+    return theme_stats(entry_arrays(start, end))
+
+# Co-occurrence matrix for a date range as {theme: {theme: count}}
+def load_theme_cooccurrence(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Dict[str, int]]:
+    matrix = theme_cooccurrence(entry_arrays(start, end))
+    return {
+        row_theme: {column_theme: int(matrix[i, j]) for j, column_theme in enumerate(THEME_NAMES)}
+        for i, row_theme in enumerate(THEME_NAMES)
+    }
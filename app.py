@@ -1,12 +1,47 @@
 # this file is the main ui app file, using streamlit
 #each part of main is separated by tabs: Daily Journal, Trends, Weekly Reflection
+import time
+
+_script_started = time.perf_counter()
+
+import logging
+import os
+from datetime import datetime, timezone
+
 import pandas as pd
 import streamlit as st
 
-from database import load_entries, save_entry
-from nlp import generate_prompt
-from summary import generate_weekly_summary
-from ai_companion import has_claude, generate_companion_response
+import metrics
+from analytics import ROLLING_WINDOWS, load_daily_sentiment_rolling, load_theme_stats
+from cache import cache_stats, cached
+from database import (
+    load_entries,
+    load_sentiment_stats,
+    get_entry,
+    iso_week_bounds,
+    iso_week_of,
+    list_entry_headers,
+    list_weekly_summaries,
+    load_weekly_summary,
+    save_entry,
+    search_entries,
+)
+from nlp import generate_prompt, generate_prompt_rule
+from summary import request_summary_refresh, start_summary_job
+from ai_companion import has_claude
+from jobs import job_progress, job_stats, notify_job_workers, start_job_workers
+from llm_cache import companion_cache_stats
+from warmup import companion_ready, record_timing, start_warmup, warmup_status
+
+_imports_done = time.perf_counter()
+
+# entry headers per "load more" page in the sidebar
+SIDEBAR_PAGE_SIZE = 20
+
+# how often the pending companion reply is checked for while it streams in
+REPLY_POLL_SECS = 0.5
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
 
 st.set_page_config(
     page_title="AI Journaling Companion",
@@ -17,14 +52,95 @@ st.set_page_config(
 with open("themes.css", "r", encoding="utf-8") as f:
     st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
+# Hidden diagnostics panel, shown with ?diagnostics=1, recording starts the first time it is opened
+def render_diagnostics():
+    buffer = metrics.ring_buffer(create=True)
+    with st.expander("Diagnostics", expanded=True):
+        status = warmup_status()
+        st.markdown("**Startup**")
+        st.json({"status": status["status"], "timings": status["timings"]})
+
+        st.markdown("**Caches**")
+        st.dataframe(pd.DataFrame([
+            {"cache": "results", **cache_stats()},
+            {"cache": "companion", **companion_cache_stats()},
+        ]), hide_index=True)
+
+        jobs = job_stats()
+        if jobs:
+            st.markdown("**Background jobs**")
+            st.dataframe(pd.DataFrame(jobs), hide_index=True)
+
+        st.markdown("**Spans and counters**")
+        summary = buffer.summary()
+        if summary:
+            st.dataframe(pd.DataFrame(summary), hide_index=True)
+        else:
+            st.caption("No events recorded yet, interact with the app and reload this panel.")
+
+        recent = buffer.events(limit=50)
+        if recent:
+            st.markdown("**Recent events**")
+            st.dataframe(pd.DataFrame([
+                {
+                    "time": datetime.fromtimestamp(event["ts"], timezone.utc).strftime("%H:%M:%S.%f")[:-3],
+                    "name": event["name"],
+                    "ms": event["secs"] * 1000 if event["kind"] == "span" else None,
+                    "labels": event.get("labels") or None,
+                    "fields": event.get("fields") or None,
+                    "error": event.get("error"),
+                }
+                for event in recent
+            ]).astype({"labels": str, "fields": str}), hide_index=True)
+
+# Show the companion's reply to an entry as far as it has arrived, True once nothing more will come
+def show_reply(entry_id: int) -> bool:
+    entry = get_entry(entry_id)
+    job = job_progress(entry_id)
+
+    st.markdown("### Your Companion says:")
+    if entry is not None and entry["ai_reply"]:
+        st.markdown(f"<div class='entry-response'>{entry['ai_reply']}</div>", unsafe_allow_html=True)
+        return True
+    if entry is None or job is None or job["status"] == "dead":
+        st.markdown("*Your companion is listening quietly with you.*")
+        return True
+    if job["progress"]:
+        # the reply streams in while the job runs, a failed attempt clears it and starts over
+        st.markdown(f"<div class='entry-response'>{job['progress']}▍</div>", unsafe_allow_html=True)
+    elif job["last_error"]:
+        st.markdown("*Your companion is gathering its thoughts again...*")
+    else:
+        st.markdown("*Your companion is reflecting on your entry...*")
+    return False
+
+# Check for the pending reply, once it is settled the page reruns without this fragment so its timer stops
+def render_pending_reply():
+    entry_id = st.session_state.get("pending_reply")
+    if entry_id is None:
+        return
+    if show_reply(entry_id):
+        st.session_state["shown_reply"] = st.session_state.pop("pending_reply")
+        if _fragment is not None:
+            st.rerun()
+
+# rerun just the reply on a timer where this Streamlit has fragments, otherwise it shows on the next rerun
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+if _fragment is not None:
+    render_pending_reply = _fragment(run_every=REPLY_POLL_SECS)(render_pending_reply)
+
 def main():
     st.markdown("<div class='hero-title'>Your Personal Journaling Companion</div>", unsafe_allow_html=True)
     st.markdown("<div class='hero-title'>🫂</div>", unsafe_allow_html=True)
     tabs = st.tabs(["Daily Journal", "Trends", "Weekly Reflection"])
 
     with tabs[0]:
-        recent_entries = load_entries(days=7)
-        suggested_prompt = generate_prompt(recent_entries)
+        recent_entries = cached("recent_entries", lambda: load_entries(days=7))
+        # the companion is first reached by the warmup thread, until it reports ready the rule based prompt shows
+        if companion_ready():
+            suggested_prompt = cached(("suggested_prompt", "companion"), lambda: generate_prompt(recent_entries))
+        else:
+            suggested_prompt = cached(("suggested_prompt", "rule"), lambda: generate_prompt_rule(recent_entries))
 
         st.markdown("<div class='prompt-heading'>Your Companion asks...</div>", unsafe_allow_html=True)
         st.markdown(f"<div class='prompt-text'>{suggested_prompt}</div>", unsafe_allow_html=True)
@@ -40,24 +156,50 @@ def main():
             if not text.strip():
                 st.warning("Think about what you want to write before saving.")
             else:
-                entry_data = {"text": text}
-                ai_reply = generate_companion_response(entry_data)
-                save_entry(text, prompt=suggested_prompt, ai_reply=ai_reply)
-                
+                # the entry is committed before any Bedrock call, the reply is written later by a job worker
+                companion = has_claude()
+                entry_id = save_entry(text, prompt=suggested_prompt, request_reply=companion)
+                notify_job_workers()
+                request_summary_refresh()
+
                 st.success("Your entry has been saved.")
 
-                if ai_reply:
-                    st.markdown("### Your Companion says:")
-                    st.markdown(f"<div class='entry-response'>{ai_reply}</div>", unsafe_allow_html=True)
+                st.session_state.pop("shown_reply", None)
+                if companion:
+                    st.session_state["pending_reply"] = entry_id
                 else:
+                    st.session_state.pop("pending_reply", None)
                     st.markdown("*Your companion is listening quietly with you.*")
 
-        recent_entries = load_entries(days=7)
+        # the polling fragment only runs while a reply is pending, a settled one is drawn once per page run
+        if "pending_reply" in st.session_state:
+            render_pending_reply()
+        elif "shown_reply" in st.session_state:
+            show_reply(st.session_state["shown_reply"])
+
         with st.sidebar:
+            search_query = st.text_input("Search your entries", placeholder="Search your entries", label_visibility="collapsed")
+            if search_query.strip():
+                results = cached(("search", search_query.strip()), lambda: search_entries(search_query, limit=20))
+                st.markdown("<div class='sidebar-heading'>Search Results</div>", unsafe_allow_html=True)
+                if not results:
+                    st.markdown("*No entries match that search.*")
+                for result in results:
+                    themes_display = ", ".join(result["themes"]) or "No themes"
+                    st.markdown(
+                        f"**{result['created_at'][:10]}** — {themes_display} · {result['sentiment_label'].title()}"
+                    )
+                    st.markdown(f"<div class='prompt-box'>{result['snippet']}</div>", unsafe_allow_html=True)
+
             st.markdown("<div class='sidebar-heading'>Recent Entries</div>", unsafe_allow_html=True)
 
-            if recent_entries:
-                for entry in reversed(recent_entries):
+            # each page continues from the previous page's last row, so pages never overlap or skip
+            pages = st.session_state.setdefault("entry_pages", 1)
+            cursor = None
+            for _ in range(pages):
+                headers, cursor = cached(("entry_headers", cursor), lambda after=cursor: list_entry_headers(SIDEBAR_PAGE_SIZE, after))
+
+                for entry in headers:
                     themes_raw = entry.get("themes", []) or []
                     if isinstance(themes_raw, str):
                         themes_list = [themes_raw]
@@ -75,55 +217,58 @@ def main():
                     header = f"{entry['created_at'][:10]} — {themes_display} · {sentiment_display}"
 
                     with st.expander(header):
-                        if entry.get("prompt"):
+                        # expander bodies always run, so the entry itself is only fetched once asked for
+                        if not st.toggle("Show entry", key=f"show_entry_{entry['id']}"):
+                            continue
+                        detail = cached(("entry", entry["id"]), lambda entry_id=entry["id"]: get_entry(entry_id))
+                        if detail is None:
+                            continue
+
+                        if detail.get("prompt"):
                             st.markdown("**Prompt:**")
-                            st.markdown(f"<div class='prompt-box'>{entry['prompt']}</div>", unsafe_allow_html=True)
+                            st.markdown(f"<div class='prompt-box'>{detail['prompt']}</div>", unsafe_allow_html=True)
 
                         st.markdown("**Your Entry:**")
-                        st.markdown(f"<div class='entry-response'>{entry['text']}</div>", unsafe_allow_html=True)
+                        st.markdown(f"<div class='entry-response'>{detail['text']}</div>", unsafe_allow_html=True)
 
-                        if entry.get("ai_reply"):
+                        if detail.get("ai_reply"):
                             st.markdown("**Companion's Response:**")
-                            st.markdown(f"<div class='entry-response'>{entry['ai_reply']}</div>", unsafe_allow_html=True)        
+                            st.markdown(f"<div class='entry-response'>{detail['ai_reply']}</div>", unsafe_allow_html=True)
+
+                if cursor is None:
+                    break
+
+            if cursor is not None and st.button("Load more entries"):
+                st.session_state["entry_pages"] = pages + 1
+                st.rerun()
+
+            readiness = warmup_status()["status"]
+            st.caption(
+                f"Sentiment model: {readiness['sentiment_model']} · Companion: {readiness['companion']}"
+            )
     
     with tabs[1]:
         st.markdown("<div class='tab-heading'>Your Emotional Trends</div>", unsafe_allow_html=True)
-        entries = load_entries()
-        if not entries:
+        daily_sentiment = cached("daily_sentiment", load_daily_sentiment_rolling)
+        if not daily_sentiment:
             st.info("No entries yet, start journaling to see your shift in emotions over time.")
         else:
-            df = pd.DataFrame(entries)
-            df["created_datetime"] = pd.to_datetime(
-                df["created_at"],
-                utc=True,
-                errors="coerce",
-            )
-            df["created_date"] = df["created_datetime"].dt.date
-
-            daily_sentiment = (
-                df.groupby("created_date")["sentiment_score"]
-                .mean()
-                .reset_index()
-                .sort_values("created_date")
-            )
+            daily_frame = pd.DataFrame(daily_sentiment)
+            daily_frame["created_date"] = pd.to_datetime(daily_frame["day"]).dt.date
 
+            rolling_columns = [f"rolling_{window}" for window in ROLLING_WINDOWS]
             st.markdown("**Average Daily Sentiment Over Time**")
             st.line_chart(
-                daily_sentiment.set_index("created_date")["sentiment_score"],
+                daily_frame.set_index("created_date")[["avg_sentiment", *rolling_columns]].rename(
+                    columns={column: f"{column.split('_')[1]}-day average" for column in rolling_columns}
+                ),
                 height=300,
             )
 
-            all_themes: list[str] = []
-            for theme in df["themes"]:
-                all_themes.extend(theme)
+            theme_counts = cached("theme_counts", load_theme_stats)
 
-            if all_themes:
-                theme_count = (
-                    pd.Series(all_themes)
-                    .value_counts()
-                    .rename_axis("theme")
-                    .reset_index(name="count")
-                )
+            if theme_counts:
+                theme_count = pd.DataFrame(theme_counts)
 
                 st.markdown("**Most Frequent Themes**")
                 st.bar_chart(
@@ -133,13 +278,28 @@ def main():
 
     with tabs[2]:
         st.markdown("<div class='tab-heading'>Our Weekly Catch Up</div>", unsafe_allow_html=True)
-        week_entries = load_entries(days=7)
+        current_week = iso_week_of(datetime.now(timezone.utc).date())
+        stored_weeks = cached("weekly_summary_list", list_weekly_summaries)
+        week_options = [current_week] + [week["iso_week"] for week in stored_weeks if week["iso_week"] != current_week]
+        selected_week = st.selectbox("Week", week_options, label_visibility="collapsed")
+        stored = cached(("weekly_summary", selected_week), lambda: load_weekly_summary(selected_week))
 
-        if not week_entries:
-            st.info("No entries for the last 7 days, journal for a week to get a summary!")
+        if stored is None:
+            if selected_week == current_week and not cached("week_stats", lambda: load_sentiment_stats(iso_week_bounds(current_week)[0]))["count"]:
+                st.info("No entries for this week yet, journal for a week to get a summary!")
+            else:
+                st.info("Your weekly reflection is being prepared, check back in a moment.")
         else:
-            summary_text = generate_weekly_summary(week_entries)
-            st.markdown(summary_text)
+            st.markdown(stored["companion_summary"] or stored["rule_summary"])
+            st.caption(f"Reflecting on {stored['entry_count']} entries · written {stored['generated_at'][:16].replace('T', ' ')} UTC")
+
+    if st.query_params.get("diagnostics") == "1":
+        render_diagnostics()
 
 if __name__ == "__main__":
     main()
+    record_timing("import_secs", _imports_done - _script_started)
+    record_timing("first_render_secs", time.perf_counter() - _script_started)
+    start_warmup()
+    start_summary_job()
+    start_job_workers()
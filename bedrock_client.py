@@ -0,0 +1,285 @@
+# this file wraps the bedrock runtime client with pooling, rate limiting, retries and concurrent submission
+import io
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+from botocore.config import Config
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+from metrics import count, record_span, span
+
+# connection pool and timeouts for the underlying botocore client
+BEDROCK_MAX_POOL = int(os.getenv("BEDROCK_MAX_POOL", "8"))
+BEDROCK_CONNECT_TIMEOUT = float(os.getenv("BEDROCK_CONNECT_TIMEOUT", "5"))
+BEDROCK_READ_TIMEOUT = float(os.getenv("BEDROCK_READ_TIMEOUT", "60"))
+
+# token bucket, calls per second with a small burst allowance
+BEDROCK_RATE_PER_SEC = float(os.getenv("BEDROCK_RATE_PER_SEC", "1"))
+BEDROCK_BURST = int(os.getenv("BEDROCK_BURST", "4"))
+
+# retry policy for throttling and server errors
+BEDROCK_MAX_ATTEMPTS = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "5"))
+BEDROCK_BACKOFF_BASE = float(os.getenv("BEDROCK_BACKOFF_BASE", "0.5"))
+BEDROCK_BACKOFF_CAP = float(os.getenv("BEDROCK_BACKOFF_CAP", "8"))
+
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+}
+
+RETRYABLE_NETWORK_ERRORS = (
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+# Thread safe token bucket, acquire blocks until a token is free
+class TokenBucket:
+    def __init__(self, rate: float = BEDROCK_RATE_PER_SEC, capacity: int = BEDROCK_BURST,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    # Take one token, waiting for the bucket to refill if needed
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+# Decide whether an error from invoke_model is worth another attempt
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in RETRYABLE_ERROR_CODES or status == 429 or status >= 500
+    return isinstance(error, RETRYABLE_NETWORK_ERRORS)
+
+# Token counts from an Anthropic usage block, missing counts are left out
+def usage_fields(usage: Optional[Dict]) -> Dict[str, int]:
+    usage = usage or {}
+    return {key: usage[key] for key in ("input_tokens", "output_tokens") if isinstance(usage.get(key), int)}
+
+# Exponential backoff with full jitter for the given zero based attempt
+def backoff_delay(attempt: int, base: float = BEDROCK_BACKOFF_BASE, cap: float = BEDROCK_BACKOFF_CAP) -> float:
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+# Build the pooled botocore client, retries are handled by BedrockClient instead
+def build_runtime_client(region: str):
+    import boto3
+
+    config = Config(
+        max_pool_connections=BEDROCK_MAX_POOL,
+        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        retries={"total_max_attempts": 1, "mode": "standard"},
+    )
+    return boto3.client("bedrock-runtime", region_name=region, config=config)
+
+# Rate limited, retrying front end to a bedrock-runtime client
+class BedrockClient:
+    def __init__(self, runtime, rate_limiter: Optional[TokenBucket] = None,
+                 max_attempts: int = BEDROCK_MAX_ATTEMPTS, max_workers: int = BEDROCK_MAX_POOL,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.runtime = runtime
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.max_attempts = max_attempts
+        self.max_workers = max_workers
+        self._sleep = sleep
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    # Call a runtime operation under the rate limiter, retrying throttling and 5xx errors
+    def _with_retries(self, operation: Callable[[], Dict]) -> Dict:
+        for attempt in range(self.max_attempts):
+            self.rate_limiter.acquire()
+            try:
+                return operation()
+            except Exception as error:
+                if not is_retryable(error) or attempt == self.max_attempts - 1:
+                    raise
+                count("bedrock.retry", error=type(error).__name__)
+                self._sleep(backoff_delay(attempt))
+        raise RuntimeError("max_attempts must be at least 1")
+
+    # Invoke the model and return the parsed JSON payload
+    def invoke(self, model_id: str, body: Dict) -> Dict:
+        with span("bedrock.invoke") as timing:
+            response = self._with_retries(
+                lambda: self.runtime.invoke_model(
+                    modelId=model_id,
+                    body=json.dumps(body),
+                    contentType="application/json",
+                    accept="application/json",
+                )
+            )
+            payload = json.loads(response["body"].read())
+            timing.set(**usage_fields(payload.get("usage")))
+        return payload
+
+    # Open a response stream and yield each decoded event, only opening the stream is retried
+    def invoke_stream(self, model_id: str, body: Dict) -> Iterator[Dict]:
+        started = time.perf_counter()
+        usage: Dict[str, int] = {}
+        first_token = False
+        try:
+            response = self._with_retries(
+                lambda: self.runtime.invoke_model_with_response_stream(
+                    modelId=model_id,
+                    body=json.dumps(body),
+                    contentType="application/json",
+                    accept="application/json",
+                )
+            )
+            for event in response["body"]:
+                chunk = event.get("chunk")
+                if not chunk:
+                    continue
+                payload = json.loads(chunk["bytes"])
+                kind = payload.get("type")
+                if kind == "message_start":
+                    usage.update(usage_fields(payload.get("message", {}).get("usage")))
+                elif kind == "message_delta":
+                    usage.update(usage_fields(payload.get("usage")))
+                elif kind == "content_block_delta" and not first_token:
+                    first_token = True
+                    record_span("bedrock.first_token", time.perf_counter() - started)
+                yield payload
+        finally:
+            record_span("bedrock.stream", time.perf_counter() - started, usage)
+
+    # Run any callable on the client's worker pool
+    def submit_task(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="bedrock",
+                )
+        return self._executor.submit(fn, *args, **kwargs)
+
+    # Queue an invoke on the worker pool and return a future for the payload
+    def submit(self, model_id: str, body: Dict) -> Future:
+        return self.submit_task(self.invoke, model_id, body)
+
+    # Invoke several bodies concurrently, results come back in input order
+    def invoke_many(self, model_id: str, bodies: Sequence[Dict]) -> List[Dict]:
+        futures = [self.submit(model_id, body) for body in bodies]
+        return [future.result() for future in futures]
+
+    # Stop the worker pool, waiting for queued calls to finish
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+# Build a ClientError that looks like Bedrock throttling
+def throttling_error(operation: str = "InvokeModel") -> ClientError:
+    return ClientError(
+        {
+            "Error": {"Code": "ThrottlingException", "Message": "Too many requests, please wait before trying again."},
+            "ResponseMetadata": {"HTTPStatusCode": 429},
+        },
+        operation,
+    )
+
+# Local stand in for the bedrock-runtime client, returns canned replies and injected errors
+class StubBedrockRuntime:
+    def __init__(self, replies: Union[str, Sequence[str], Callable[[Dict], str]] = "Stub reply.",
+                 errors: Optional[Sequence[Optional[Exception]]] = None, latency: float = 0.0,
+                 stream_delay: float = 0.0):
+        self.replies = replies
+        self.errors = list(errors or [])
+        self.latency = latency
+        self.stream_delay = stream_delay
+        self.calls: List[Dict] = []
+        self._lock = threading.Lock()
+
+    # Pick the canned reply for a request body
+    def _reply_for(self, body: Dict, index: int) -> str:
+        if callable(self.replies):
+            return self.replies(body)
+        if isinstance(self.replies, str):
+            return self.replies
+        return self.replies[index % len(self.replies)]
+
+    # Record a call and return its canned reply, raising the next injected error if there is one
+    def _next_reply(self, body: str) -> str:
+        request = json.loads(body)
+        with self._lock:
+            index = len(self.calls)
+            self.calls.append(request)
+            error = self.errors.pop(0) if self.errors else None
+
+        if self.latency:
+            time.sleep(self.latency)
+        if error is not None:
+            raise error
+        return self._reply_for(request, index)
+
+    # Mimic invoke_model
+    def invoke_model(self, modelId: str, body: str, contentType: str = "application/json",
+                     accept: str = "application/json") -> Dict:
+        text = self._next_reply(body)
+        payload = {
+            "content": [{"type": "text", "text": text}],
+            "usage": {"input_tokens": len(body) // 4, "output_tokens": len(text) // 4},
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+    # Mimic invoke_model_with_response_stream, sending the reply a few words per event
+    def invoke_model_with_response_stream(self, modelId: str, body: str, contentType: str = "application/json",
+                                          accept: str = "application/json") -> Dict:
+        text = self._next_reply(body)
+        return {"body": self._event_stream(body, text)}
+
+    # Yield Anthropic messages stream events the way the bedrock event stream wraps them
+    def _event_stream(self, body: str, text: str, words_per_event: int = 3) -> Iterator[Dict]:
+        def event(payload: Dict) -> Dict:
+            return {"chunk": {"bytes": json.dumps(payload).encode("utf-8")}}
+
+        yield event({"type": "message_start", "message": {"usage": {"input_tokens": len(body) // 4, "output_tokens": 0}}})
+        yield event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+
+        words = text.split(" ")
+        for start in range(0, len(words), words_per_event):
+            piece = " ".join(words[start:start + words_per_event])
+            if start + words_per_event < len(words):
+                piece += " "
+            if self.stream_delay:
+                time.sleep(self.stream_delay)
+            yield event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}})
+
+        yield event({"type": "content_block_stop", "index": 0})
+        yield event({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(text) // 4}})
+        yield event({"type": "message_stop"})
@@ -0,0 +1 @@
+# benchmarks for the journaling pipeline, run each module with python -m benchmarks.<name>
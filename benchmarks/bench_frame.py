@@ -0,0 +1,54 @@
+# this benchmark compares load_entries plus a DataFrame with the columnar load_entries_frame path
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+# imported up front so neither path is charged for loading pandas
+import pandas as pd
+
+import database
+from benchmarks.synthetic import populate
+
+# Best of a few untraced runs, then one more under tracemalloc for its peak memory
+def measure(fn, repeats: int = 3):
+    elapsed = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = min(elapsed, time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+# The Trends tab's original path, list of dicts then DataFrame then datetime parsing
+def dict_path():
+    df = pd.DataFrame(database.load_entries())
+    df["created_datetime"] = pd.to_datetime(df["created_at"], utc=True, errors="coerce")
+    return df[["created_datetime", "sentiment_score", "sentiment_label", "themes"]]
+
+def frame_path():
+    return database.load_entries_frame(columns=["created_at", "sentiment_score", "sentiment_label", "themes"])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DataFrame load path benchmark")
+    parser.add_argument("--entries", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        print(f"Populating {args.entries} entries...")
+        populate(path, args.entries)
+        database.close_connection()
+
+        for name, fn in (("load_entries + DataFrame", dict_path), ("load_entries_frame", frame_path)):
+            frame, elapsed, peak = measure(fn)
+            print(f"{name:<26} {elapsed:>7.2f}s  peak {peak / 2**20:>8.1f} MiB  rows {len(frame)}")
+            database.close_connection()
+
+if __name__ == "__main__":
+    main()
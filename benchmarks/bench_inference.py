@@ -0,0 +1,92 @@
+# this benchmark compares single-entry sentiment calls in process against the shared batching inference server
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+import inference_server
+import nlp
+from benchmarks.synthetic import generate_entries
+
+# Run calls_per_thread single-text calls on each of threads threads
+def stress(call: Callable[[List[str]], object], texts: List[str], threads: int, calls_per_thread: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    start = threading.Barrier(threads + 1)
+
+    def worker(offset: int) -> None:
+        start.wait()
+        for index in range(offset, offset + calls_per_thread):
+            began = time.perf_counter()
+            call([texts[index % len(texts)]])
+            latencies.append(time.perf_counter() - began)
+        inference_server._close_client()
+
+    workers = [threading.Thread(target=worker, args=(n * calls_per_thread,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "calls_per_sec": threads * calls_per_thread / elapsed,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+# Wait until a freshly started server answers, it has to load the model first
+def wait_for_server(address: str, timeout: float = 300.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not inference_server.server_available(address, timeout=1.0):
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"inference server at {address} did not come up")
+        time.sleep(0.5)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="In-process vs shared server sentiment throughput")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--calls", type=int, default=20, help="calls per thread")
+    parser.add_argument("--max-batch", type=int, default=inference_server.INFERENCE_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=inference_server.INFERENCE_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    texts = [entry["text"] for entry in generate_entries(512)]
+    backend = nlp.get_sentiment_backend()
+
+    with tempfile.TemporaryDirectory() as directory:
+        address = os.path.join(directory, "inference.sock")
+        server = subprocess.Popen([
+            sys.executable, "-m", "inference_server", "--address", address,
+            "--max-batch", str(args.max_batch), "--max-wait-ms", str(args.max_wait_ms),
+        ])
+        try:
+            wait_for_server(address)
+
+            def remote(batch: List[str]) -> object:
+                result = inference_server.remote_sentiment_embeddings(batch, address)
+                if result is None:
+                    raise RuntimeError("inference server stopped answering")
+                return result
+
+            print(f"{'threads':>7}  {'mode':<8} {'calls/s':>9} {'p95 ms':>9}")
+            for threads in args.threads:
+                for mode, call in (
+                    ("process", lambda batch: nlp.compute_sentiment_embeddings_batch(batch, backend=backend)),
+                    ("server", remote),
+                ):
+                    result = stress(call, texts, threads, args.calls)
+                    print(f"{threads:>7}  {mode:<8} {result['calls_per_sec']:>9.1f} {result['p95_ms']:>9.1f}")
+            stats = inference_server.server_stats(address)
+            print(f"Server batches held {stats['texts_per_batch']:.1f} texts on average")
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# this benchmark compares the compiled theme matcher with the old per-keyword scan as the taxonomy grows
+import argparse
+import random
+import re
+import time
+from typing import Dict, List
+
+from theme_matcher import ThemeMatcher
+
+# Build a taxonomy of made up single words and two word phrases
+def synthetic_taxonomy(themes: int, terms_per_theme: int, seed: int = 7) -> Dict[str, List[str]]:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    taxonomy: Dict[str, List[str]] = {}
+    for theme in range(themes):
+        terms = []
+        for _ in range(terms_per_theme):
+            word = "".join(rng.choice(letters) for _ in range(rng.randint(4, 9)))
+            if rng.random() < 0.2:
+                word += " " + "".join(rng.choice(letters) for _ in range(rng.randint(4, 9)))
+            terms.append(word)
+        taxonomy[f"Theme{theme}"] = terms
+    return taxonomy
+
+# Build entries that mix filler words with a few taxonomy terms
+def synthetic_texts(taxonomy: Dict[str, List[str]], count: int, words: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    filler = ["today", "felt", "really", "the", "and", "after", "because", "then", "quiet", "long"]
+    all_terms = [term for terms in taxonomy.values() for term in terms]
+    texts = []
+    for _ in range(count):
+        tokens = [rng.choice(filler) for _ in range(words)]
+        for _ in range(3):
+            tokens[rng.randrange(words)] = rng.choice(all_terms)
+        texts.append(" ".join(tokens))
+    return texts
+
+# The original extract_themes loop, kept here as the baseline
+def naive_themes(text: str, taxonomy: Dict[str, List[str]]) -> List[str]:
+    tokens = set(re.findall(r"\w+", text.lower()))
+    return [theme for theme, keywords in taxonomy.items() if any(keyword in tokens for keyword in keywords)]
+
+# Time texts per second for one matcher function
+def throughput(fn, texts: List[str]) -> float:
+    started = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return len(texts) / (time.perf_counter() - started)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Theme matcher throughput")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=200)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[60, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'terms':>8} {'build ms':>10} {'matcher texts/s':>16} {'naive texts/s':>14}")
+    for size in args.sizes:
+        taxonomy = synthetic_taxonomy(themes=20, terms_per_theme=max(1, size // 20))
+        texts = synthetic_texts(taxonomy, args.texts, args.words)
+
+        started = time.perf_counter()
+        matcher = ThemeMatcher(taxonomy)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        compiled = throughput(matcher.match, texts)
+        naive = throughput(lambda text: naive_themes(text, taxonomy), texts)
+        print(f"{size:>8} {build_ms:>10.1f} {compiled:>16.0f} {naive:>14.0f}")
+
+if __name__ == "__main__":
+    main()
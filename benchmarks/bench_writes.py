@@ -0,0 +1,92 @@
+# this benchmark stresses concurrent entry saves, per-thread transactions against the shared writer thread
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import database
+
+# Insert one pre-analysed entry, inference is left out so only the write path is measured
+def _write(connection: sqlite3.Connection, index: int) -> int:
+    return database._insert_entry(
+        connection, datetime.now(timezone.utc).isoformat(), f"stress entry {index} about work and sleep",
+        "benchmark", None, 0.5, "positive", ["Work", "Health"],
+    )
+
+# Every thread opens its own connection and commits each save on its own, the old save_entry path
+def direct_save(index: int) -> None:
+    connection = database.get_connection()
+    with database.transaction(connection):
+        _write(connection, index)
+
+# Saves go through the writer thread and are committed in groups
+def queued_save(index: int) -> None:
+    database.run_write(lambda connection: _write(connection, index))
+
+# Run writes_per_thread saves on each of threads threads, counting failures such as "database is locked"
+def stress(save: Callable[[int], None], threads: int, writes_per_thread: int) -> Dict[str, float]:
+    errors: List[str] = []
+    latencies: List[float] = []
+    start = threading.Barrier(threads + 1)
+
+    def worker(offset: int) -> None:
+        start.wait()
+        for index in range(offset, offset + writes_per_thread):
+            began = time.perf_counter()
+            try:
+                save(index)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            latencies.append(time.perf_counter() - began)
+        database.close_connection()
+
+    workers = [threading.Thread(target=worker, args=(n * writes_per_thread,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    done = threads * writes_per_thread - len(errors)
+    return {
+        "writes_per_sec": done / elapsed,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "errors": len(errors),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent save stress test")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--writes", type=int, default=200, help="saves per thread")
+    parser.add_argument("--synchronous", default="NORMAL", help="PRAGMA synchronous for every connection")
+    args = parser.parse_args()
+
+    database.PRAGMAS = tuple(
+        f"PRAGMA synchronous = {args.synchronous}" if pragma.startswith("PRAGMA synchronous") else pragma
+        for pragma in database.PRAGMAS
+    )
+
+    print(f"{'threads':>7}  {'mode':<7} {'writes/s':>10} {'p95 ms':>9} {'errors':>7} {'per batch':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in args.threads:
+            for mode, save in (("direct", direct_save), ("queued", queued_save)):
+                database.DB_PATH = os.path.join(directory, f"{mode}_{threads}.db")
+                database.get_connection()
+                result = stress(save, threads, args.writes)
+                batch = database.writer_stats()["writes_per_batch"] if mode == "queued" else 1.0
+                database.close_writer()
+                database._write_queue = database.WriteQueue()
+                print(
+                    f"{threads:>7}  {mode:<7} {result['writes_per_sec']:>10.0f} {result['p95_ms']:>9.1f} "
+                    f"{result['errors']:>7} {batch:>10.1f}"
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# this file runs the journaling pipeline benchmarks on synthetic journals and compares them to a baseline
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import database
+from benchmarks.synthetic import generate_entries, populate
+
+DEFAULT_SIZES = [1_000, 100_000]
+ALL_SIZES = [1_000, 100_000, 1_000_000]
+
+# a metric regresses when it is this much worse than the baseline
+DEFAULT_THRESHOLD = 0.25
+# latency changes smaller than this are timer noise, whatever the ratio
+MIN_DELTA_MS = 0.5
+
+# Run fn repeatedly and report p50 and p95 latency in milliseconds
+def latency(fn: Callable[[], object], repeats: int) -> Dict[str, float]:
+    fn()
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+# Items per second for fn applied to a list of items in one go
+def throughput(fn: Callable[[List], object], items: List) -> float:
+    started = time.perf_counter()
+    fn(items)
+    return len(items) / (time.perf_counter() - started)
+
+# Point the companion at a local stub with fixed latency and a throwaway reply cache
+def use_stub_companion(directory: str, latency_secs: float) -> None:
+    import ai_companion
+    import llm_cache
+    from bedrock_client import BedrockClient, StubBedrockRuntime, TokenBucket
+
+    stub = StubBedrockRuntime(replies="A calm, steady week with room to breathe.", latency=latency_secs)
+    ai_companion.set_bedrock_client(BedrockClient(stub, rate_limiter=TokenBucket(rate=0)))
+    llm_cache._companion_cache = llm_cache.CompanionCache(path=os.path.join(directory, "companion_cache.db"))
+
+# Whether torch and transformers can be imported, the model benchmarks need them
+def model_available() -> bool:
+    try:
+        import torch  # noqa: F401
+        import transformers  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+# Benchmarks that only need the database, run against a journal of the given size
+def bench_database(size: int, repeats: int) -> Dict[str, float]:
+    from analytics import load_daily_sentiment_rolling, load_theme_stats
+    from summary import generate_weekly_summary_rule, generate_weekly_summary_rule_range
+
+    results: Dict[str, float] = {}
+    week_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    for name, fn in (
+        ("load_entries_days7", lambda: database.load_entries(days=7)),
+        ("load_entries_all", lambda: database.load_entries()),
+        ("trends_aggregation", lambda: (database.load_daily_sentiment(), database.load_theme_counts())),
+        ("trends_analytics", lambda: (load_daily_sentiment_rolling(), load_theme_stats())),
+        ("weekly_summary_rule_entries", lambda: generate_weekly_summary_rule(database.load_entries(days=7))),
+        ("weekly_summary_rule_sql", lambda: generate_weekly_summary_rule_range(week_start)),
+        ("entry_headers_page", lambda: database.list_entry_headers(20)),
+    ):
+        # scanning every row of a million entries is slow, a few samples are enough
+        runs = max(1, repeats // 10) if name == "load_entries_all" and size > 10_000 else repeats
+        for metric, value in latency(fn, runs).items():
+            results[f"{name}_{metric}"] = value
+    return results
+
+# Benchmarks that do not depend on journal size
+def bench_nlp(texts: List[str], repeats: int, with_model: bool) -> Dict[str, float]:
+    from nlp import compute_sentiment_batch, extract_themes
+
+    results = {
+        "extract_themes_per_sec": throughput(lambda items: [extract_themes(text) for text in items], texts),
+    }
+    if with_model:
+        compute_sentiment_batch(texts[:4])
+        sample = texts[:256]
+        results["compute_sentiment_batch_per_sec"] = throughput(compute_sentiment_batch, sample)
+        results["compute_sentiment_single_per_sec"] = throughput(
+            lambda items: [compute_sentiment_batch([text]) for text in items], sample[:64]
+        )
+    return results
+
+# Time save_entry end to end, which includes sentiment inference
+def bench_save(texts: List[str], repeats: int) -> Dict[str, float]:
+    texts = iter(texts * (repeats // len(texts) + 2))
+    timings = latency(lambda: database.save_entry(next(texts), prompt="benchmark"), repeats)
+    return {f"save_entry_{metric}": value for metric, value in timings.items()}
+
+# Time the companion summary path against the stubbed Bedrock client
+def bench_companion(repeats: int) -> Dict[str, float]:
+    import llm_cache
+    from summary import generate_weekly_summary_companion
+
+    cache = llm_cache.get_companion_cache()
+    cache.hits = cache.misses = 0
+    entries = database.load_entries(days=7) or list(generate_entries(5, seed=3))
+    counter = iter(range(10 ** 9))
+
+    # vary the entries so every call misses the reply cache and reaches the stub, the prompt carries
+    # only dates, moods and themes, so the marker goes into the themes and created_at stays a real timestamp
+    def call() -> None:
+        marker = dict(entries[-1], themes=[*entries[-1]["themes"], f"benchmark-{next(counter)}"])
+        generate_weekly_summary_companion(entries[:-1] + [marker])
+
+    timings = latency(call, repeats)
+    results = {f"weekly_summary_companion_{metric}": value for metric, value in timings.items()}
+
+    cached_entries = list(entries)
+    generate_weekly_summary_companion(cached_entries)
+    cached = latency(lambda: generate_weekly_summary_companion(cached_entries), repeats)
+    results["weekly_summary_companion_cached_p50_ms"] = cached["p50_ms"]
+    results["companion_cache_hit_rate"] = llm_cache.companion_cache_stats()["hit_rate"]
+    return results
+
+# Lower is better for latencies, higher is better for throughputs and rates
+def _higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_sec") or metric.endswith("_rate")
+
+# Compare results against a baseline file, returning a line per regressed metric
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for size, metrics in results["results"].items():
+        for metric, value in metrics.items():
+            before = baseline.get("results", {}).get(size, {}).get(metric)
+            if not before or metric.endswith("_rate"):
+                continue
+            change = (before - value) / before if _higher_is_better(metric) else (value - before) / before
+            if not _higher_is_better(metric) and value - before < MIN_DELTA_MS:
+                continue
+            if change > threshold:
+                regressions.append(f"{size} {metric}: {before:.3f} -> {value:.3f} ({change:+.0%})")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Journaling pipeline benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help=f"journal sizes to benchmark, e.g. {' '.join(map(str, ALL_SIZES))}")
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bedrock-latency", type=float, default=0.05, help="stub Bedrock latency in seconds")
+    parser.add_argument("--no-model", action="store_true", help="skip benchmarks that load the sentiment model")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    # read the baseline up front so a wrong path fails before minutes of benchmarks, not after
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot read baseline {args.baseline}: {e}")
+
+    with_model = not args.no_model and model_available()
+    texts = [entry["text"] for entry in generate_entries(2000, seed=args.seed + 1)]
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeats": args.repeats,
+            "bedrock_latency_secs": args.bedrock_latency,
+            "model": with_model,
+        },
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_stub_companion(directory, args.bedrock_latency)
+        report["results"]["nlp"] = bench_nlp(texts, args.repeats, with_model)
+
+        for size in args.sizes:
+            path = os.path.join(directory, f"journal_{size}.db")
+            started = time.perf_counter()
+            populate(path, size, seed=args.seed)
+            print(f"Populated {size} entries in {time.perf_counter() - started:.1f}s")
+
+            results = bench_database(size, args.repeats)
+            results.update(bench_companion(max(3, args.repeats // 5)))
+            if with_model:
+                results.update(bench_save(texts, args.repeats))
+            report["results"][str(size)] = results
+            database.close_connection()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Wrote {args.output}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# this file generates seeded synthetic journals for the benchmarks
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List
+
+import database
+from nlp import SENTIMENT_VERSION, THEMES_VERSION, THEME_KEYWORDS, theme_mask
+
+FILLER_WORDS = [
+    "today", "felt", "really", "quiet", "long", "after", "because", "then", "morning", "evening",
+    "thought", "about", "little", "again", "still", "maybe", "tired", "better", "slowly", "ocean",
+]
+
+# Yield entry dicts with realistic lengths, theme mixes and timestamps spread back from now
+def generate_entries(count: int, seed: int = 42, days: int = 365 * 3) -> Iterator[Dict]:
+    rng = random.Random(seed)
+    themes = list(THEME_KEYWORDS)
+    now = datetime.now(timezone.utc)
+    step = timedelta(days=days) / max(count, 1)
+
+    for index in range(count):
+        # most entries are a short paragraph, a few run long
+        words = int(min(rng.lognormvariate(4.3, 0.6), 1500))
+        picked = rng.sample(themes, k=rng.choice([0, 1, 1, 2, 2, 3]))
+        tokens = [rng.choice(FILLER_WORDS) for _ in range(max(words, 5))]
+        for theme in picked:
+            for _ in range(rng.randint(1, 3)):
+                tokens[rng.randrange(len(tokens))] = rng.choice(THEME_KEYWORDS[theme])
+
+        score = max(-1.0, min(1.0, rng.gauss(0.1, 0.6)))
+        if abs(score) < 0.4:
+            score, label = 0.0, "neutral"
+        else:
+            label = "positive" if score > 0 else "negative"
+
+        created_at = now - timedelta(days=days) + step * index + timedelta(seconds=rng.randint(0, 3600))
+        yield {
+            "created_at": created_at.isoformat(),
+            "text": " ".join(tokens),
+            "sentiment_score": score,
+            "sentiment_label": label,
+            "themes": picked or ["General"],
+            "prompt": "What is one thing on your mind right now?",
+            "ai_reply": None,
+        }
+
+# Fill the database at path with count synthetic entries, bypassing NLP for speed
+def populate(path: str, count: int, seed: int = 42, chunk_size: int = 5000) -> None:
+    database.DB_PATH = path
+    connection = database.get_connection()
+    chunk: List[Dict] = []
+
+    def flush() -> None:
+        with database.transaction(connection):
+            for entry in chunk:
+                cursor = connection.execute(
+                    """
+                    INSERT INTO journal_entries (
+                        created_at, text, sentiment_score, sentiment_label, themes, theme_mask, ai_reply, prompt,
+                        sentiment_version, themes_version
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        entry["created_at"], entry["text"], entry["sentiment_score"], entry["sentiment_label"],
+                        ",".join(entry["themes"]), theme_mask(entry["themes"]), entry["ai_reply"], entry["prompt"],
+                        SENTIMENT_VERSION, THEMES_VERSION,
+                    ),
+                )
+                connection.executemany(
+                    "INSERT INTO entry_themes (entry_id, theme) VALUES (?, ?)",
+                    [(cursor.lastrowid, theme) for theme in entry["themes"]],
+                )
+        chunk.clear()
+
+    for entry in generate_entries(count, seed):
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    database.rebuild_daily_rollup()
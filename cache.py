@@ -0,0 +1,79 @@
+# this file caches expensive reads and companion calls until the database is written to
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from database import get_write_generation
+from metrics import count
+
+CACHE_MAX_ITEMS = 128
+
+# results for rolling windows like "last 7 days" also age out without a write
+CACHE_TTL_SECS = 300
+
+# Bounded LRU of computed results, each tagged with the write generation it was computed at
+class ResultCache:
+    def __init__(self, max_items: int = CACHE_MAX_ITEMS, ttl_secs: float = CACHE_TTL_SECS):
+        self.max_items = max_items
+        self.ttl_secs = ttl_secs
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Hashable, Tuple[Any, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Return the cached value for key, computing it if the database changed since it was stored
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        generation = get_write_generation()
+        now = time.monotonic()
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == generation and now - item[1] < self.ttl_secs:
+                self._items.move_to_end(key)
+                self.hits += 1
+                count("cache.hit", cache="result")
+                return item[2]
+            self.misses += 1
+        count("cache.miss", cache="result")
+
+        value = compute()
+
+        with self._lock:
+            self._items[key] = (generation, now, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return value
+
+    # Drop every cached value
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    # Hit and miss counters plus current size
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._items),
+                "max_items": self.max_items,
+            }
+
+# one cache per process, shared by every Streamlit session
+_result_cache = ResultCache()
+
+# Get a cached result for key, recomputing only after a database write or when it ages out
+def cached(key: Hashable, compute: Callable[[], Any]) -> Any:
+    return _result_cache.get_or_compute(key, compute)
+
+# Get the shared cache's hit and miss counters
+def cache_stats() -> Dict[str, float]:
+    return _result_cache.stats()
+
+# Empty the shared cache
+def clear_cache() -> None:
+    _result_cache.clear()
@@ -0,0 +1,158 @@
+# this file assembles companion prompts under an input token budget, older history shrunk to aggregate stats
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from analytics import DAY_MS, entry_arrays, sentiment_stats, theme_stats
+
+# rough English average for Claude's tokenizer, the logged actual counts show how far off it is
+CHARS_PER_TOKEN = 3.5
+
+# input token budgets for the user prompt of each call, the system prompt comes on top
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "350"))
+WEEKLY_CONTEXT_TOKENS = int(os.getenv("WEEKLY_CONTEXT_TOKENS", "900"))
+
+# share of each budget held for the history prefix, fixed so the prefix never depends on the per-call part
+HISTORY_SHARE = 0.4
+
+# how far back the aggregate history reaches and how many themes it names
+HISTORY_DAYS = 84
+HISTORY_THEMES = 5
+RELATED_ENTRIES = 3
+
+PROMPT_INSTRUCTIONS = (
+    "Suggest ONE gentle journaling prompt (<= 30 words) that helps the user reflect today. "
+    "Do not give advice or try to solve problems, just suggest a prompt."
+)
+WEEKLY_INSTRUCTIONS = (
+    "Provide a thoughtful weekly summary that reflects on the user's themes and emotional journey. "
+    "Keep it warm, encouraging, and validating, and under 3 short paragraphs."
+)
+
+# Rough input token count of a piece of text
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+# A user prompt as a prefix that only changes from day to day, followed by the part that changes per call
+class CompanionContext:
+    def __init__(self, prefix: str, suffix: str):
+        self.prefix = prefix
+        self.suffix = suffix
+
+    @property
+    def text(self) -> str:
+        return f"{self.prefix}\n\n{self.suffix}" if self.suffix else self.prefix
+
+    @property
+    def estimated_tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+# One line per entry, dates and mood only, the entry text stays out of the prompt
+def entry_line(entry: Dict) -> str:
+    return f"- {entry['created_at'][:10]}: mood {entry['sentiment_label']}, themes: {', '.join(entry['themes'])}"
+
+# Aggregate stats of the entries in [start, end): count, mood, main themes and the mood trend by week
+def history_lines(start: datetime, end: datetime) -> List[str]:
+    arrays = entry_arrays(start, end)
+    if not len(arrays):
+        return []
+
+    stats = sentiment_stats(arrays)
+    lines = [
+        f"{stats['count']} entries between {start.date()} and {(end - timedelta(days=1)).date()}, "
+        f"average mood {stats['avg_sentiment']:+.2f} (-1 heavy to +1 bright)."
+    ]
+    themes = theme_stats(arrays)[:HISTORY_THEMES]
+    if themes:
+        lines.append("Main themes: " + ", ".join(
+            f"{stat['theme']} ({stat['count']}, mood {stat['avg_sentiment']:+.2f})" for stat in themes
+        ) + ".")
+
+    # weeks counted back from end, so every bucket is a whole week
+    week = ((_epoch_ms(end) - 1 - arrays.ts) // (7 * DAY_MS)).astype(np.int64)
+    counts = np.bincount(week)
+    sums = np.bincount(week, weights=arrays.score)
+    means = [f"{sums[w] / counts[w]:+.2f}" if counts[w] else "n/a" for w in range(len(counts) - 1, -1, -1)]
+    if len(means) > 1:
+        lines.append("Mood by week, oldest first: " + ", ".join(means) + ".")
+    return lines
+
+# Milliseconds since the epoch of an aware datetime
+def _epoch_ms(moment: datetime) -> int:
+    return int(moment.timestamp() * 1000)
+
+# UTC midnight of the day an entry was written, history ends there so the prefix holds all day
+def _day_start(created_at: str) -> datetime:
+    moment = datetime.fromisoformat(created_at).astimezone(timezone.utc)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+# Take lines in order while they fit the remaining budget
+def _fit(lines: Sequence[str], budget: int) -> List[str]:
+    kept = []
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            break
+        kept.append(line)
+        budget -= cost
+    return kept
+
+# Prefix with the instructions and the history before the given day, within the history share of budget
+def _history_prefix(instructions: str, title: str, history_end: datetime, budget: int) -> str:
+    lines = _fit(history_lines(history_end - timedelta(days=HISTORY_DAYS), history_end),
+                 int(budget * HISTORY_SHARE) - estimate_tokens(instructions) - estimate_tokens(title))
+    return instructions + (f"\n\n{title}\n" + "\n".join(lines) if lines else "")
+
+# Context for the daily prompt: history stats, then the newest entries, then related older entries
+def build_prompt_context(recent_entries: List[Dict], budget: int = PROMPT_CONTEXT_TOKENS,
+                         related: Optional[List[Dict]] = None) -> CompanionContext:
+    if not recent_entries:
+        return CompanionContext(
+            PROMPT_INSTRUCTIONS, "The user is starting journaling and may have blank page anxiety."
+        )
+
+    # the prefix is settled first from the day alone, only the per-call suffix is trimmed to what is left
+    prefix = _history_prefix(
+        PROMPT_INSTRUCTIONS, "Longer-term patterns:", _day_start(recent_entries[0]["created_at"]), budget
+    )
+    remaining = budget - estimate_tokens(prefix)
+
+    # the newest entries matter most, so they claim the suffix budget first and related entries get what is left
+    lines = [entry_line(entry) for entry in reversed(recent_entries)]
+    recent = list(reversed(_fit(lines, remaining - estimate_tokens("Recent entries:\n"))))
+    suffix = "Recent entries:\n" + "\n".join(recent)
+
+    if related is None:
+        from embedding_index import related_entries
+
+        ids = [entry["id"] for entry in recent_entries if "id" in entry]
+        related = related_entries(ids[-RELATED_ENTRIES:], k=RELATED_ENTRIES, exclude=ids)
+    related_lines = _fit([entry_line(entry) for entry in related],
+                         remaining - estimate_tokens(suffix + "\nRelated earlier entries:\n"))
+    if related_lines:
+        suffix += "\nRelated earlier entries:\n" + "\n".join(related_lines)
+    return CompanionContext(prefix, suffix)
+
+# Context for the weekly summary: history stats, then the week's stats and as many of its entries as fit
+def build_weekly_context(week_entries: List[Dict], budget: int = WEEKLY_CONTEXT_TOKENS) -> CompanionContext:
+    dates = sorted(entry["created_at"] for entry in week_entries)
+    week_start = _day_start(dates[0])
+    week_end = _day_start(dates[-1]) + timedelta(days=1)
+
+    prefix = _history_prefix(WEEKLY_INSTRUCTIONS, "Earlier weeks:", week_start, budget)
+    remaining = budget - estimate_tokens(prefix)
+
+    # the week's own aggregates always go in, they cover entries whose lines may not fit
+    week_stats = history_lines(week_start, week_end)
+    suffix = "This week:\n" + "\n".join(week_stats)
+    lines = [entry_line(entry) for entry in sorted(week_entries, key=lambda entry: entry["created_at"])]
+    # room is kept for the headings and the note on skipped entries, the newest lines are kept first
+    headings = estimate_tokens("\n(9999 earlier entries left out)\nEntries:\n")
+    kept = list(reversed(_fit(lines[::-1], remaining - estimate_tokens(suffix) - headings)))
+    if kept:
+        skipped = len(lines) - len(kept)
+        suffix += (f"\n({skipped} earlier entries left out)" if skipped else "") + "\nEntries:\n" + "\n".join(kept)
+    return CompanionContext(prefix, suffix)
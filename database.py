@@ -1,16 +1,83 @@
 # this file is meant to handle database operations for journal entries
+import hashlib
+import html
+import json
+import os
+import queue
 import sqlite3
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta, timezone
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Dict, Optional, Sequence, Tuple, Union
+from datetime import date, datetime, timedelta, timezone
 
-from nlp import compute_sentiment, extract_themes
+from metrics import count, span, timed
+from nlp import (
+    EMBEDDING_VERSION,
+    SENTIMENT_VERSION,
+    THEME_BITS,
+    THEMES_VERSION,
+    compute_sentiment_embeddings_batch,
+    extract_themes,
+    theme_filter_mask,
+    theme_mask,
+)
+from warmup import wait_for_warmup
 
 DB_PATH = "journal_entries.db"
 
-# Get or create the database connection and ensure the table exists
-def get_connection() -> sqlite3.Connection:
-    connection = sqlite3.connect(DB_PATH)
+# the writer thread commits everything already queued as one transaction, waiting up to this
+# long for more; with 0 a lone save commits at once and batches form while a commit is running
+WRITE_BATCH_WINDOW_SECS = float(os.getenv("WRITE_BATCH_WINDOW_SECS", "0"))
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "256"))
+
+# per-connection tuning, applied once when a thread opens its connection
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+)
+
+# recompute every day's sentiment rollup from journal_entries
+ROLLUP_REBUILD_SQL = """
+    DELETE FROM daily_rollup;
+
+    INSERT INTO daily_rollup (day, sentiment_sum, entry_count, sentiment_min, sentiment_max)
+    SELECT substr(created_at, 1, 10), SUM(sentiment_score), COUNT(*), MIN(sentiment_score), MAX(sentiment_score)
+    FROM journal_entries
+    GROUP BY substr(created_at, 1, 10);
+"""
+
+# Add theme_mask and derive it from entry_themes, plus a covering index for analytics loads
+def _add_theme_mask(connection: sqlite3.Connection) -> None:
+    connection.execute("ALTER TABLE journal_entries ADD COLUMN theme_mask INTEGER NOT NULL DEFAULT 0")
+    cases = " ".join(f"WHEN ? THEN {bit}" for bit in THEME_BITS.values())
     connection.execute(
+        f"""
+        UPDATE journal_entries SET theme_mask = (
+            SELECT COALESCE(SUM(CASE t.theme {cases} ELSE 0 END), 0)
+            FROM entry_themes t
+            WHERE t.entry_id = journal_entries.id
+        )
+        """,
+        list(THEME_BITS),
+    )
+    connection.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_journal_entries_analytics
+            ON journal_entries (created_at, sentiment_score, theme_mask)
+        """
+    )
+
+# versioned schema changes, applied in order and tracked with PRAGMA user_version
+MIGRATIONS: List[Tuple[int, Union[str, Callable[[sqlite3.Connection], None]]]] = [
+    (
+        1,
         """
         CREATE TABLE IF NOT EXISTS journal_entries (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -21,58 +88,681 @@ def get_connection() -> sqlite3.Connection:
             themes TEXT NOT NULL,
             ai_reply TEXT,
             prompt TEXT
+        );
+        """,
+    ),
+    (
+        2,
+        """
+        CREATE INDEX IF NOT EXISTS idx_journal_entries_created_at
+            ON journal_entries (created_at);
+        """,
+    ),
+    (
+        3,
+        """
+        CREATE TABLE IF NOT EXISTS entry_themes (
+            entry_id INTEGER NOT NULL REFERENCES journal_entries (id) ON DELETE CASCADE,
+            theme TEXT NOT NULL,
+            PRIMARY KEY (entry_id, theme)
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_entry_themes_theme
+            ON entry_themes (theme, entry_id);
+
+        WITH RECURSIVE split (entry_id, theme, rest) AS (
+            SELECT id, '', themes || ',' FROM journal_entries
+            UNION ALL
+            SELECT entry_id, substr(rest, 1, instr(rest, ',') - 1), substr(rest, instr(rest, ',') + 1)
+            FROM split
+            WHERE rest <> ''
         )
+        INSERT OR IGNORE INTO entry_themes (entry_id, theme)
+        SELECT entry_id, trim(theme) FROM split WHERE trim(theme) <> '';
+        """,
+    ),
+    (
+        4,
         """
-    )
-    
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            day TEXT PRIMARY KEY,
+            sentiment_sum REAL NOT NULL,
+            entry_count INTEGER NOT NULL,
+            sentiment_min REAL NOT NULL,
+            sentiment_max REAL NOT NULL
+        ) WITHOUT ROWID;
+        """
+        + ROLLUP_REBUILD_SQL,
+    ),
+    (
+        5,
+        """
+        ALTER TABLE journal_entries ADD COLUMN sentiment_version TEXT;
+        ALTER TABLE journal_entries ADD COLUMN themes_version TEXT;
+
+        CREATE TABLE IF NOT EXISTS reprocess_state (
+            name TEXT PRIMARY KEY,
+            target TEXT NOT NULL,
+            last_id INTEGER NOT NULL,
+            rows_done INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """,
+    ),
+    (
+        6,
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5 (
+            text, prompt, ai_reply,
+            content = 'journal_entries',
+            content_rowid = 'id',
+            tokenize = 'porter unicode61'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS journal_entries_fts_insert AFTER INSERT ON journal_entries BEGIN
+            INSERT INTO entries_fts (rowid, text, prompt, ai_reply)
+            VALUES (new.id, new.text, new.prompt, new.ai_reply);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS journal_entries_fts_delete AFTER DELETE ON journal_entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, text, prompt, ai_reply)
+            VALUES ('delete', old.id, old.text, old.prompt, old.ai_reply);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS journal_entries_fts_update AFTER UPDATE OF text, prompt, ai_reply ON journal_entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, text, prompt, ai_reply)
+            VALUES ('delete', old.id, old.text, old.prompt, old.ai_reply);
+            INSERT INTO entries_fts (rowid, text, prompt, ai_reply)
+            VALUES (new.id, new.text, new.prompt, new.ai_reply);
+        END;
+
+        INSERT INTO entries_fts (entries_fts) VALUES ('rebuild');
+        """,
+    ),
+    (
+        7,
+        """
+        CREATE INDEX IF NOT EXISTS idx_journal_entries_headers
+            ON journal_entries (created_at, sentiment_label, themes);
+
+        DROP INDEX IF EXISTS idx_journal_entries_created_at;
+        """,
+    ),
+    (
+        8,
+        """
+        CREATE TABLE IF NOT EXISTS weekly_summaries (
+            iso_week TEXT PRIMARY KEY,
+            week_start TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            entry_count INTEGER NOT NULL,
+            rule_summary TEXT NOT NULL,
+            companion_summary TEXT,
+            generated_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """,
+    ),
+    (
+        9,
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            entry_id INTEGER REFERENCES journal_entries (id) ON DELETE CASCADE,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, run_after);
+        CREATE INDEX IF NOT EXISTS idx_jobs_entry ON jobs (entry_id);
+        """,
+    ),
+    (10, _add_theme_mask),
+    (
+        11,
+        # rows are replaced, never updated, so a growing seq tells readers which vectors are new
+        """
+        CREATE TABLE IF NOT EXISTS entry_embeddings (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry_id INTEGER NOT NULL UNIQUE REFERENCES journal_entries (id) ON DELETE CASCADE,
+            version TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_entry_embeddings_version ON entry_embeddings (version);
+        """,
+    ),
+]
+
+# columns load_entries_frame can return, themes expands to one boolean column per theme
+FRAME_COLUMNS = ("id", "created_at", "text", "sentiment_score", "sentiment_label", "themes", "ai_reply", "prompt")
+FRAME_DEFAULT_COLUMNS = ("created_at", "sentiment_score", "sentiment_label")
+FRAME_FETCH_SIZE = 5000
+SENTIMENT_LABELS = ("negative", "neutral", "positive")
+
+# how each frame column is selected, timestamps as epoch milliseconds and labels as category codes
+_FRAME_SQL = {
+    "id": "id",
+    "created_at": "CAST(round((julianday(created_at) - 2440587.5) * 86400000) AS INTEGER)",
+    "text": "text",
+    "sentiment_score": "sentiment_score",
+    "sentiment_label": "CASE sentiment_label "
+    + " ".join(f"WHEN '{label}' THEN {code}" for code, label in enumerate(SENTIMENT_LABELS))
+    + " ELSE -1 END",
+    "ai_reply": "ai_reply",
+    "prompt": "prompt",
+}
+_FRAME_BUFFERS = {"id": "q", "created_at": "q", "sentiment_score": "f", "sentiment_label": "b"}
+
+# control characters FTS5 wraps around matches, swapped for <mark> after escaping
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+_local = threading.local()
+_generation_lock = threading.Lock()
+_generation_connection: Optional[sqlite3.Connection] = None
+_generation_path: Optional[str] = None
+_migrate_lock = threading.Lock()
+_migrated_path: Optional[str] = None
+
+# Run a block inside an explicit write transaction, rolling back on error
+@contextmanager
+def transaction(connection: sqlite3.Connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    else:
+        connection.execute("COMMIT")
+
+# Split a SQL script into complete statements, keeping trigger bodies intact
+def _split_statements(script: str) -> List[str]:
+    statements: List[str] = []
+    pending = ""
+    for piece in script.split(";"):
+        pending += piece + ";"
+        if sqlite3.complete_statement(pending):
+            if pending.strip(" \n\t;"):
+                statements.append(pending.strip())
+            pending = ""
+    return statements
+
+# Apply any migrations newer than the database's user_version
+def migrate(connection: sqlite3.Connection) -> int:
+    current = connection.execute("PRAGMA user_version").fetchone()[0]
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with transaction(connection):
+            # another process may have migrated since the read above, the write lock makes this read final
+            current = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version <= current:
+                continue
+            if callable(step):
+                step(connection)
+            else:
+                for statement in _split_statements(step):
+                    connection.execute(statement)
+            connection.execute(f"PRAGMA user_version = {version}")
+        current = version
+    return current
+
+# Open a tuned connection in autocommit mode, transactions are managed explicitly
+def _open_connection(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, isolation_level=None)
+    for pragma in PRAGMAS:
+        connection.execute(pragma)
     return connection
 
-# Save a new journal entry to the database
-def save_entry(text: str, prompt: str, ai_reply: Optional[str] = None) -> None:
-    sentiment_score, sentiment_label = compute_sentiment(text)
+# Make sure the schema is up to date, only once per process and database path
+def init_db() -> None:
+    global _migrated_path
+    if _migrated_path == DB_PATH:
+        return
+    with _migrate_lock:
+        if _migrated_path == DB_PATH:
+            return
+        connection = _open_connection(DB_PATH)
+        try:
+            migrate(connection)
+        finally:
+            connection.close()
+        _migrated_path = DB_PATH
+
+# Get this thread's database connection, opening it on first use
+def get_connection() -> sqlite3.Connection:
+    connection = getattr(_local, "connection", None)
+    if connection is not None and getattr(_local, "path", None) == DB_PATH:
+        return connection
+    if connection is not None:
+        connection.close()
+
+    init_db()
+    connection = _open_connection(DB_PATH)
+    _local.connection = connection
+    _local.path = DB_PATH
+    return connection
+
+# Close this thread's connection, if it has one
+def close_connection() -> None:
+    connection = getattr(_local, "connection", None)
+    if connection is not None:
+        connection.close()
+        _local.connection = None
+
+# Cheap counter that changes whenever any connection commits a write to the database
+def get_write_generation() -> Tuple[str, int]:
+    global _generation_connection, _generation_path
+    with _generation_lock:
+        # PRAGMA data_version only moves for commits made by other connections,
+        # so this dedicated connection must never write
+        if _generation_connection is None or _generation_path != DB_PATH:
+            if _generation_connection is not None:
+                _generation_connection.close()
+            init_db()
+            _generation_connection = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+            _generation_path = DB_PATH
+        version = _generation_connection.execute("PRAGMA data_version").fetchone()[0]
+    return _generation_path, version
+
+# Owns the process's write connection and commits queued writes in small group transactions
+class WriteQueue:
+    def __init__(self, window_secs: float = WRITE_BATCH_WINDOW_SECS, max_batch: int = WRITE_BATCH_MAX):
+        self.window_secs = window_secs
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue: "queue.Queue[Optional[Tuple[Callable[[sqlite3.Connection], Any], Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._path: Optional[str] = None
+
+    # Queue write(connection) for the writer thread, the future resolves once its batch commits
+    def submit(self, write: Callable[[sqlite3.Connection], Any]) -> Future:
+        future: Future = Future()
+        # a write issued from inside another write would wait on itself, run it in place instead
+        if threading.current_thread() is self._thread:
+            future.set_result(write(self._connection))
+            return future
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+            self._queue.put((write, future))
+        return future
+
+    # Collect everything already queued, plus whatever arrives within the batch window
+    def _next_batch(self) -> List[Tuple[Callable[[sqlite3.Connection], Any], Future]]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.window_secs
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    # The write connection, reopened if DB_PATH was pointed somewhere else
+    def _writer_connection(self) -> sqlite3.Connection:
+        if self._connection is None or self._path != DB_PATH:
+            if self._connection is not None:
+                self._connection.close()
+            init_db()
+            self._connection = _open_connection(DB_PATH)
+            self._path = DB_PATH
+        return self._connection
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                break
+            batch = [(write, future) for write, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._commit_batch(batch)
+        # the connection belongs to this thread, so it is closed here rather than in close()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    # Run each write under its own savepoint so one failure only undoes that write
+    def _commit_batch(self, batch: List[Tuple[Callable[[sqlite3.Connection], Any], Future]]) -> None:
+        outcomes: List[Tuple[bool, Any]] = []
+        try:
+            connection = self._writer_connection()
+            with span("db.write_batch", size=len(batch)), transaction(connection):
+                for write, _ in batch:
+                    connection.execute("SAVEPOINT queued_write")
+                    try:
+                        outcomes.append((True, write(connection)))
+                    except Exception as e:
+                        connection.execute("ROLLBACK TO queued_write")
+                        outcomes.append((False, e))
+                    connection.execute("RELEASE queued_write")
+        except Exception as e:
+            # the transaction itself failed, nothing in the batch was committed
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        count("db.queued_writes", len(batch))
+        for (ok, value), (_, future) in zip(outcomes, batch):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    # Finish queued writes and stop the thread, a later submit starts a new one
+    def close(self) -> None:
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(None)
+            thread.join()
+            self._thread = None
+
+    # Batches committed and writes per batch so far
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "writes": self.writes,
+            "writes_per_batch": self.writes / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+# one writer per process, shared by every Streamlit session
+_write_queue = WriteQueue()
+
+# Queue a write for the writer thread, write receives the write connection inside a transaction
+def submit_write(write: Callable[[sqlite3.Connection], Any]) -> Future:
+    return _write_queue.submit(write)
+
+# Queue a write and wait for its batch to commit, returning what write returned
+def run_write(write: Callable[[sqlite3.Connection], Any]) -> Any:
+    return _write_queue.submit(write).result()
+
+# Stop the writer thread after it drains the queue
+def close_writer() -> None:
+    _write_queue.close()
+
+# Group commit counters for the writer thread
+def writer_stats() -> Dict[str, float]:
+    return _write_queue.stats()
+
+# Insert one analysed entry, call inside a transaction, returns its id
+def _insert_entry(connection: sqlite3.Connection, created_at: str, text: str, prompt: str,
+                  ai_reply: Optional[str], sentiment_score: float, sentiment_label: str, themes: List[str],
+                  embedding=None) -> int:
+    cursor = connection.execute(
+        """
+        INSERT INTO journal_entries (
+            created_at, text, sentiment_score, sentiment_label, themes, theme_mask, ai_reply, prompt,
+            sentiment_version, themes_version
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            created_at, text, sentiment_score, sentiment_label, ",".join(themes), theme_mask(themes), ai_reply,
+            prompt, SENTIMENT_VERSION, THEMES_VERSION,
+        ),
+    )
+    _write_themes(connection, cursor.lastrowid, themes)
+    _write_embeddings(connection, [(cursor.lastrowid, embedding)])
+    _add_to_rollup(connection, [(created_at[:10], sentiment_score, 1, sentiment_score, sentiment_score)])
+    return cursor.lastrowid
+
+# Queue a background job, call inside a transaction so it commits together with the data it refers to
+def enqueue_job(connection: sqlite3.Connection, kind: str, entry_id: Optional[int] = None,
+                payload: Optional[Dict] = None, delay_secs: float = 0.0) -> int:
+    now = datetime.now(timezone.utc).isoformat()
+    cursor = connection.execute(
+        """
+        INSERT INTO jobs (kind, entry_id, payload, run_after, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (kind, entry_id, json.dumps(payload or {}), time.time() + delay_secs, now, now),
+    )
+    return cursor.lastrowid
+
+# Save a new journal entry to the database, returns its id
+# with request_reply a companion reply job is queued in the same transaction, see jobs.py
+@timed("db.save_entry")
+def save_entry(text: str, prompt: str, ai_reply: Optional[str] = None, request_reply: bool = False) -> int:
+    # let a running warmup finish loading the model instead of loading a second copy
+    with span("warmup.wait"):
+        wait_for_warmup()
+    scores, embeddings = compute_sentiment_embeddings_batch([text])
+    sentiment_score, sentiment_label = scores[0]
     themes = extract_themes(text)
     created_at = datetime.now(timezone.utc).isoformat()
 
-    connection = get_connection()
-    connection.execute(
+    def write(connection: sqlite3.Connection) -> int:
+        entry_id = _insert_entry(
+            connection, created_at, text, prompt, ai_reply, sentiment_score, sentiment_label, themes, embeddings[0]
+        )
+        if request_reply and ai_reply is None:
+            enqueue_job(connection, "companion_reply", entry_id)
+        return entry_id
+
+    # inference ran on the caller's thread, only the insert waits for the writer
+    with span("db.write", op="save_entry"):
+        return run_write(write)
+
+# Fill in the companion reply of an entry that does not have one yet, returns whether it was set
+def save_entry_reply(entry_id: int, ai_reply: str) -> bool:
+    return run_write(lambda connection: set_entry_reply(connection, entry_id, ai_reply))
+
+# Fill in the reply of an entry that has none yet, call inside a transaction, False if it already had one
+def set_entry_reply(connection: sqlite3.Connection, entry_id: int, ai_reply: str) -> bool:
+    return connection.execute(
+        "UPDATE journal_entries SET ai_reply = ? WHERE id = ? AND ai_reply IS NULL", (ai_reply, entry_id)
+    ).rowcount > 0
+
+# Insert already analysed entries in one go, call inside a transaction, returns the new ids
+def insert_entries(connection: sqlite3.Connection, entries: List[Dict]) -> List[int]:
+    # ids are assigned up front so theme rows can be written with executemany too, the surrounding
+    # BEGIN IMMEDIATE keeps them stable and starting past sqlite_sequence never reuses a deleted id
+    base = connection.execute(
+        """
+        SELECT MAX(
+            COALESCE((SELECT MAX(id) FROM journal_entries), 0),
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'journal_entries'), 0)
+        )
         """
-        INSERT INTO journal_entries (created_at, text, sentiment_score, sentiment_label, themes, ai_reply, prompt)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ).fetchone()[0]
+    ids = list(range(base + 1, base + 1 + len(entries)))
+    connection.executemany(
+        """
+        INSERT INTO journal_entries (
+            id, created_at, text, sentiment_score, sentiment_label, themes, theme_mask, ai_reply, prompt,
+            sentiment_version, themes_version
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
-        (created_at, text, sentiment_score, sentiment_label, ",".join(themes), ai_reply, prompt),
+        [
+            (
+                entry_id, entry["created_at"], entry["text"], entry["sentiment_score"], entry["sentiment_label"],
+                ",".join(entry["themes"]), theme_mask(entry["themes"]), entry.get("ai_reply"), entry.get("prompt"),
+                SENTIMENT_VERSION, THEMES_VERSION,
+            )
+            for entry_id, entry in zip(ids, entries)
+        ],
+    )
+    connection.executemany(
+        "INSERT OR IGNORE INTO entry_themes (entry_id, theme) VALUES (?, ?)",
+        [(entry_id, theme) for entry_id, entry in zip(ids, entries) for theme in entry["themes"]],
     )
-    connection.commit()
-    connection.close()
+    _write_embeddings(connection, [(entry_id, entry.get("embedding")) for entry_id, entry in zip(ids, entries)])
 
-# Load journal entries from the database, optionally filtering by recent days
-def load_entries(days: Optional[int] = None) -> List[Dict]:
-    connection = get_connection()
-    cursor = connection.cursor()
+    partials: Dict[str, List[float]] = {}
+    for entry in entries:
+        score = entry["sentiment_score"]
+        day = partials.setdefault(entry["created_at"][:10], [0.0, 0, score, score])
+        day[0] += score
+        day[1] += 1
+        day[2] = min(day[2], score)
+        day[3] = max(day[3], score)
+    _add_to_rollup(connection, [(day, *values) for day, values in partials.items()])
+    return ids
 
-    if days is None:
-        cursor.execute(
-            """
-            SELECT id, created_at, text, sentiment_score, sentiment_label, themes, ai_reply, prompt
-            FROM journal_entries
-            ORDER BY created_at
-            """
-        )
-        rows = cursor.fetchall()
+# Replace the normalized theme rows for an entry
+def _write_themes(connection: sqlite3.Connection, entry_id: int, themes: List[str]) -> None:
+    connection.execute("DELETE FROM entry_themes WHERE entry_id = ?", (entry_id,))
+    connection.executemany(
+        "INSERT OR IGNORE INTO entry_themes (entry_id, theme) VALUES (?, ?)",
+        [(entry_id, theme) for theme in themes],
+    )
 
-    else:
-        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-        cursor.execute(
+# Store (entry id, embedding) pairs as float16 blobs, replacing older vectors, None embeddings are skipped
+def _write_embeddings(connection: sqlite3.Connection, embeddings: List[Tuple[int, Any]]) -> None:
+    connection.executemany(
+        "INSERT OR REPLACE INTO entry_embeddings (entry_id, version, dim, vector) VALUES (?, ?, ?, ?)",
+        [
+            (entry_id, EMBEDDING_VERSION, len(embedding), embedding.astype("float16").tobytes())
+            for entry_id, embedding in embeddings
+            if embedding is not None
+        ],
+    )
+
+# Fold (day, sum, count, min, max) partials into the daily sentiment rollup
+def _add_to_rollup(connection: sqlite3.Connection, partials: List[Tuple[str, float, int, float, float]]) -> None:
+    connection.executemany(
+        """
+        INSERT INTO daily_rollup (day, sentiment_sum, entry_count, sentiment_min, sentiment_max)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            sentiment_sum = sentiment_sum + excluded.sentiment_sum,
+            entry_count = entry_count + excluded.entry_count,
+            sentiment_min = MIN(sentiment_min, excluded.sentiment_min),
+            sentiment_max = MAX(sentiment_max, excluded.sentiment_max)
+        """,
+        partials,
+    )
+
+# Recompute the rollup rows for specific UTC days, e.g. after scores were rewritten
+def refresh_rollup_days(connection: sqlite3.Connection, days: List[str]) -> None:
+    for day in sorted(set(days)):
+        next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+        connection.execute("DELETE FROM daily_rollup WHERE day = ?", (day,))
+        connection.execute(
             """
-            SELECT id, created_at, text, sentiment_score, sentiment_label, themes, ai_reply, prompt
+            INSERT INTO daily_rollup (day, sentiment_sum, entry_count, sentiment_min, sentiment_max)
+            SELECT ?, SUM(sentiment_score), COUNT(*), MIN(sentiment_score), MAX(sentiment_score)
             FROM journal_entries
-            WHERE created_at >= ?
-            ORDER BY created_at
+            WHERE created_at >= ? AND created_at < ?
+            HAVING COUNT(*) > 0
             """,
-            (cutoff,),
+            (day, day, next_day),
         )
-        rows = cursor.fetchall()
-    
-    connection.close()
+
+# Rewrite the derived analysis of an existing entry, call inside a transaction
+def update_entry_analysis(connection: sqlite3.Connection, entry_id: int, sentiment_score: float,
+                          sentiment_label: str, themes: List[str], embedding=None) -> None:
+    connection.execute(
+        """
+        UPDATE journal_entries
+        SET sentiment_score = ?, sentiment_label = ?, themes = ?, theme_mask = ?,
+            sentiment_version = ?, themes_version = ?
+        WHERE id = ?
+        """,
+        (
+            sentiment_score, sentiment_label, ",".join(themes), theme_mask(themes),
+            SENTIMENT_VERSION, THEMES_VERSION, entry_id,
+        ),
+    )
+    _write_themes(connection, entry_id, themes)
+    _write_embeddings(connection, [(entry_id, embedding)])
+
+# Rebuild the daily sentiment rollup from scratch, returns the number of days
+@timed("db.rebuild_daily_rollup")
+def rebuild_daily_rollup() -> int:
+    connection = get_connection()
+    with transaction(connection):
+        for statement in _split_statements(ROLLUP_REBUILD_SQL):
+            connection.execute(statement)
+    return connection.execute("SELECT COUNT(*) FROM daily_rollup").fetchone()[0]
+
+# Convert a date range into ISO bounds on created_at, start inclusive and end exclusive
+def _range_clause(start: Optional[datetime], end: Optional[datetime], column: str = "created_at") -> Tuple[str, List[str]]:
+    clauses: List[str] = []
+    params: List[str] = []
+    if start is not None:
+        clauses.append(f"{column} >= ?")
+        params.append(_iso_utc(start))
+    if end is not None:
+        clauses.append(f"{column} < ?")
+        params.append(_iso_utc(end))
+    return (" AND ".join(clauses) or "1"), params
+
+# SQL condition on the theme_mask bits, matching entries with any, all or none of the themes
+def theme_mask_clause(themes: Sequence[str], match: str = "any", column: str = "theme_mask") -> Tuple[str, List[int]]:
+    if match not in ("any", "all", "none"):
+        raise ValueError(f"match must be any, all or none, not {match!r}")
+    # General stands for entries without any taxonomy theme, a zero mask
+    mask, general = theme_filter_mask(themes)
+    if match == "any":
+        return (f"(({column} & ?) != 0 OR {column} = 0)" if general else f"({column} & ?) != 0"), [mask]
+    if match == "all":
+        # a General entry has no other theme, so it can only match General on its own
+        if general:
+            return (f"{column} = 0" if not mask else "0"), []
+        return f"({column} & ?) = ?", [mask, mask]
+    return (f"({column} & ?) = 0 AND {column} != 0" if general else f"({column} & ?) = 0"), [mask]
+
+# Format a date as a UTC day key, datetimes are converted to UTC first
+def _day_key(value: date) -> str:
+    if isinstance(value, datetime):
+        return _iso_utc(value)[:10]
+    return value.isoformat()
+
+# Format a datetime the way created_at is stored, naive values are taken as UTC
+def _iso_utc(moment: datetime) -> str:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+# Load journal entries from the database, optionally filtering by recent days or a date range and by theme
+@timed("db.load_entries")
+def load_entries(days: Optional[int] = None, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, themes: Optional[Sequence[str]] = None,
+                 match: str = "any") -> List[Dict]:
+    if days is not None:
+        start = datetime.now(timezone.utc) - timedelta(days=days)
+    where, params = _range_clause(start, end)
+    if themes:
+        theme_where, theme_params = theme_mask_clause(themes, match)
+        where, params = f"{where} AND {theme_where}", params + theme_params
+
+    rows = get_connection().execute(
+        f"""
+        SELECT id, created_at, text, sentiment_score, sentiment_label, themes, ai_reply, prompt
+        FROM journal_entries
+        WHERE {where}
+        ORDER BY created_at
+        """,
+        params,
+    ).fetchall()
 
     entries: List[Dict] = []
     for rowId, created_at, text, score, label, theme_str, ai_reply, prompt in rows:
@@ -88,4 +778,453 @@ def load_entries(days: Optional[int] = None) -> List[Dict]:
                 "prompt": prompt,
             }
         )
-    return entries
\ No newline at end of file
+    return entries
+
+# Stream entries oldest first without holding them all in memory, e.g. for export
+def iter_entries(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 fetch_size: int = FRAME_FETCH_SIZE) -> Iterator[Dict]:
+    where, params = _range_clause(start, end)
+    cursor = get_connection().execute(
+        f"""
+        SELECT id, created_at, text, sentiment_score, sentiment_label, themes, ai_reply, prompt
+        FROM journal_entries
+        WHERE {where}
+        ORDER BY created_at, id
+        """,
+        params,
+    )
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for entry_id, created_at, text, score, label, theme_str, ai_reply, prompt in rows:
+            yield {
+                "id": entry_id,
+                "created_at": created_at,
+                "text": text,
+                "sentiment_score": score,
+                "sentiment_label": label,
+                "themes": theme_str.split(",") if theme_str else [],
+                "ai_reply": ai_reply,
+                "prompt": prompt,
+            }
+
+# Load one page of entry headers, newest first, continuing after the (created_at, id) cursor
+@timed("db.list_entry_headers")
+def list_entry_headers(limit: int = 20, after: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+    # the headers index covers these columns, so bodies are never read
+    if after is None:
+        rows = get_connection().execute(
+            """
+            SELECT id, created_at, sentiment_label, themes
+            FROM journal_entries
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+            """,
+            (limit + 1,),
+        ).fetchall()
+    else:
+        rows = get_connection().execute(
+            """
+            SELECT id, created_at, sentiment_label, themes
+            FROM journal_entries
+            WHERE (created_at, id) < (?, ?)
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+            """,
+            (after[0], after[1], limit + 1),
+        ).fetchall()
+
+    headers = [
+        {
+            "id": entry_id,
+            "created_at": created_at,
+            "sentiment_label": label,
+            "themes": theme_str.split(",") if theme_str else [],
+        }
+        for entry_id, created_at, label, theme_str in rows[:limit]
+    ]
+    next_cursor = (headers[-1]["created_at"], headers[-1]["id"]) if len(rows) > limit else None
+    return headers, next_cursor
+
+# Load a single entry with its full text, prompt and companion reply
+@timed("db.get_entry")
+def get_entry(entry_id: int) -> Optional[Dict]:
+    row = get_connection().execute(
+        """
+        SELECT id, created_at, text, sentiment_score, sentiment_label, themes, ai_reply, prompt
+        FROM journal_entries
+        WHERE id = ?
+        """,
+        (entry_id,),
+    ).fetchone()
+    if row is None:
+        return None
+
+    rowId, created_at, text, score, label, theme_str, ai_reply, prompt = row
+    return {
+        "id": rowId,
+        "created_at": created_at,
+        "text": text,
+        "sentiment_score": score,
+        "sentiment_label": label,
+        "themes": theme_str.split(",") if theme_str else [],
+        "ai_reply": ai_reply,
+        "prompt": prompt,
+    }
+
+# Count entries per theme in a date range, most frequent first
+@timed("db.load_theme_counts")
+def load_theme_counts(start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+    where, params = _range_clause(start, end, "e.created_at")
+    rows = get_connection().execute(
+        f"""
+        SELECT t.theme, COUNT(*) AS count
+        FROM entry_themes t
+        JOIN journal_entries e ON e.id = t.entry_id
+        WHERE {where}
+        GROUP BY t.theme
+        ORDER BY count DESC, t.theme
+        """,
+        params,
+    ).fetchall()
+    return [{"theme": theme, "count": count} for theme, count in rows]
+
+# Average sentiment per theme in a date range, most frequent first
+@timed("db.load_theme_sentiment")
+def load_theme_sentiment(start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+    where, params = _range_clause(start, end, "e.created_at")
+    rows = get_connection().execute(
+        f"""
+        SELECT t.theme, COUNT(*) AS count, AVG(e.sentiment_score) AS avg_sentiment
+        FROM entry_themes t
+        JOIN journal_entries e ON e.id = t.entry_id
+        WHERE {where}
+        GROUP BY t.theme
+        ORDER BY count DESC, t.theme
+        """,
+        params,
+    ).fetchall()
+    return [
+        {"theme": theme, "count": count, "avg_sentiment": avg_sentiment}
+        for theme, count, avg_sentiment in rows
+    ]
+
+# Count entries per UTC day and theme in a date range
+@timed("db.load_daily_theme_counts")
+def load_daily_theme_counts(start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+    where, params = _range_clause(start, end, "e.created_at")
+    rows = get_connection().execute(
+        f"""
+        SELECT substr(e.created_at, 1, 10) AS day, t.theme, COUNT(*) AS count
+        FROM entry_themes t
+        JOIN journal_entries e ON e.id = t.entry_id
+        WHERE {where}
+        GROUP BY day, t.theme
+        ORDER BY day, t.theme
+        """,
+        params,
+    ).fetchall()
+    return [{"day": day, "theme": theme, "count": count} for day, theme, count in rows]
+
+# Count entries and average their sentiment in a date range
+@timed("db.load_sentiment_stats")
+def load_sentiment_stats(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict:
+    where, params = _range_clause(start, end)
+    count, avg_sentiment = get_connection().execute(
+        f"SELECT COUNT(*), AVG(sentiment_score) FROM journal_entries WHERE {where}",
+        params,
+    ).fetchone()
+    return {"count": count, "avg_sentiment": avg_sentiment or 0.0}
+
+# Load per-day sentiment from the rollup, start and end days are inclusive
+@timed("db.load_daily_sentiment")
+def load_daily_sentiment(start: Optional[date] = None, end: Optional[date] = None) -> List[Dict]:
+    clauses: List[str] = []
+    params: List[str] = []
+    if start is not None:
+        clauses.append("day >= ?")
+        params.append(_day_key(start))
+    if end is not None:
+        clauses.append("day <= ?")
+        params.append(_day_key(end))
+
+    rows = get_connection().execute(
+        f"""
+        SELECT day, sentiment_sum / entry_count, entry_count, sentiment_sum, sentiment_min, sentiment_max
+        FROM daily_rollup
+        WHERE {" AND ".join(clauses) or "1"}
+        ORDER BY day
+        """,
+        params,
+    ).fetchall()
+    return [
+        {
+            "day": day,
+            "avg_sentiment": avg_sentiment,
+            "count": count,
+            "sentiment_sum": sentiment_sum,
+            "min_sentiment": min_sentiment,
+            "max_sentiment": max_sentiment,
+        }
+        for day, avg_sentiment, count, sentiment_sum, min_sentiment, max_sentiment in rows
+    ]
+
+# Turn free text into an FTS5 query of quoted terms, the last one matching as a prefix
+def _fts_query(query: str) -> str:
+    terms = [term.replace('"', '""') for term in query.split()]
+    if not terms:
+        return ""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+# Escape a snippet for HTML, turning the FTS highlight markers into <mark> tags
+def _highlight(snippet: Optional[str]) -> str:
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+# Search entry text, prompts and companion replies, best matches first
+@timed("db.search_entries")
+def search_entries(query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+    match = _fts_query(query)
+    if not match:
+        return []
+
+    rows = get_connection().execute(
+        f"""
+        SELECT e.id, e.created_at, e.sentiment_label, e.themes,
+               snippet(entries_fts, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) AS snippet,
+               bm25(entries_fts) AS rank
+        FROM entries_fts
+        JOIN journal_entries e ON e.id = entries_fts.rowid
+        WHERE entries_fts MATCH ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+        """,
+        (match, limit, offset),
+    ).fetchall()
+    return [
+        {
+            "id": entry_id,
+            "created_at": created_at,
+            "sentiment_label": label,
+            "themes": theme_str.split(",") if theme_str else [],
+            "snippet": _highlight(snippet),
+            "rank": rank,
+        }
+        for entry_id, created_at, label, theme_str, snippet, rank in rows
+    ]
+
+# Load normalized themes as a long table of (id, theme) for entries in a date range
+@timed("db.load_entry_themes_frame")
+def load_entry_themes_frame(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    import numpy as np
+    import pandas as pd
+
+    where, params = _range_clause(start, end, "e.created_at")
+    ids = array("q")
+    theme_codes = array("h")
+    theme_names: Dict[str, int] = {}
+
+    cursor = get_connection().execute(
+        f"""
+        SELECT t.entry_id, t.theme
+        FROM entry_themes t
+        JOIN journal_entries e ON e.id = t.entry_id
+        WHERE {where}
+        ORDER BY t.entry_id
+        """,
+        params,
+    )
+    while True:
+        rows = cursor.fetchmany(FRAME_FETCH_SIZE)
+        if not rows:
+            break
+        for entry_id, theme in rows:
+            ids.append(entry_id)
+            theme_codes.append(theme_names.setdefault(theme, len(theme_names)))
+
+    return pd.DataFrame(
+        {
+            "id": np.frombuffer(ids, dtype=np.int64),
+            "theme": pd.Categorical.from_codes(np.frombuffer(theme_codes, dtype=np.int16), categories=list(theme_names)),
+        }
+    )
+
+# Load entries in a date range straight into a typed, column oriented DataFrame
+@timed("db.load_entries_frame")
+def load_entries_frame(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       columns: Sequence[str] = FRAME_DEFAULT_COLUMNS):
+    import numpy as np
+    import pandas as pd
+
+    unknown = [column for column in columns if column not in FRAME_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}, expected some of {FRAME_COLUMNS}")
+
+    # only the requested columns are read, id is always kept as the index
+    selected = ["id"] + [column for column in columns if column not in ("id", "themes")]
+    where, params = _range_clause(start, end)
+    cursor = get_connection().execute(
+        f"""
+        SELECT {', '.join(_FRAME_SQL[column] for column in selected)}
+        FROM journal_entries
+        WHERE {where}
+        ORDER BY created_at, id
+        """,
+        params,
+    )
+
+    # SQLite hands back timestamps and labels as integers, so every column but
+    # the free text ones streams into a compact typed buffer
+    buffers = {column: array(_FRAME_BUFFERS[column]) if column in _FRAME_BUFFERS else [] for column in selected}
+    while True:
+        rows = cursor.fetchmany(FRAME_FETCH_SIZE)
+        if not rows:
+            break
+        for column, values in zip(selected, zip(*rows)):
+            buffers[column].extend(values)
+
+    data = {}
+    for column in selected:
+        values = buffers[column]
+        if column == "id":
+            continue
+        if column == "created_at":
+            data[column] = pd.to_datetime(np.frombuffer(values, dtype=np.int64), unit="ms", utc=True)
+        elif column == "sentiment_score":
+            data[column] = np.frombuffer(values, dtype=np.float32)
+        elif column == "sentiment_label":
+            data[column] = pd.Categorical.from_codes(np.frombuffer(values, dtype=np.int8), categories=list(SENTIMENT_LABELS))
+        else:
+            data[column] = pd.array(values, dtype="string")
+
+    frame = pd.DataFrame(data, index=pd.Index(np.frombuffer(buffers["id"], dtype=np.int64), name="id"))
+
+    # one boolean column per theme, pivoted from the normalized table
+    if "themes" in columns:
+        long_themes = load_entry_themes_frame(start, end)
+        positions = frame.index.get_indexer(long_themes["id"])
+        codes = long_themes["theme"].cat.codes.to_numpy()
+        keep = positions >= 0
+        flags = np.zeros((len(frame), len(long_themes["theme"].cat.categories)), dtype=bool)
+        flags[positions[keep], codes[keep]] = True
+        for code, theme in enumerate(long_themes["theme"].cat.categories):
+            frame[f"theme_{theme}"] = flags[:, code]
+
+    return frame
+
+# Start and end (exclusive) of an ISO week such as "2026-W42", in UTC
+def iso_week_bounds(iso_week: str) -> Tuple[datetime, datetime]:
+    year, week = iso_week.split("-W")
+    start = datetime.fromisocalendar(int(year), int(week), 1).replace(tzinfo=timezone.utc)
+    return start, start + timedelta(days=7)
+
+# ISO week label for a UTC day key or datetime
+def iso_week_of(value: Union[str, date]) -> str:
+    day = date.fromisoformat(value[:10]) if isinstance(value, str) else value
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+# ISO weeks that have at least one entry, newest first, read from the small daily rollup
+@timed("db.list_entry_weeks")
+def list_entry_weeks() -> List[str]:
+    days = get_connection().execute("SELECT day FROM daily_rollup ORDER BY day DESC").fetchall()
+    weeks: List[str] = []
+    for (day,) in days:
+        week = iso_week_of(day)
+        if not weeks or weeks[-1] != week:
+            weeks.append(week)
+    return weeks
+
+# Hash of a week's entry ids and scores, changes whenever the week's content does
+@timed("db.week_content_hash")
+def week_content_hash(iso_week: str) -> Tuple[str, int]:
+    start, end = iso_week_bounds(iso_week)
+    where, params = _range_clause(start, end)
+    digest = hashlib.sha256()
+    count = 0
+    for entry_id, score in get_connection().execute(
+        f"SELECT id, sentiment_score FROM journal_entries WHERE {where} ORDER BY id", params
+    ):
+        digest.update(f"{entry_id}:{score!r};".encode("ascii"))
+        count += 1
+    return digest.hexdigest(), count
+
+# Store the summaries generated for a week, replacing older ones
+@timed("db.save_weekly_summary")
+def save_weekly_summary(iso_week: str, content_hash: str, entry_count: int,
+                        rule_summary: str, companion_summary: Optional[str]) -> None:
+    def write(connection: sqlite3.Connection) -> None:
+        connection.execute(
+            """
+            INSERT INTO weekly_summaries (
+                iso_week, week_start, content_hash, entry_count, rule_summary, companion_summary, generated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (iso_week) DO UPDATE SET
+                content_hash = excluded.content_hash,
+                entry_count = excluded.entry_count,
+                rule_summary = excluded.rule_summary,
+                companion_summary = excluded.companion_summary,
+                generated_at = excluded.generated_at
+            """,
+            (
+                iso_week, iso_week_bounds(iso_week)[0].date().isoformat(), content_hash, entry_count,
+                rule_summary, companion_summary, datetime.now(timezone.utc).isoformat(),
+            ),
+        )
+
+    run_write(write)
+
+# Load the stored summaries for one ISO week
+@timed("db.load_weekly_summary")
+def load_weekly_summary(iso_week: str) -> Optional[Dict]:
+    row = get_connection().execute(
+        """
+        SELECT iso_week, week_start, content_hash, entry_count, rule_summary, companion_summary, generated_at
+        FROM weekly_summaries
+        WHERE iso_week = ?
+        """,
+        (iso_week,),
+    ).fetchone()
+    if row is None:
+        return None
+    keys = ("iso_week", "week_start", "content_hash", "entry_count", "rule_summary", "companion_summary", "generated_at")
+    return dict(zip(keys, row))
+
+# List the weeks that have stored summaries, newest first
+@timed("db.list_weekly_summaries")
+def list_weekly_summaries(limit: int = 52) -> List[Dict]:
+    rows = get_connection().execute(
+        "SELECT iso_week, entry_count, generated_at FROM weekly_summaries ORDER BY iso_week DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+    return [
+        {"iso_week": iso_week, "entry_count": entry_count, "generated_at": generated_at}
+        for iso_week, entry_count, generated_at in rows
+    ]
+
+# Command line maintenance tasks for the journal database
+def main(argv: Optional[List[str]] = None) -> None:
+    global DB_PATH
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Journal database maintenance")
+    parser.add_argument("--db", default=DB_PATH, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="apply pending schema migrations")
+    commands.add_parser("rebuild-rollup", help="recompute the daily sentiment rollup")
+    args = parser.parse_args(argv)
+    DB_PATH = args.db
+
+    if args.command == "migrate":
+        init_db()
+        print(f"Schema is at version {MIGRATIONS[-1][0]}")
+    elif args.command == "rebuild-rollup":
+        days = rebuild_daily_rollup()
+        print(f"Rebuilt daily rollup for {days} days")
+
+if __name__ == "__main__":
+    main()
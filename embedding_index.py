@@ -0,0 +1,138 @@
+# this file keeps entry embeddings in memory and finds past entries similar to a given one
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import get_connection, get_entry, get_write_generation
+from metrics import timed
+from nlp import EMBEDDING_VERSION
+
+SIMILAR_ENTRIES_K = 5
+
+# Unit length entry vectors in a growable float32 matrix, searched by brute-force cosine similarity
+class EmbeddingIndex:
+    def __init__(self, dim: int = 0, capacity: int = 1024):
+        self.dim = dim
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.positions: Dict[int, int] = {}
+        # seq of the newest entry_embeddings row seen, rows past it are new or replaced vectors
+        self.last_seq = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    # Add or replace the vector of an entry, growing the storage by doubling
+    def add(self, entry_id: int, vector: np.ndarray) -> None:
+        if not self.dim:
+            self.dim = len(vector)
+            self.vectors = np.zeros((len(self.ids), self.dim), dtype=np.float32)
+        position = self.positions.get(entry_id)
+        if position is None:
+            if self.size == len(self.ids):
+                self.ids = np.resize(self.ids, self.size * 2)
+                self.vectors = np.concatenate((self.vectors, np.zeros_like(self.vectors)))
+            position = self.size
+            self.size += 1
+            self.positions[entry_id] = position
+            self.ids[position] = entry_id
+        self.vectors[position] = vector
+
+    # The stored vector of an entry, None if it has none
+    def vector(self, entry_id: int) -> Optional[np.ndarray]:
+        position = self.positions.get(entry_id)
+        return None if position is None else self.vectors[position]
+
+    # The k entries most similar to a unit query vector as (entry id, cosine similarity), best first
+    def search(self, query: np.ndarray, k: int = SIMILAR_ENTRIES_K, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        if not self.size:
+            return []
+        scores = self.vectors[:self.size] @ query.astype(np.float32)
+        for entry_id in exclude:
+            position = self.positions.get(entry_id)
+            if position is not None:
+                scores[position] = -np.inf
+
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.ids[p]), float(scores[p])) for p in top if np.isfinite(scores[p])]
+
+# Read stored vectors of the current embedding version with seq past after_seq into the index
+def _load_into(index: EmbeddingIndex, after_seq: int) -> None:
+    cursor = get_connection().execute(
+        """
+        SELECT seq, entry_id, vector FROM entry_embeddings
+        WHERE seq > ? AND version = ?
+        ORDER BY seq
+        """,
+        (after_seq, EMBEDDING_VERSION),
+    )
+    for seq, entry_id, blob in cursor:
+        index.add(entry_id, np.frombuffer(blob, dtype=np.float16))
+        index.last_seq = seq
+
+_index: Optional[EmbeddingIndex] = None
+_index_generation: Optional[Tuple[str, int]] = None
+_index_lock = threading.Lock()
+
+# Bring the index up to date: new and replaced vectors are added in place, a deletion means a full reload
+@timed("embeddings.refresh")
+def _refresh(index: Optional[EmbeddingIndex], generation: Tuple[str, int]) -> EmbeddingIndex:
+    if index is None or _index_generation is None or _index_generation[0] != generation[0]:
+        index = EmbeddingIndex()
+    connection = get_connection()
+    # one read transaction so the count and the rows describe the same database state
+    connection.execute("BEGIN")
+    try:
+        _load_into(index, index.last_seq)
+        stored = connection.execute(
+            "SELECT COUNT(*) FROM entry_embeddings WHERE version = ?", (EMBEDDING_VERSION,)
+        ).fetchone()[0]
+        if stored != len(index):
+            index = EmbeddingIndex()
+            _load_into(index, 0)
+    finally:
+        connection.execute("COMMIT")
+    return index
+
+# The process wide index, refreshed from the database after writes, so saved entries show up on the next query
+def get_index() -> EmbeddingIndex:
+    global _index, _index_generation
+    generation = get_write_generation()
+    with _index_lock:
+        if _index is None or _index_generation != generation:
+            _index = _refresh(_index, generation)
+            _index_generation = generation
+        return _index
+
+# Past entries most similar to an entry as {"id", "similarity"} dicts, best first, empty without an embedding
+@timed("embeddings.similar_entries")
+def similar_entries(entry_id: int, k: int = SIMILAR_ENTRIES_K) -> List[Dict]:
+    index = get_index()
+    with _index_lock:
+        vector = index.vector(entry_id)
+        if vector is None:
+            return []
+        hits = index.search(vector, k, exclude=[entry_id])
+    return [{"id": hit_id, "similarity": similarity} for hit_id, similarity in hits]
+
+# Full entries related to a set of entries, by the mean of their vectors, leaving the set and exclude out
+def related_entries(entry_ids: Sequence[int], k: int = 3, exclude: Iterable[int] = ()) -> List[Dict]:
+    index = get_index()
+    with _index_lock:
+        vectors = [v for v in (index.vector(entry_id) for entry_id in entry_ids) if v is not None]
+        if not vectors:
+            return []
+        query = np.mean(vectors, axis=0)
+        query /= np.linalg.norm(query) or 1.0
+        hits = index.search(query, k, exclude=[*entry_ids, *exclude])
+
+    related = []
+    for hit_id, similarity in hits:
+        entry = get_entry(hit_id)
+        if entry is not None:
+            related.append(dict(entry, similarity=similarity))
+    return related
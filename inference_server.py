@@ -0,0 +1,259 @@
+# this file runs the sentiment model in one shared process and batches requests from every app process together
+import argparse
+import os
+import queue
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Dict, List, Optional, Tuple
+
+import nlp
+from metrics import count, record_span
+
+# unix socket of the shared server, unset means every process runs the model itself
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "")
+# shared secret for the connection handshake, INFERENCE_AUTHKEY or else a random key kept in a 0600 file
+# that the server and the app processes create on first use and then share
+INFERENCE_AUTHKEY_PATH = os.getenv("INFERENCE_AUTHKEY_PATH", "inference.key")
+_authkey: Optional[bytes] = None
+
+# a batch is run once it holds this many texts or its first request has waited this long
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "32"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+
+# callers give up on the server after this long and score in process instead
+INFERENCE_TIMEOUT_SECS = float(os.getenv("INFERENCE_TIMEOUT_SECS", "30"))
+# after a failure the server is not tried again for this long
+INFERENCE_RETRY_SECS = float(os.getenv("INFERENCE_RETRY_SECS", "30"))
+
+# The handshake key, read from the environment or the key file, creating the file if there is none yet
+def inference_authkey() -> bytes:
+    global _authkey
+    if _authkey is None:
+        key = os.getenv("INFERENCE_AUTHKEY")
+        if not key:
+            try:
+                descriptor = os.open(INFERENCE_AUTHKEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(descriptor, "w") as f:
+                    f.write(secrets.token_hex(32))
+            with open(INFERENCE_AUTHKEY_PATH, "r", encoding="utf-8") as f:
+                key = f.read().strip()
+            if not key:
+                raise RuntimeError(f"inference key file {INFERENCE_AUTHKEY_PATH} is empty")
+        _authkey = key.encode("utf-8")
+    return _authkey
+
+# Collects requests from all connections and runs them through the model in micro-batches
+class InferenceServer:
+    def __init__(self, address: str, max_batch: int = INFERENCE_MAX_BATCH,
+                 max_wait_ms: float = INFERENCE_MAX_WAIT_MS, backend: Optional[nlp.SentimentBackend] = None):
+        self.address = address
+        self.max_batch = max_batch
+        self.max_wait_secs = max_wait_ms / 1000
+        self.backend = backend
+        self._requests: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._batches = 0
+        self._texts = 0
+        self._connections = 0
+        self._connections_lock = threading.Lock()
+
+    # Wait for the first request, then keep taking requests until the batch is full or the wait is over
+    def _next_batch(self) -> List[Tuple[List[str], Future]]:
+        batch = [self._requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait_secs
+        # each connection has at most one request in flight, once all of them are in the batch nothing else can join
+        while size < self.max_batch and len(batch) < self._connections:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    # Run batches forever, one model call per batch, each caller gets back its own slice
+    def _run_batches(self) -> None:
+        while True:
+            batch = self._next_batch()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            started = time.perf_counter()
+            try:
+                scores, embeddings = nlp.compute_sentiment_embeddings_batch(texts, backend=self.backend)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            record_span("inference.batch", time.perf_counter() - started, {"texts": len(texts), "requests": len(batch)})
+            self._batches += 1
+            self._texts += len(texts)
+
+            offset = 0
+            for request_texts, future in batch:
+                end = offset + len(request_texts)
+                future.set_result((scores[offset:end], embeddings[offset:end]))
+                offset = end
+
+    # Answer one client connection until it closes, requests on it are handled one at a time
+    def _serve(self, connection: Connection) -> None:
+        with self._connections_lock:
+            self._connections += 1
+        try:
+            self._serve_requests(connection)
+        finally:
+            with self._connections_lock:
+                self._connections -= 1
+
+    def _serve_requests(self, connection: Connection) -> None:
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if request.get("op") == "stats":
+                    connection.send({"ok": True, **self.stats()})
+                    continue
+
+                future: Future = Future()
+                self._requests.put((list(request["texts"]), future))
+                try:
+                    scores, embeddings = future.result()
+                    reply = {"ok": True, "scores": scores, "embeddings": embeddings}
+                except Exception as e:
+                    reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                try:
+                    connection.send(reply)
+                except OSError:
+                    return
+
+    # Batch counters for the stats request
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self._batches,
+            "texts": self._texts,
+            "texts_per_batch": self._texts / self._batches if self._batches else 0.0,
+            "queued": self._requests.qsize(),
+            "connections": self._connections,
+        }
+
+    # Load the model, then accept connections until the process is stopped
+    def serve_forever(self) -> None:
+        self.backend = self.backend or nlp.get_sentiment_backend()
+        # a socket file left behind by a server that was killed would make bind fail
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # the socket is created owner only, a chmod after bind would leave it open for a moment
+        authkey = inference_authkey()
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=authkey)
+        finally:
+            os.umask(umask)
+        threading.Thread(target=self._run_batches, name="inference-batches", daemon=True).start()
+        print(f"Inference server listening on {self.address} (max batch {self.max_batch}, "
+              f"max wait {self.max_wait_secs * 1000:.0f}ms, backend {self.backend.mode})")
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    # a client that fails the handshake only loses its own connection
+                    print("Inference server rejected a connection:", e)
+                    continue
+                threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+        finally:
+            listener.close()
+
+# each caller thread keeps its own connection, a connection carries one request at a time
+_client_local = threading.local()
+_unavailable_until = 0.0
+
+# The calling thread's connection to the server, opened on first use
+def _client(address: str) -> Connection:
+    connection = getattr(_client_local, "connection", None)
+    if connection is None or getattr(_client_local, "address", None) != address:
+        connection = Client(address, family="AF_UNIX", authkey=inference_authkey())
+        _client_local.connection = connection
+        _client_local.address = address
+    return connection
+
+# Drop the calling thread's connection, e.g. after an error left it in an unknown state
+def _close_client() -> None:
+    connection = getattr(_client_local, "connection", None)
+    _client_local.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+# Send a request to the server and wait for its reply
+def _request(request: Dict, address: str, timeout: float) -> Dict:
+    connection = _client(address)
+    try:
+        connection.send(request)
+        if not connection.poll(timeout):
+            raise TimeoutError(f"no reply from the inference server within {timeout:.0f}s")
+        return connection.recv()
+    except BaseException:
+        _close_client()
+        raise
+
+# Sentiment and embeddings from the shared server, None when it is not configured or not reachable
+def remote_sentiment_embeddings(texts: List[str], address: str = INFERENCE_SERVER_ADDRESS,
+                                timeout: float = INFERENCE_TIMEOUT_SECS) -> Optional[Tuple[List[Tuple[float, str]], List]]:
+    global _unavailable_until
+    if not address or time.monotonic() < _unavailable_until:
+        return None
+    try:
+        reply = _request({"op": "analyze", "texts": texts}, address, timeout)
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+    except Exception as e:
+        _unavailable_until = time.monotonic() + INFERENCE_RETRY_SECS
+        count("inference.fallback")
+        print(f"Inference server unavailable, scoring in process for {INFERENCE_RETRY_SECS:.0f}s: {e}")
+        return None
+    return [tuple(score) for score in reply["scores"]], reply["embeddings"]
+
+# Whether the shared server answers, used by warmup to skip loading a local model copy
+def server_available(address: str = INFERENCE_SERVER_ADDRESS, timeout: float = 5.0) -> bool:
+    if not address:
+        return False
+    try:
+        return _request({"op": "stats"}, address, timeout)["ok"]
+    except Exception:
+        return False
+
+# Batch counters of the shared server, None when it is not reachable
+def server_stats(address: str = INFERENCE_SERVER_ADDRESS, timeout: float = 5.0) -> Optional[Dict]:
+    try:
+        return _request({"op": "stats"}, address, timeout) if address else None
+    except Exception:
+        return None
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Shared sentiment model server with dynamic micro-batching")
+    parser.add_argument("--address", default=INFERENCE_SERVER_ADDRESS or "journal-inference.sock",
+                        help="unix socket path, set INFERENCE_SERVER_ADDRESS to the same path for the app")
+    parser.add_argument("--max-batch", type=int, default=INFERENCE_MAX_BATCH, help="texts per model batch")
+    parser.add_argument("--max-wait-ms", type=float, default=INFERENCE_MAX_WAIT_MS,
+                        help="longest a request waits for others to join its batch")
+    parser.add_argument("--backend", choices=nlp.SENTIMENT_BACKENDS, default=nlp.SENTIMENT_BACKEND)
+    args = parser.parse_args(argv)
+
+    server = InferenceServer(args.address, args.max_batch, args.max_wait_ms, nlp.build_sentiment_backend(args.backend))
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+# this file runs durable background jobs from the jobs table, such as companion replies to saved entries
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import database
+from database import enqueue_job, get_connection, get_entry, run_write, set_entry_reply
+from metrics import count, span
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "6"))
+JOB_POLL_SECS = float(os.getenv("JOB_POLL_SECS", "2"))
+
+# a claimed job whose worker died becomes claimable again after this long, a live worker renews
+# the lease every third of it, so a handler may run longer, e.g. a bedrock call going through its retries
+JOB_LEASE_SECS = float(os.getenv("JOB_LEASE_SECS", "120"))
+
+# retries back off exponentially with full jitter, from a few seconds up to a few minutes
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "5"))
+JOB_BACKOFF_CAP = float(os.getenv("JOB_BACKOFF_CAP", "300"))
+
+# Raised by a handler for a failure that retrying cannot fix, the job goes straight to dead
+class PermanentJobError(Exception):
+    pass
+
+# Raised when a worker's lease ran out and another worker claimed the job, its result is thrown away
+class LeaseLostError(Exception):
+    pass
+
+# Handlers by job kind, each receives the job row as a dict
+HANDLERS: Dict[str, Callable[[Dict], None]] = {}
+
+# Register a handler for a job kind
+def handler(kind: str) -> Callable:
+    def register(fn: Callable[[Dict], None]) -> Callable[[Dict], None]:
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+# partial output of the jobs running in this process by job id, kept out of the database because
+# every commit there invalidates the result cache, the analytics snapshot and the embedding index
+_progress: Dict[int, str] = {}
+_progress_lock = threading.Lock()
+
+# Store the output a running job has produced so far, readers in this process see it through job_progress
+def save_progress(job: Dict, progress: str) -> None:
+    with _progress_lock:
+        _progress[job["id"]] = progress
+
+# Stream the companion's reply onto the entry, an entry that already has one is left alone
+@handler("companion_reply")
+def companion_reply(job: Dict) -> None:
+    from ai_companion import generate_companion_response_stream, has_claude
+
+    entry = get_entry(job["entry_id"])
+    if entry is None:
+        raise PermanentJobError(f"entry {job['entry_id']} no longer exists")
+    if entry["ai_reply"]:
+        return
+    if not has_claude():
+        raise RuntimeError("companion unavailable")
+
+    # the text so far is published as it arrives so the journal tab can show it streaming in
+    reply = ""
+    for delta in generate_companion_response_stream(entry):
+        reply += delta
+        save_progress(job, reply)
+
+    if not reply.strip():
+        raise RuntimeError("companion returned no reply")
+
+    def write(connection: sqlite3.Connection) -> None:
+        if not _holds_lease(connection, job):
+            raise LeaseLostError(f"job {job['id']} was claimed by another worker")
+        set_entry_reply(connection, entry["id"], reply.strip())
+
+    run_write(write)
+
+# Delay before the given attempt is retried, attempts start at 1
+def retry_delay(attempt: int, base: float = JOB_BACKOFF_BASE, cap: float = JOB_BACKOFF_CAP) -> float:
+    return random.uniform(base / 2, min(cap, base * (2 ** (attempt - 1))))
+
+# Claim the next due job, also taking back jobs whose worker's lease ran out
+def _claim(connection: sqlite3.Connection, kinds: List[str]) -> Optional[Dict]:
+    now = time.time()
+    placeholders = ",".join("?" for _ in kinds)
+    row = connection.execute(
+        f"""
+        SELECT id, kind, entry_id, payload, attempts FROM jobs
+        WHERE kind IN ({placeholders})
+          AND ((status = 'pending' AND run_after <= ?) OR (status = 'running' AND locked_until < ?))
+        ORDER BY run_after
+        LIMIT 1
+        """,
+        (*kinds, now, now),
+    ).fetchone()
+    if row is None:
+        return None
+    connection.execute(
+        """
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ?, updated_at = ?
+        WHERE id = ?
+        """,
+        (now + JOB_LEASE_SECS, datetime.now(timezone.utc).isoformat(), row[0]),
+    )
+    return {"id": row[0], "kind": row[1], "entry_id": row[2], "payload": json.loads(row[3]), "attempts": row[4] + 1}
+
+# Whether a claimed job is still this worker's, a claim after an expired lease bumps attempts
+def _holds_lease(connection: sqlite3.Connection, job: Dict) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM jobs WHERE id = ? AND status = 'running' AND attempts = ?", (job["id"], job["attempts"])
+    ).fetchone() is not None
+
+# Renew the lease of a claimed job every third of JOB_LEASE_SECS until stop is set
+def _hold_lease(job: Dict, stop: threading.Event) -> None:
+    def write(connection: sqlite3.Connection) -> None:
+        connection.execute(
+            "UPDATE jobs SET locked_until = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+            (time.time() + JOB_LEASE_SECS, job["id"], job["attempts"]),
+        )
+
+    while not stop.wait(JOB_LEASE_SECS / 3):
+        try:
+            run_write(write)
+        except Exception as e:
+            print(f"Could not renew the lease of job {job['id']}: {e}")
+
+# Record how a job run ended, rescheduling it or moving it to dead once attempts run out;
+# "lost" when another worker has claimed the job since, its run decides instead
+def _finish(job: Dict, error: Optional[BaseException], max_attempts: int) -> str:
+    if isinstance(error, LeaseLostError):
+        return "lost"
+    if error is None:
+        status, run_after, message = "done", None, None
+    elif isinstance(error, PermanentJobError) or job["attempts"] >= max_attempts:
+        status, run_after, message = "dead", None, f"{type(error).__name__}: {error}"
+    else:
+        status, run_after = "pending", time.time() + retry_delay(job["attempts"])
+        message = f"{type(error).__name__}: {error}"
+
+    def write(connection: sqlite3.Connection) -> int:
+        return connection.execute(
+            """
+            UPDATE jobs
+            SET status = ?, run_after = COALESCE(?, run_after), locked_until = NULL, last_error = ?, updated_at = ?
+            WHERE id = ? AND status = 'running' AND attempts = ?
+            """,
+            (status, run_after, message, datetime.now(timezone.utc).isoformat(), job["id"], job["attempts"]),
+        ).rowcount
+
+    return status if run_write(write) else "lost"
+
+# Claim and run one due job, returns its new status or None when nothing was due
+def run_one(max_attempts: int = JOB_MAX_ATTEMPTS) -> Optional[str]:
+    job = run_write(lambda connection: _claim(connection, list(HANDLERS)))
+    if job is None:
+        return None
+
+    error: Optional[BaseException] = None
+    done = threading.Event()
+    threading.Thread(target=_hold_lease, args=(job, done), name=f"lease-{job['id']}", daemon=True).start()
+    with span("jobs.run", kind=job["kind"]):
+        try:
+            HANDLERS[job["kind"]](job)
+        except Exception as e:
+            error = e
+        finally:
+            done.set()
+            with _progress_lock:
+                _progress.pop(job["id"], None)
+
+    status = _finish(job, error, max_attempts)
+    count(f"jobs.{status}", kind=job["kind"])
+    if status == "lost":
+        print(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} lost its lease to another worker")
+    elif status == "dead":
+        print(f"Job {job['id']} ({job['kind']}) moved to dead after {job['attempts']} attempts: {error}")
+    elif error is not None:
+        print(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed, will retry: {error}")
+    return status
+
+# Fixed set of threads taking due jobs from the table until stopped
+class JobWorkerPool:
+    def __init__(self, workers: int = JOB_WORKERS, poll_secs: float = JOB_POLL_SECS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.workers = workers
+        self.poll_secs = poll_secs
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                status = run_one(self.max_attempts)
+            except Exception:
+                traceback.print_exc()
+                status = None
+            if status is None:
+                # nothing due, sleep until poked by notify() or the next poll
+                self._wake.wait(self.poll_secs)
+                self._wake.clear()
+
+    # Start the worker threads
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"jobs-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # Wake idle workers, e.g. right after a job was queued
+    def notify(self) -> None:
+        self._wake.set()
+
+    # Stop after the jobs currently running finish
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+_pool: Optional[JobWorkerPool] = None
+_pool_lock = threading.Lock()
+
+# Start the process wide worker pool once, later calls are no-ops
+def start_job_workers(workers: int = JOB_WORKERS) -> JobWorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = JobWorkerPool(workers)
+            _pool.start()
+    return _pool
+
+# Tell the workers a job was just queued so they skip the poll wait
+def notify_job_workers() -> None:
+    if _pool is not None:
+        _pool.notify()
+
+# Queue a companion reply for an entry saved without one
+def request_reply(entry_id: int) -> int:
+    job_id = run_write(lambda connection: enqueue_job(connection, "companion_reply", entry_id))
+    notify_job_workers()
+    return job_id
+
+# Where the newest job for an entry stands: pending, running, done, dead, or None without a job
+def job_status(entry_id: int, kind: str = "companion_reply") -> Optional[str]:
+    row = get_connection().execute(
+        "SELECT status FROM jobs WHERE entry_id = ? AND kind = ? ORDER BY id DESC LIMIT 1", (entry_id, kind)
+    ).fetchone()
+    return row[0] if row else None
+
+# The newest job for an entry as status, progress, attempts and last_error, None without a job;
+# progress is the partial output while a worker in this process runs the job, otherwise None
+def job_progress(entry_id: int, kind: str = "companion_reply") -> Optional[Dict]:
+    row = get_connection().execute(
+        """
+        SELECT id, status, attempts, last_error FROM jobs
+        WHERE entry_id = ? AND kind = ? ORDER BY id DESC LIMIT 1
+        """,
+        (entry_id, kind),
+    ).fetchone()
+    if row is None:
+        return None
+    with _progress_lock:
+        progress = _progress.get(row[0]) if row[1] == "running" else None
+    return {"status": row[1], "progress": progress, "attempts": row[2], "last_error": row[3]}
+
+# Job counts per kind and status
+def job_stats() -> List[Dict]:
+    rows = get_connection().execute(
+        "SELECT kind, status, COUNT(*), MAX(attempts) FROM jobs GROUP BY kind, status ORDER BY kind, status"
+    ).fetchall()
+    return [{"kind": kind, "status": status, "count": n, "max_attempts": attempts} for kind, status, n, attempts in rows]
+
+# Move dead jobs back to pending with a fresh attempt budget, returns how many
+def requeue_dead(kind: Optional[str] = None) -> int:
+    def write(connection: sqlite3.Connection) -> int:
+        return connection.execute(
+            """
+            UPDATE jobs SET status = 'pending', attempts = 0, run_after = ?, updated_at = ?
+            WHERE status = 'dead' AND (? IS NULL OR kind = ?)
+            """,
+            (time.time(), datetime.now(timezone.utc).isoformat(), kind, kind),
+        ).rowcount
+
+    requeued = run_write(write)
+    notify_job_workers()
+    return requeued
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect and run background jobs")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="job counts per kind and status")
+    requeue = commands.add_parser("requeue-dead", help="give dead jobs another round of attempts")
+    requeue.add_argument("--kind")
+    commands.add_parser("drain", help="run due jobs until none are left")
+    args = parser.parse_args(argv)
+
+    database.DB_PATH = args.db
+    if args.command == "stats":
+        for row in job_stats():
+            print(f"{row['kind']:<20} {row['status']:<8} {row['count']:>6}  max attempts {row['max_attempts']}")
+    elif args.command == "requeue-dead":
+        print(f"Requeued {requeue_dead(args.kind)} dead jobs")
+    else:
+        ran = 0
+        while run_one() is not None:
+            ran += 1
+        print(f"Ran {ran} jobs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# this file imports journals from other tools in bulk and exports them back out, streaming both ways
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import database
+from database import enqueue_job, get_connection, insert_entries, iter_entries, transaction
+from nlp import SENTIMENT_BATCH_SIZE, compute_sentiment_embeddings_batch, extract_themes
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_FORMATS = ("jsonl", "csv", "markdown")
+
+# field names other tools use for the same thing, first match wins
+TEXT_FIELDS = ("text", "body", "content", "entry")
+TIME_FIELDS = ("created_at", "date", "timestamp", "created", "time")
+EXPORT_FIELDS = ("id", "created_at", "text", "prompt", "ai_reply", "sentiment_score", "sentiment_label", "themes")
+
+# journal files are often named after their day, e.g. 2021-03-04.md or 2021-03-04-evening.md
+_FILENAME_DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
+
+# Parse a timestamp from another tool into the UTC ISO form stored in created_at, naive values are taken as UTC
+def normalize_timestamp(value) -> str:
+    if isinstance(value, (int, float)) or (isinstance(value, str) and re.fullmatch(r"\d{9,13}(\.\d+)?", value.strip())):
+        seconds = float(value)
+        # epoch milliseconds from JavaScript based tools
+        if seconds > 1e11:
+            seconds /= 1000
+        moment = datetime.fromtimestamp(seconds, timezone.utc)
+    elif isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, date):
+        moment = datetime(value.year, value.month, value.day)
+    else:
+        text = str(value).strip()
+        if text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        moment = datetime.fromisoformat(text.replace(" ", "T", 1) if len(text) > 10 else text)
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+# Pick the first present field out of a record
+def _first(record: Dict, fields: Iterable[str]) -> Optional[str]:
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ""):
+            return value
+    return None
+
+# Turn a raw record from any reader into the fields import needs, None if it has no text or time
+def _to_entry(record: Dict, source: str) -> Optional[Dict]:
+    text = _first(record, TEXT_FIELDS)
+    created = _first(record, TIME_FIELDS)
+    if not text or not str(text).strip() or created is None:
+        return None
+    try:
+        created_at = normalize_timestamp(created)
+    except (TypeError, ValueError, OverflowError, OSError):
+        print(f"Skipping {source}: unreadable timestamp {created!r}")
+        return None
+    return {
+        "created_at": created_at,
+        "text": str(text).strip(),
+        "prompt": record.get("prompt") or None,
+        "ai_reply": record.get("ai_reply") or None,
+    }
+
+# Stream records from a JSON lines file, one object per line
+def read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping {path}:{line_number}: {e}")
+                continue
+            entry = _to_entry(record, f"{path}:{line_number}") if isinstance(record, dict) else None
+            if entry:
+                yield entry
+
+# Stream records from a CSV file with a header row
+def read_csv(path: str) -> Iterator[Dict]:
+    # long entries easily pass the default 128 KiB field limit
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for line_number, record in enumerate(csv.DictReader(f), 2):
+            entry = _to_entry(record, f"{path}:{line_number}")
+            if entry:
+                yield entry
+
+# Split optional "---" front matter of simple key: value lines from a Markdown body
+def _front_matter(content: str) -> Tuple[Dict, str]:
+    if not content.startswith("---"):
+        return {}, content
+    end = content.find("\n---", 3)
+    if end == -1:
+        return {}, content
+    fields = {}
+    for line in content[3:end].splitlines():
+        key, sep, value = line.partition(":")
+        if sep and key.strip():
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                value = json.loads(value) if value[0] == '"' else value[1:-1]
+            fields[key.strip()] = value
+    return fields, content[end + 4:].lstrip("\n")
+
+# Stream one entry per Markdown file under a directory, dated by front matter, file name or mtime
+def read_markdown_dir(path: str) -> Iterator[Dict]:
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith((".md", ".markdown")):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            try:
+                fields, body = _front_matter(content)
+            except json.JSONDecodeError as e:
+                print(f"Skipping {file_path}: unreadable front matter: {e}")
+                continue
+
+            # an exported reply sits under its own heading, keep it apart from the entry text
+            body, _, reply = body.partition("\n## Companion reply\n")
+            record = dict(fields, text=body.strip())
+            if reply.strip():
+                record.setdefault("ai_reply", reply.strip())
+            if _first(record, TIME_FIELDS) is None:
+                match = _FILENAME_DATE_RE.search(name)
+                record["created_at"] = match.group(1) if match else os.path.getmtime(file_path)
+            entry = _to_entry(record, file_path)
+            if entry:
+                yield entry
+
+# Guess the import format from the path
+def detect_format(path: str) -> str:
+    if os.path.isdir(path):
+        return "markdown"
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if extension == ".csv":
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {path}, pass --format")
+
+# Reader for a format
+def read_entries(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    readers = {"jsonl": read_jsonl, "csv": read_csv, "markdown": read_markdown_dir}
+    return readers[fmt or detect_format(path)](path)
+
+# Score and insert entries chunk by chunk, one transaction and one batched model pass per chunk;
+# replies in the input are always kept, request_replies queues a companion reply for entries without one
+def import_entries(entries: Iterable[Dict], chunk_size: int = IMPORT_CHUNK_SIZE,
+                   batch_size: int = SENTIMENT_BATCH_SIZE, request_replies: bool = False) -> Dict:
+    connection = get_connection()
+    iterator = iter(entries)
+    imported = 0
+    requested = 0
+    started = time.perf_counter()
+
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            break
+
+        scores, embeddings = compute_sentiment_embeddings_batch([entry["text"] for entry in chunk], batch_size=batch_size)
+        for entry, (score, label), embedding in zip(chunk, scores, embeddings):
+            entry["sentiment_score"] = score
+            entry["sentiment_label"] = label
+            entry["embedding"] = embedding
+            entry["themes"] = extract_themes(entry["text"])
+
+        with transaction(connection):
+            ids = insert_entries(connection, chunk)
+            if request_replies:
+                for entry_id, entry in zip(ids, chunk):
+                    if not entry["ai_reply"]:
+                        enqueue_job(connection, "companion_reply", entry_id)
+                        requested += 1
+
+        imported += len(chunk)
+        elapsed = time.perf_counter() - started
+        print(f"Imported {imported} entries, {imported / elapsed:.1f} entries/s")
+
+    elapsed = time.perf_counter() - started
+    return {
+        "imported": imported,
+        "replies_requested": requested,
+        "seconds": elapsed,
+        "entries_per_sec": imported / elapsed if elapsed > 0 else 0.0,
+    }
+
+# Write entries as JSON lines
+def write_jsonl(entries: Iterable[Dict], out: TextIO) -> int:
+    written = 0
+    for entry in entries:
+        out.write(json.dumps({field: entry[field] for field in EXPORT_FIELDS}, ensure_ascii=False) + "\n")
+        written += 1
+    return written
+
+# Write entries as CSV with a header row, themes comma separated in one column
+def write_csv(entries: Iterable[Dict], out: TextIO) -> int:
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_FIELDS)
+    written = 0
+    for entry in entries:
+        writer.writerow([",".join(entry[field]) if field == "themes" else entry[field] for field in EXPORT_FIELDS])
+        written += 1
+    return written
+
+# Write one Markdown file per entry with front matter that read_markdown_dir understands
+def write_markdown_dir(entries: Iterable[Dict], path: str) -> int:
+    os.makedirs(path, exist_ok=True)
+    written = 0
+    for entry in entries:
+        lines = ["---"]
+        for field in ("created_at", "prompt", "sentiment_score", "sentiment_label", "themes"):
+            value = ", ".join(entry[field]) if field == "themes" else entry[field]
+            if value not in (None, ""):
+                lines.append(f"{field}: {json.dumps(value, ensure_ascii=False) if isinstance(value, str) else value}")
+        lines += ["---", "", entry["text"].rstrip(), ""]
+        if entry["ai_reply"]:
+            lines += ["## Companion reply", "", entry["ai_reply"].rstrip(), ""]
+
+        name = f"{entry['created_at'][:10]}-{entry['id']}.md"
+        with open(os.path.join(path, name), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        written += 1
+    return written
+
+# Stream stored entries out in created_at order
+def export_entries(path: str, fmt: str = "jsonl", start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, include_replies: bool = True) -> int:
+    entries = iter_entries(start, end)
+    if not include_replies:
+        entries = (dict(entry, ai_reply=None) for entry in entries)
+
+    if fmt == "markdown":
+        return write_markdown_dir(entries, path)
+    writer = write_jsonl if fmt == "jsonl" else write_csv
+    if path == "-":
+        return writer(entries, sys.stdout)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        return writer(entries, f)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk import and export of journal entries")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="import a JSONL file, CSV file or directory of Markdown files")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=IMPORT_FORMATS, help="defaults to a guess from the path")
+    importer.add_argument("--with-replies", action="store_true",
+                          help="queue companion replies for imported entries without one, replies in the input are always kept")
+    importer.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="entries per transaction")
+    importer.add_argument("--batch-size", type=int, default=SENTIMENT_BATCH_SIZE, help="windows per model batch")
+
+    exporter = commands.add_parser("export", help="export entries as JSONL, CSV or Markdown files")
+    exporter.add_argument("path", help="output file, '-' for stdout, or a directory for markdown")
+    exporter.add_argument("--format", choices=IMPORT_FORMATS, default="jsonl")
+    exporter.add_argument("--since", type=date.fromisoformat, help="first day to export, YYYY-MM-DD")
+    exporter.add_argument("--until", type=date.fromisoformat, help="day after the last one to export, YYYY-MM-DD")
+    exporter.add_argument("--no-replies", action="store_true", help="leave companion replies out")
+    args = parser.parse_args(argv)
+
+    database.DB_PATH = args.db
+    if args.command == "import":
+        result = import_entries(
+            read_entries(args.path, args.format), args.chunk_size, args.batch_size, args.with_replies
+        )
+        print(
+            f"Done: {result['imported']} entries in {result['seconds']:.1f}s "
+            f"({result['entries_per_sec']:.1f} entries/s)"
+        )
+        if result["replies_requested"]:
+            print(f"Queued {result['replies_requested']} companion replies, the app's job workers "
+                  f"or 'python jobs.py drain' write them")
+    else:
+        def bound(day: Optional[date]) -> Optional[datetime]:
+            return datetime(day.year, day.month, day.day, tzinfo=timezone.utc) if day else None
+
+        written = export_entries(args.path, args.format, bound(args.since), bound(args.until), not args.no_replies)
+        print(f"Exported {written} entries to {args.path}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
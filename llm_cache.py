@@ -0,0 +1,148 @@
+# this file keeps companion replies in a small SQLite cache so repeated prompts skip Bedrock
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from metrics import count
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "companion_cache.db")
+LLM_CACHE_TTL_SECS = float(os.getenv("LLM_CACHE_TTL_SECS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+
+# Hash everything that changes a reply into the cache key
+def companion_cache_key(model_id: str, system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+    material = json.dumps([model_id, system_prompt, user_prompt, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+# Disk backed reply cache with a TTL and least recently used eviction
+class CompanionCache:
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_secs: float = LLM_CACHE_TTL_SECS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    # Open the cache database on first use, several processes can share it
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA busy_timeout = 5000")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS companion_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_companion_cache_last_used ON companion_cache (last_used)"
+            )
+            self._connection = connection
+        return self._connection
+
+    # Look up a cached reply, expired rows count as misses and are removed
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT response, created_at FROM companion_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl_secs:
+                if row is not None:
+                    connection.execute("DELETE FROM companion_cache WHERE key = ?", (key,))
+                self.misses += 1
+                count("cache.miss", cache="companion")
+                return None
+
+            connection.execute(
+                "UPDATE companion_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+            count("cache.hit", cache="companion")
+            return row[0]
+
+    # Store a reply, evicting the least recently used rows beyond max_entries
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    """
+                    INSERT INTO companion_cache (key, response, created_at, last_used)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        response = excluded.response,
+                        created_at = excluded.created_at,
+                        last_used = excluded.last_used
+                    """,
+                    (key, response, now, now),
+                )
+                connection.execute(
+                    """
+                    DELETE FROM companion_cache WHERE key IN (
+                        SELECT key FROM companion_cache
+                        ORDER BY last_used DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,),
+                )
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    # Drop every expired row, returns how many were removed
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._connect().execute(
+                "DELETE FROM companion_cache WHERE created_at < ?", (time.time() - self.ttl_secs,)
+            )
+            return cursor.rowcount
+
+    # Hit rate for this process plus what is stored on disk
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries, stored_hits = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM companion_cache"
+            ).fetchone()
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "stored_hits": stored_hits,
+            }
+
+_companion_cache: Optional[CompanionCache] = None
+
+# Get the process wide companion cache
+def get_companion_cache() -> CompanionCache:
+    global _companion_cache
+    if _companion_cache is None:
+        _companion_cache = CompanionCache()
+    return _companion_cache
+
+# Hit and miss counters for the companion cache
+def companion_cache_stats() -> Dict[str, float]:
+    return get_companion_cache().stats()
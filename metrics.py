@@ -0,0 +1,287 @@
+# this file records timing spans and counters for the hot paths and hands them to pluggable sinks
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+# comma separated sink names: log, prometheus, memory, none
+METRICS_SINKS = os.getenv("METRICS_SINKS", "none")
+METRICS_PROM_PATH = os.getenv("METRICS_PROM_PATH", "journal_metrics.prom")
+METRICS_PROM_FLUSH_SECS = float(os.getenv("METRICS_PROM_FLUSH_SECS", "10"))
+METRICS_RING_SIZE = int(os.getenv("METRICS_RING_SIZE", "2000"))
+
+logger = logging.getLogger("journal.metrics")
+
+# Discards everything, the default so instrumented code pays almost nothing
+class NullSink:
+    def emit(self, event: Dict) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+# Writes each event as one JSON line through the logging module
+class JsonLogSink:
+    def __init__(self, log: logging.Logger = logger, level: int = logging.INFO):
+        self.log = log
+        self.level = level
+
+    def emit(self, event: Dict) -> None:
+        self.log.log(self.level, json.dumps(event, default=str))
+
+    def flush(self) -> None:
+        pass
+
+# Aggregates events and rewrites a Prometheus text-format file for node_exporter's textfile collector
+class PrometheusFileSink:
+    def __init__(self, path: str = METRICS_PROM_PATH, flush_secs: float = METRICS_PROM_FLUSH_SECS,
+                 prefix: str = "journal"):
+        self.path = path
+        self.flush_secs = flush_secs
+        self.prefix = prefix
+        self._spans: Dict[Tuple[str, Tuple], List[float]] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._last_flush = time.monotonic()
+        # reentrant so flush can hold it across render, which takes it too
+        self._lock = threading.RLock()
+
+    def emit(self, event: Dict) -> None:
+        labels = tuple(sorted(event.get("labels", {}).items()))
+        with self._lock:
+            if event["kind"] == "span":
+                totals = self._spans.setdefault((event["name"], labels), [0, 0.0])
+                totals[0] += 1
+                totals[1] += event["secs"]
+                for field, value in event.get("fields", {}).items():
+                    if isinstance(value, (int, float)):
+                        key = (f"{event['name']}_{field}", labels)
+                        self._counters[key] = self._counters.get(key, 0) + value
+            else:
+                key = (event["name"], labels)
+                self._counters[key] = self._counters.get(key, 0) + event["value"]
+            due = time.monotonic() - self._last_flush >= self.flush_secs
+        if due:
+            self.flush()
+
+    # Render every series, spans as a _seconds summary and the rest as counters
+    def render(self) -> str:
+        def metric_name(name: str) -> str:
+            return f"{self.prefix}_" + "".join(c if c.isalnum() else "_" for c in name)
+
+        def label_text(labels: Tuple) -> str:
+            if not labels:
+                return ""
+            escaped = ((k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels)
+            parts = ",".join(f'{k}="{v}"' for k, v in escaped)
+            return "{" + parts + "}"
+
+        lines: List[str] = []
+        typed = set()
+        with self._lock:
+            spans = sorted(self._spans.items())
+            counters = sorted(self._counters.items())
+        # each metric family gets one TYPE line ahead of all its label sets
+        for (name, labels), (count, secs) in spans:
+            base = metric_name(name) + "_seconds"
+            if base not in typed:
+                typed.add(base)
+                lines.append(f"# TYPE {base} summary")
+            lines.append(f"{base}_count{label_text(labels)} {count}")
+            lines.append(f"{base}_sum{label_text(labels)} {secs:.6f}")
+        for (name, labels), value in counters:
+            base = metric_name(name) + "_total"
+            if base not in typed:
+                typed.add(base)
+                lines.append(f"# TYPE {base} counter")
+            lines.append(f"{base}{label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Replace the file atomically so a scraper never reads half of it, one flush at a time
+    # so threads never share the temp file and an older render never replaces a newer one
+    def flush(self) -> None:
+        with self._lock:
+            text = self.render()
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(temp_path, self.path)
+            self._last_flush = time.monotonic()
+
+# Keeps the most recent events in memory for the diagnostics panel
+class RingBufferSink:
+    def __init__(self, size: int = METRICS_RING_SIZE):
+        self._events: Deque[Dict] = deque(maxlen=size)
+
+    def emit(self, event: Dict) -> None:
+        self._events.append(event)
+
+    def flush(self) -> None:
+        pass
+
+    # Newest events first
+    def events(self, limit: Optional[int] = None) -> List[Dict]:
+        events = list(self._events)[::-1]
+        return events[:limit] if limit else events
+
+    # Count, p50, p95 and total seconds per span name, plus counter totals
+    def summary(self) -> List[Dict]:
+        grouped: Dict[str, List[float]] = {}
+        counters: Dict[str, float] = {}
+        for event in list(self._events):
+            if event["kind"] == "span":
+                grouped.setdefault(event["name"], []).append(event["secs"])
+            else:
+                counters[event["name"]] = counters.get(event["name"], 0) + event["value"]
+
+        rows = []
+        for name, samples in sorted(grouped.items()):
+            samples.sort()
+            rows.append({
+                "name": name,
+                "count": len(samples),
+                "p50_ms": samples[len(samples) // 2] * 1000,
+                "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+                "total_ms": sum(samples) * 1000,
+            })
+        for name, value in sorted(counters.items()):
+            rows.append({"name": name, "count": value, "p50_ms": None, "p95_ms": None, "total_ms": None})
+        return rows
+
+# active sinks, an empty list means metrics are off
+_sinks: List = []
+_sinks_lock = threading.Lock()
+
+# A span being timed, fields added with set() travel with the event
+class Span:
+    __slots__ = ("name", "labels", "fields", "started")
+
+    def __init__(self, name: str, labels: Dict):
+        self.name = name
+        self.labels = labels
+        self.fields: Dict = {}
+        self.started = time.perf_counter()
+
+    def set(self, **fields) -> None:
+        self.fields.update(fields)
+
+# Stand in for Span when metrics are off
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **fields) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+# Whether any sink is listening, callers can skip building expensive fields when not
+def enabled() -> bool:
+    return bool(_sinks)
+
+# Hand an event to every sink, a failing sink never breaks the caller
+def _emit(event: Dict) -> None:
+    for sink in _sinks:
+        try:
+            sink.emit(event)
+        except Exception as e:
+            logger.warning("Metrics sink %s failed: %s", type(sink).__name__, e)
+
+# Time the block and emit one span event when it exits, noting the exception type if it raised
+@contextmanager
+def _timed_span(name: str, labels: Dict) -> Iterator[Span]:
+    current = Span(name, labels)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        event = {
+            "kind": "span",
+            "name": name,
+            "ts": time.time(),
+            "secs": time.perf_counter() - current.started,
+            "labels": labels,
+            "fields": current.fields,
+        }
+        if error:
+            event["error"] = error
+        _emit(event)
+
+# Time a block, e.g. `with span("sentiment", texts=len(texts)) as s: ... s.set(windows=n)`
+def span(name: str, **labels):
+    if not _sinks:
+        return _NOOP_SPAN
+    return _timed_span(name, labels)
+
+# Record a span whose timing was measured elsewhere, e.g. across a generator's lifetime
+def record_span(name: str, secs: float, fields: Optional[Dict] = None, **labels) -> None:
+    if _sinks:
+        _emit({"kind": "span", "name": name, "ts": time.time(), "secs": secs, "labels": labels,
+               "fields": fields or {}})
+
+# Add to a counter
+def count(name: str, value: float = 1, **labels) -> None:
+    if _sinks:
+        _emit({"kind": "count", "name": name, "ts": time.time(), "value": value, "labels": labels})
+
+# Decorator timing every call of a function as a span named name
+def timed(name: str) -> Callable:
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return fn(*args, **kwargs)
+            with _timed_span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Register another sink, returns it for convenience
+def add_sink(sink):
+    with _sinks_lock:
+        if sink not in _sinks:
+            _sinks.append(sink)
+    return sink
+
+# Replace every sink, an empty list turns metrics off
+def set_sinks(sinks: List) -> None:
+    with _sinks_lock:
+        _sinks[:] = [sink for sink in sinks if not isinstance(sink, NullSink)]
+
+# The in-memory sink, installing one if asked and none is active
+def ring_buffer(create: bool = False) -> Optional[RingBufferSink]:
+    for sink in _sinks:
+        if isinstance(sink, RingBufferSink):
+            return sink
+    return add_sink(RingBufferSink()) if create else None
+
+# Flush every sink, e.g. on shutdown so the Prometheus file is current
+def flush() -> None:
+    for sink in list(_sinks):
+        sink.flush()
+
+# Build sinks from a comma separated spec such as "log,prometheus"
+def sinks_from_spec(spec: str) -> List:
+    builders = {"log": JsonLogSink, "prometheus": PrometheusFileSink, "memory": RingBufferSink, "none": NullSink}
+    sinks = []
+    for name in (part.strip().lower() for part in spec.split(",")):
+        if not name:
+            continue
+        if name not in builders:
+            raise ValueError(f"Unknown metrics sink {name!r}, expected one of {', '.join(builders)}")
+        sinks.append(builders[name]())
+    return sinks
+
+set_sinks(sinks_from_spec(METRICS_SINKS))
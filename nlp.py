@@ -1,67 +1,356 @@
 # this is the nlp file where we handle sentiment analysis and theme extraction
-import re
-from typing import List, Dict, Tuple
-from transformers import pipeline
-from ai_companion import has_claude, call_companion
-
-_sentiment_pipe = None
-
-# Get or create the sentiment analysis pipeline
-def get_sentiment_pipeline():
-    global _sentiment_pipe
-    if _sentiment_pipe is None:
-        _sentiment_pipe = pipeline(
-            "sentiment-analysis", 
-            model="distilbert-base-uncased-finetuned-sst-2-english",
-        )
-    return _sentiment_pipe
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import List, Dict, Optional, Sequence, Tuple
 
-# Compute sentiment score and label for a given text
-def compute_sentiment(text: str) -> Dict[float, str]:
-    if not text.strip():
-        return 0.0, "neutral"
-    
-    pipe = get_sentiment_pipeline()
-    result = pipe(text[:512])[0]
-    label = result["label"].upper()
-    score = float(result["score"])
+from metrics import record_span, timed
+from theme_matcher import MATCHER_VERSION, ThemeMatcher, load_taxonomy
 
-    if label == "POSITIVE":
-        normal = score
-        sentiment_label = "positive"
+# torch, transformers and the bedrock client are imported inside the functions
+# that need them, so importing nlp (and database, which imports it) stays cheap
 
-    elif label == "NEGATIVE":
-        normal = -score
-        sentiment_label = "negative"
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+
+# scores closer to zero than this are treated as neutral
+NEUTRAL_THRESHOLD = 0.4
+
+# long entries are scored as overlapping windows of model tokens
+WINDOW_TOKENS = 512
+WINDOW_OVERLAP = 128
+SENTIMENT_BATCH_SIZE = 16
+
+# Short stable hash used to tag stored rows with the analysis settings that produced them
+def _version_hash(*parts) -> str:
+    material = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()[:12]
+
+# changes whenever a setting that affects stored sentiment changes
+SENTIMENT_VERSION = _version_hash(SENTIMENT_MODEL, NEUTRAL_THRESHOLD, WINDOW_TOKENS, WINDOW_OVERLAP)
+
+# entry embeddings are the model's last hidden layer, mean pooled over tokens and windows
+EMBEDDING_POOLING = "mean-last-hidden"
+EMBEDDING_VERSION = _version_hash(SENTIMENT_MODEL, WINDOW_TOKENS, WINDOW_OVERLAP, EMBEDDING_POOLING)
+
+# inference backend: "fp32" (full precision), "int8" (dynamic quantization) or "torchscript"
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "fp32")
+SENTIMENT_BACKENDS = ("fp32", "int8", "torchscript")
+
+# intra-op threads for torch, 0 keeps torch's default
+SENTIMENT_THREADS = int(os.getenv("SENTIMENT_THREADS", "0"))
+
+# Parse comma separated trace lengths, WINDOW_TOKENS is always added so the longest window has a trace
+def parse_torchscript_lengths(value: str) -> Tuple[int, ...]:
+    return tuple(sorted({int(length) for length in value.split(",") if length.strip()} | {WINDOW_TOKENS}))
+
+# sequence lengths the torchscript backend is traced at, a batch is padded to the smallest that fits
+TORCHSCRIPT_LENGTHS = parse_torchscript_lengths(os.getenv("TORCHSCRIPT_LENGTHS", f"128,256,{WINDOW_TOKENS}"))
+
+# Tokenizer plus a model callable that maps a padded batch to class logits and hidden states
+class SentimentBackend:
+    def __init__(self, mode: str, tokenizer, model, positive_id: int, traced: Optional[Dict[int, object]] = None):
+        self.mode = mode
+        self.tokenizer = tokenizer
+        self.model = model
+        self.positive_id = positive_id
+        # traced models by the sequence length they were traced at, inputs are padded to one of them
+        self.traced = traced
+
+    # Pad a list of token id windows into model inputs
+    def pad(self, windows: List[List[int]]):
+        if self.traced is not None:
+            longest = max(len(window) for window in windows)
+            return self.tokenizer.pad(
+                {"input_ids": windows},
+                padding="max_length",
+                max_length=min((length for length in self.traced if length >= longest), default=max(self.traced)),
+                return_tensors="pt",
+            )
+        return self.tokenizer.pad({"input_ids": windows}, return_tensors="pt")
+
+    # Run the model on a padded batch and return its logits and last hidden layer
+    def forward(self, batch):
+        if self.traced is not None:
+            model = self.traced[batch["input_ids"].shape[1]]
+            logits, hidden_states = model(batch["input_ids"], batch["attention_mask"])[:2]
+            return logits, hidden_states[-1]
+        output = self.model(**batch)
+        return output.logits, output.hidden_states[-1]
+
+# Load the tokenizer and model and prepare them for the chosen backend
+def build_sentiment_backend(mode: str = SENTIMENT_BACKEND, threads: int = SENTIMENT_THREADS) -> SentimentBackend:
+    if mode not in SENTIMENT_BACKENDS:
+        raise ValueError(f"Unknown sentiment backend {mode!r}, expected one of {SENTIMENT_BACKENDS}")
+    if mode == "torchscript":
+        invalid = [length for length in TORCHSCRIPT_LENGTHS if not 0 < length <= WINDOW_TOKENS]
+        if invalid:
+            raise ValueError(f"TORCHSCRIPT_LENGTHS {invalid} are outside 1..{WINDOW_TOKENS}")
 
-    neutral_threshold = 0.4
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
 
-    if abs(normal) < neutral_threshold:
+    if threads > 0:
+        torch.set_num_threads(threads)
+
+    tokenizer = AutoTokenizer.from_pretrained(SENTIMENT_MODEL)
+    # hidden states come out of the same forward pass as the logits, for the entry embeddings
+    model = AutoModelForSequenceClassification.from_pretrained(
+        SENTIMENT_MODEL,
+        torchscript=(mode == "torchscript"),
+        output_hidden_states=True,
+    )
+    model.eval()
+    positive_id = model.config.label2id.get("POSITIVE", 1)
+
+    if mode == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return SentimentBackend(mode, tokenizer, model, positive_id)
+
+    if mode == "torchscript":
+        # one trace per length, so short entries are not padded to a full window; the traces are
+        # not frozen, that would copy the weights into each of them
+        traced = {}
+        for length in TORCHSCRIPT_LENGTHS:
+            example = tokenizer.pad(
+                {"input_ids": [tokenizer.build_inputs_with_special_tokens([])]},
+                padding="max_length",
+                max_length=length,
+                return_tensors="pt",
+            )
+            with torch.no_grad():
+                traced[length] = torch.jit.trace(model, (example["input_ids"], example["attention_mask"])).eval()
+        return SentimentBackend(mode, tokenizer, model, positive_id, traced=traced)
+
+    return SentimentBackend(mode, tokenizer, model, positive_id)
+
+_sentiment_backend: Optional[SentimentBackend] = None
+_sentiment_lock = threading.Lock()
+
+# Get or create the configured sentiment backend, callers block while another thread is loading it
+def get_sentiment_backend() -> SentimentBackend:
+    global _sentiment_backend
+    if _sentiment_backend is not None:
+        return _sentiment_backend
+    with _sentiment_lock:
+        if _sentiment_backend is None:
+            _sentiment_backend = build_sentiment_backend()
+    return _sentiment_backend
+
+# Whether the sentiment model has finished loading
+def sentiment_model_ready() -> bool:
+    return _sentiment_backend is not None
+
+# Turn a positive-class probability into the signed score and label we store
+def _normalize_sentiment(positive: float) -> Tuple[float, str]:
+    if positive >= 0.5:
+        normal = positive
+        sentiment_label = "positive"
+    else:
+        normal = -(1.0 - positive)
+        sentiment_label = "negative"
+
+    if abs(normal) < NEUTRAL_THRESHOLD:
         sentiment_label = "neutral"
         normal = 0.0
 
     return normal, sentiment_label
 
-# Simple theme extraction based on keyword matching
-THEME_KEYWORDS: Dict[str, List[str]] = {
-    "Work": ["work", "job", "career", "office", "boss", "colleague", "project", "meeting", "deadline", "email"],
-    "Family": ["family", "mother", "father", "sister", "brother", "child", "parent", "home", "relatives", "household"],
-    "Health": ["health", "doctor", "medicine", "illness", "exercise", "diet", "fitness", "wellness", "hospital", "treatment", "walk", "run"],
-    "Finance": ["money", "finance", "budget", "expense", "income", "savings", "investment", "debt", "bills", "payment"],
-    "Friends": ["friend", "friends", "hangout", "social", "party"],
-    "Mood": ["happy", "sad", "angry", "excited", "depressed", "anxious", "joyful", "frustrated", "content", "bored", "calm", "lonely", "stressed"],
-}
+# Split token ids into overlapping windows that fit the model once special tokens are added
+def _token_windows(ids: List[int], size: int, overlap: int) -> List[List[int]]:
+    if len(ids) <= size:
+        return [ids]
+
+    step = size - overlap
+    windows = []
+    for start in range(0, len(ids), step):
+        windows.append(ids[start:start + size])
+        if start + size >= len(ids):
+            break
+    return windows
+
+# Compute sentiment and a unit length embedding for many texts in one model pass, scoring long texts as token windows
+# blank texts are neutral and get no embedding
+def compute_sentiment_embeddings_batch(texts: List[str], batch_size: int = SENTIMENT_BATCH_SIZE,
+                                       backend: Optional[SentimentBackend] = None) -> Tuple[List[Tuple[float, str]], List]:
+    results: List[Tuple[float, str]] = [(0.0, "neutral")] * len(texts)
+    embeddings: List = [None] * len(texts)
+    indices = [i for i, text in enumerate(texts) if text and text.strip()]
+    if not indices:
+        return results, embeddings
+
+    # with a shared inference server configured the model runs there, batched with other processes' requests
+    if backend is None and os.getenv("INFERENCE_SERVER_ADDRESS"):
+        from inference_server import remote_sentiment_embeddings
+
+        remote = remote_sentiment_embeddings(texts)
+        if remote is not None:
+            return remote
+
+    import torch
+
+    backend = backend or get_sentiment_backend()
+    tokenizer = backend.tokenizer
+    started = time.perf_counter()
+
+    # tokenize every entry once, without special tokens, then window the ids
+    encoded = tokenizer(
+        [texts[i] for i in indices],
+        add_special_tokens=False,
+        truncation=False,
+        verbose=False,
+    )["input_ids"]
+
+    window_size = WINDOW_TOKENS - tokenizer.num_special_tokens_to_add()
+    windows: List[List[int]] = []
+    owners: List[int] = []
+    for owner, ids in enumerate(encoded):
+        for window in _token_windows(ids, window_size, WINDOW_OVERLAP):
+            windows.append(tokenizer.build_inputs_with_special_tokens(window))
+            owners.append(owner)
+
+    # run similar lengths together so mini-batches carry little padding
+    order = sorted(range(len(windows)), key=lambda w: len(windows[w]))
+    positive = [0.0] * len(windows)
+    # per entry sum of token states, windows of one entry simply add up
+    pooled = None
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            chunk = order[start:start + batch_size]
+            batch = backend.pad([windows[w] for w in chunk])
+            logits, hidden = backend.forward(batch)
+            probs = torch.softmax(logits, dim=-1)[:, backend.positive_id].tolist()
+            for w, prob in zip(chunk, probs):
+                positive[w] = prob
+
+            # mean pooling skips the padding, so token sums are enough here and the division comes later
+            token_sums = (hidden * batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)).sum(dim=1)
+            if pooled is None:
+                pooled = torch.zeros(len(indices), hidden.shape[-1], dtype=torch.float32)
+            pooled.index_add_(0, torch.tensor([owners[w] for w in chunk]), token_sums.float())
+
+    # combine windows per entry, weighting each window by its token count
+    totals = [0.0] * len(indices)
+    weights = [0] * len(indices)
+    for w, owner in enumerate(owners):
+        totals[owner] += positive[w] * len(windows[w])
+        weights[owner] += len(windows[w])
+
+    # the mean over tokens only matters up to scale, the vectors are normalized for cosine similarity
+    pooled = torch.nn.functional.normalize(pooled, dim=-1).numpy()
+    for owner, index in enumerate(indices):
+        results[index] = _normalize_sentiment(totals[owner] / weights[owner])
+        embeddings[index] = pooled[owner]
+
+    record_span("nlp.sentiment", time.perf_counter() - started,
+                {"texts": len(indices), "windows": len(windows)}, backend=backend.mode)
+    return results, embeddings
+
+# Compute sentiment for many texts at once, scoring long texts as token windows
+def compute_sentiment_batch(texts: List[str], batch_size: int = SENTIMENT_BATCH_SIZE,
+                            backend: Optional[SentimentBackend] = None) -> List[Tuple[float, str]]:
+    return compute_sentiment_embeddings_batch(texts, batch_size, backend)[0]
+
+# Compute sentiment score and label for a given text
+def compute_sentiment(text: str) -> Tuple[float, str]:
+    return compute_sentiment_batch([text])[0]
+
+# short labelled sentences used to check a backend agrees with fp32
+SENTIMENT_FIXTURES: List[str] = [
+    "Today was wonderful, I finally finished the project and celebrated with friends.",
+    "I feel exhausted and hopeless after another argument with my boss.",
+    "The walk by the ocean this morning left me calm and grateful.",
+    "My anxiety was through the roof all day and I could not focus.",
+    "Dinner with my family was warm and full of laughter.",
+    "I am frustrated that the bills keep piling up and the budget never works.",
+    "Went to the gym, felt strong and proud of my progress.",
+    "I miss my sister and the house feels lonely without her.",
+    "Nothing special happened, I worked and then watched a show.",
+    "The doctor said the treatment is working, what a relief.",
+    "I keep failing at the same things and it makes me sad.",
+    "Excited for the trip next week, I have been looking forward to it for months.",
+]
+
+# Compare a backend with fp32 on the fixture set, one entry per call and the whole set as one batch,
+# reporting label agreement and latency per entry for both
+def check_backend_accuracy(mode: str, texts: Optional[List[str]] = None, repeats: int = 3,
+                           threads: int = SENTIMENT_THREADS) -> Dict:
+    texts = texts or SENTIMENT_FIXTURES
+    reference = build_sentiment_backend("fp32", threads)
+    candidate = reference if mode == "fp32" else build_sentiment_backend(mode, threads)
+
+    def measure(backend: SentimentBackend, batched: bool) -> Tuple[List[Tuple[float, str]], float]:
+        compute_sentiment_batch(texts[:1], backend=backend)
+        started = time.perf_counter()
+        for _ in range(repeats):
+            if batched:
+                results = compute_sentiment_batch(texts, backend=backend)
+            else:
+                results = [compute_sentiment_batch([text], backend=backend)[0] for text in texts]
+        return results, (time.perf_counter() - started) / (repeats * len(texts))
+
+    report: Dict = {"mode": mode}
+    for name, batched in (("single", False), ("batched", True)):
+        expected, reference_latency = measure(reference, batched)
+        actual, candidate_latency = measure(candidate, batched)
+        report[name] = {
+            "label_agreement": sum(a[1] == e[1] for a, e in zip(actual, expected)) / len(texts),
+            "max_score_delta": max(abs(a[0] - e[0]) for a, e in zip(actual, expected)),
+            "fp32_ms_per_entry": reference_latency * 1000,
+            "candidate_ms_per_entry": candidate_latency * 1000,
+            "mismatches": [text for text, a, e in zip(texts, actual, expected) if a[1] != e[1]],
+        }
+    return report
+
+# Simple theme extraction based on keyword matching, the taxonomy lives in theme_taxonomy.json
+THEME_TAXONOMY_PATH = os.getenv(
+    "THEME_TAXONOMY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "theme_taxonomy.json"),
+)
+THEME_KEYWORDS: Dict[str, List[str]] = load_taxonomy(THEME_TAXONOMY_PATH)
+
+_theme_matcher = ThemeMatcher(THEME_KEYWORDS)
+
+# changes whenever the taxonomy or the matcher's stemming changes
+THEMES_VERSION = _version_hash(THEME_KEYWORDS, MATCHER_VERSION)
+
+# entries matching no taxonomy theme are tagged with this name, it has no bit in theme_mask
+GENERAL_THEME = "General"
+
+# one bit per theme in taxonomy order for the theme_mask column, "General" has no bit;
+# append new themes to the taxonomy so existing bits keep their meaning
+THEME_NAMES: List[str] = list(THEME_KEYWORDS)
+if len(THEME_NAMES) > 63:
+    raise ValueError(f"theme_mask holds at most 63 themes, the taxonomy has {len(THEME_NAMES)}")
+THEME_BITS: Dict[str, int] = {theme: 1 << index for index, theme in enumerate(THEME_NAMES)}
+
+# Encode a list of themes as a theme_mask bitmask
+def theme_mask(themes: List[str]) -> int:
+    mask = 0
+    for theme in themes:
+        mask |= THEME_BITS.get(theme, 0)
+    return mask
+
+# Bits for a theme filter and whether it includes General, which stands for entries without a taxonomy theme
+def theme_filter_mask(themes: Sequence[str]) -> Tuple[int, bool]:
+    unknown = [theme for theme in themes if theme not in THEME_BITS and theme != GENERAL_THEME]
+    if unknown:
+        raise ValueError(f"Unknown themes {unknown}, expected some of {[*THEME_BITS, GENERAL_THEME]}")
+    return theme_mask([theme for theme in themes if theme != GENERAL_THEME]), GENERAL_THEME in themes
+
+# Decode a theme_mask back into theme names, in taxonomy order
+def themes_from_mask(mask: int) -> List[str]:
+    return [theme for theme, bit in THEME_BITS.items() if mask & bit]
 
 # Extract themes from the text based on keyword presence
+@timed("nlp.themes")
 def extract_themes(text: str) -> List[str]:
-    tokens = set(re.findall(r"\w+", text.lower()))
-    themes: List[str] = []
-
-    for theme, keywords in THEME_KEYWORDS.items():
-        if any(keyword in tokens for keyword in keywords):
-            themes.append(theme)
+    return _theme_matcher.match(text) or [GENERAL_THEME]
 
-    return themes or ["General"]
+# Count keyword hits per theme in the text
+def extract_theme_counts(text: str) -> Dict[str, int]:
+    return _theme_matcher.theme_counts(text)
 
 # Generate a brief summary of themes and sentiments from entries, rule based if no companion available
 def generate_prompt_rule(last_entries: List[Dict]) -> str:
@@ -85,26 +374,14 @@ def generate_prompt_rule(last_entries: List[Dict]) -> str:
 
 # Generate a journaling prompt using the AI companion if available
 def generate_prompt_companion(last_entries: List[Dict]) -> str:
+    from ai_companion import has_claude, call_companion
+
     if not has_claude():
         return generate_prompt_rule(last_entries)
     
-    if not last_entries:
-        context = "The user is starting journaling and may have blank page anxiety."
+    from context_builder import build_prompt_context
 
-    else:
-        bullets = []
-        for entry in last_entries[-3:]:
-            bullets.append(
-                f"- {entry['created_at'][:10]}: mood{entry['sentiment_label']}, "
-                f"themes: {', '.join(entry['themes'])}"
-            )
-
-        context = "Recent entries: \n" + "\n".join(bullets)
-    user_prompt = (
-        context
-        + "\n\nBased on this, suggest ONE gentle journaling prompt (<= 30 words) "
-        "that helps the user reflect today. Do not give advice or try to solve problems, just suggest a prompt."
-    )
+    user_prompt = build_prompt_context(last_entries).text
     response = call_companion(user_prompt, max_tokens=80)
     if response and not response.startswith("Companion"):
         return response.strip()
@@ -113,8 +390,18 @@ def generate_prompt_companion(last_entries: List[Dict]) -> str:
 
 # Generate a journaling prompt, using AI companion if available
 def generate_prompt(last_entries: List[Dict]) -> str:
+    from ai_companion import has_claude
+
     if has_claude():
         return generate_prompt_companion(last_entries)
     return generate_prompt_rule(last_entries)
-        
-        
\ No newline at end of file
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check a sentiment backend against fp32 on the fixture set")
+    parser.add_argument("mode", choices=SENTIMENT_BACKENDS)
+    parser.add_argument("--threads", type=int, default=SENTIMENT_THREADS)
+    args = parser.parse_args()
+
+    print(json.dumps(check_backend_accuracy(args.mode, threads=args.threads), indent=2))
@@ -0,0 +1,133 @@
+# this file re-derives sentiment, themes and embeddings for stored entries whose analysis is out of date
+import argparse
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import database
+from database import get_connection, refresh_rollup_days, transaction, update_entry_analysis
+from nlp import (
+    EMBEDDING_VERSION,
+    SENTIMENT_BATCH_SIZE,
+    SENTIMENT_VERSION,
+    THEMES_VERSION,
+    compute_sentiment_embeddings_batch,
+    extract_themes,
+)
+
+REPROCESS_CHUNK_SIZE = 256
+CHECKPOINT_NAME = "nlp"
+
+# Where the last run stopped, restarting from scratch if the analysis versions changed since
+def _load_checkpoint(target: str, restart: bool) -> Dict:
+    row = get_connection().execute(
+        "SELECT target, last_id, rows_done FROM reprocess_state WHERE name = ?", (CHECKPOINT_NAME,)
+    ).fetchone()
+    if row is None or restart or row[0] != target:
+        return {"last_id": 0, "rows_done": 0}
+    return {"last_id": row[1], "rows_done": row[2]}
+
+# Record progress inside the chunk's transaction so a killed run resumes after the last commit
+def _save_checkpoint(connection, target: str, last_id: int, rows_done: int) -> None:
+    connection.execute(
+        """
+        INSERT INTO reprocess_state (name, target, last_id, rows_done, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET
+            target = excluded.target,
+            last_id = excluded.last_id,
+            rows_done = excluded.rows_done,
+            updated_at = excluded.updated_at
+        """,
+        (CHECKPOINT_NAME, target, last_id, rows_done, datetime.now(timezone.utc).isoformat()),
+    )
+
+# entries missing an embedding from the current version count as outdated too
+_OUTDATED_SQL = """
+    (e.sentiment_version IS NOT ? OR e.themes_version IS NOT ?
+     OR NOT EXISTS (SELECT 1 FROM entry_embeddings m WHERE m.entry_id = e.id AND m.version = ?))
+"""
+
+# Count entries still tagged with an older analysis version
+def count_outdated() -> int:
+    return get_connection().execute(
+        f"SELECT COUNT(*) FROM journal_entries e WHERE {_OUTDATED_SQL}",
+        (SENTIMENT_VERSION, THEMES_VERSION, EMBEDDING_VERSION),
+    ).fetchone()[0]
+
+# Rescore outdated entries in id order, one bounded transaction per chunk
+def reprocess(chunk_size: int = REPROCESS_CHUNK_SIZE, batch_size: int = SENTIMENT_BATCH_SIZE,
+              restart: bool = False, limit: Optional[int] = None) -> Dict:
+    connection = get_connection()
+    target = f"{SENTIMENT_VERSION}/{THEMES_VERSION}/{EMBEDDING_VERSION}"
+    checkpoint = _load_checkpoint(target, restart)
+    last_id, rows_done = checkpoint["last_id"], checkpoint["rows_done"]
+    processed = 0
+    started = time.perf_counter()
+
+    while limit is None or processed < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - processed)
+        rows = connection.execute(
+            f"""
+            SELECT e.id, e.created_at, e.text, e.sentiment_score, e.sentiment_label, e.sentiment_version,
+                   (SELECT m.version FROM entry_embeddings m WHERE m.entry_id = e.id)
+            FROM journal_entries e
+            WHERE e.id > ? AND {_OUTDATED_SQL}
+            ORDER BY e.id
+            LIMIT ?
+            """,
+            (last_id, SENTIMENT_VERSION, THEMES_VERSION, EMBEDDING_VERSION, size),
+        ).fetchall()
+        if not rows:
+            break
+
+        # only rows with an outdated sentiment or embedding version pay for model inference
+        stale = [row for row in rows if row[5] != SENTIMENT_VERSION or row[6] != EMBEDDING_VERSION]
+        scores, embeddings = compute_sentiment_embeddings_batch([row[2] for row in stale], batch_size=batch_size)
+        rescored = {row[0]: (score, embedding) for row, score, embedding in zip(stale, scores, embeddings)}
+
+        changed_days: List[str] = []
+        with transaction(connection):
+            for entry_id, created_at, text, score, label, _, _ in rows:
+                (new_score, new_label), embedding = rescored.get(entry_id, ((score, label), None))
+                update_entry_analysis(connection, entry_id, new_score, new_label, extract_themes(text), embedding)
+                if new_score != score:
+                    changed_days.append(created_at[:10])
+            refresh_rollup_days(connection, changed_days)
+            last_id = rows[-1][0]
+            rows_done += len(rows)
+            _save_checkpoint(connection, target, last_id, rows_done)
+
+        processed += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"Reprocessed {processed} rows (last id {last_id}), {processed / elapsed:.1f} rows/s")
+
+    elapsed = time.perf_counter() - started
+    return {
+        "processed": processed,
+        "rows_done": rows_done,
+        "last_id": last_id,
+        "seconds": elapsed,
+        "rows_per_sec": processed / elapsed if elapsed > 0 else 0.0,
+        "remaining": count_outdated(),
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Re-derive sentiment, themes and embeddings for outdated journal entries")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    parser.add_argument("--chunk-size", type=int, default=REPROCESS_CHUNK_SIZE, help="rows per transaction")
+    parser.add_argument("--batch-size", type=int, default=SENTIMENT_BATCH_SIZE, help="windows per model batch")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many rows")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args(argv)
+
+    database.DB_PATH = args.db
+    print(f"{count_outdated()} entries need reprocessing")
+    result = reprocess(args.chunk_size, args.batch_size, args.restart, args.limit)
+    print(
+        f"Done: {result['processed']} rows in {result['seconds']:.1f}s "
+        f"({result['rows_per_sec']:.1f} rows/s), {result['remaining']} still outdated"
+    )
+
+if __name__ == "__main__":
+    main()
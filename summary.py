@@ -1,63 +1,58 @@
 # this file generates a weekly summary of journal entries
-from collections import Counter
-from typing import List, Dict
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Set
 from ai_companion import has_claude, call_companion
+from analytics import arrays_from_entries, entry_arrays, sentiment_stats, theme_stats
+from context_builder import build_weekly_context
+from database import (
+    iso_week_bounds,
+    iso_week_of,
+    list_entry_weeks,
+    load_entries,
+    load_weekly_summary,
+    save_weekly_summary,
+    week_content_hash,
+)
 
 # Generate a brief summary of themes and sentiments from entries, rule based if no companion available
 def generate_weekly_summary_rule(entries: List[Dict]) -> str:
-    if not entries:
+    arrays = arrays_from_entries(entries)
+    stats = sentiment_stats(arrays)
+    return generate_weekly_summary_from_stats(stats["count"], stats["avg_sentiment"], theme_stats(arrays))
+
+# Generate the rule based summary from aggregates, theme_stats ordered by count descending
+def generate_weekly_summary_from_stats(total_entries: int, avg_sentiment: float, theme_stats: List[Dict]) -> str:
+    if not total_entries:
         return (
             "You don't have any entries this week yet. "
             "Try starting with a small reflection of your day."
         )
-    
-    theme_counter: Counter[str] = Counter()
-    sentiments: list[float] = []
-    theme_sentiments: Dict[str, List[float]] = {}
-
-    for entry in entries:
-        themes = entry["themes"]
-        sentiments_score = entry["sentiment_score"]
-        sentiments.append(sentiments_score)
-        for theme in themes:
-            theme_counter[theme] += 1
-            theme_sentiments.setdefault(theme, []).append(sentiments_score)
-
-    total_entries = len(entries)
-    avg_sentiment = sum(sentiments) / total_entries if total_entries > 0 else 0.0
-
-    common_themes = [theme for theme, _ in theme_counter.most_common(3)]
+
+    common_themes = [stat["theme"] for stat in theme_stats[:3]]
     lines: List[str] = []
 
     lines.append(f"This week, you made {total_entries} journal entries.")
     if common_themes:
         lines.append(f"You wrote most about: " + ", ".join(common_themes) + ".")
 
-    best_theme = None
-    best_theme_score = None
+    # brightest and hardest themes in one pass, the first of equal scores wins as before
+    best = worst = None
+    for stat in theme_stats:
+        if best is None or stat["avg_sentiment"] > best["avg_sentiment"]:
+            best = stat
+        if worst is None or stat["avg_sentiment"] < worst["avg_sentiment"]:
+            worst = stat
 
-    for theme, scores in theme_sentiments.items():
-        average_score = sum(scores) / len(scores)
-        if best_theme_score is None or average_score > best_theme_score:
-            best_theme_score = average_score
-            best_theme = theme
-
-    if best_theme is not None and best_theme_score is not None and best_theme_score > avg_sentiment:
+    if best is not None and best["avg_sentiment"] > avg_sentiment:
         lines.append(
-            f"Your mood seemed to be brighter when writing about {best_theme}."
+            f"Your mood seemed to be brighter when writing about {best['theme']}."
         )
 
-    worst_theme = None
-    worst_theme_score = None
-    for theme, scores in theme_sentiments.items():
-        average_score = sum(scores) / len(scores)
-        if worst_theme_score is None or average_score < worst_theme_score:
-            worst_theme_score = average_score
-            worst_theme = theme
-
-    if worst_theme is not None and worst_theme_score is not None and worst_theme_score < avg_sentiment:
+    if worst is not None and worst["avg_sentiment"] < avg_sentiment:
         lines.append(
-            f"You seemed to struggle more when writing about {worst_theme}. "
+            f"You seemed to struggle more when writing about {worst['theme']}. "
             "This might be an area to explore further later."
         )
 
@@ -67,6 +62,19 @@ def generate_weekly_summary_rule(entries: List[Dict]) -> str:
 
     return "\n\n".join(lines)
 
+# Generate the rule based summary for a date range from the in-memory analytics arrays
+def generate_weekly_summary_rule_range(start: datetime, end: Optional[datetime] = None) -> str:
+    arrays = entry_arrays(start, end)
+    stats = sentiment_stats(arrays)
+    return generate_weekly_summary_from_stats(stats["count"], stats["avg_sentiment"], theme_stats(arrays))
+
+# Ask the companion for a weekly summary, None if it is unavailable or fails
+def _companion_weekly_text(entries: List[Dict]) -> Optional[str]:
+    response = call_companion(build_weekly_context(entries).text, max_tokens=300)
+    if response and not response.startswith("Companion"):
+        return response.strip()
+    return None
+
 # Generate a weekly summary using the AI companion if available
 def generate_weekly_summary_companion(entries: List[Dict]) -> str:
     if not entries:
@@ -74,29 +82,76 @@ def generate_weekly_summary_companion(entries: List[Dict]) -> str:
             "You don't have any entries this week yet. "
             "Try starting with a small reflection of your day."
         )
-    
-    bullets = []
-    for entry in entries[-10:]:
-        bullets.append(
-            f"- {entry['created_at'][:10]}: mood{entry['sentiment_label']}, "
-            f"themes: {', '.join(entry['themes'])}"
-        )
-    user_prompt = (
-        "Here are the user's journal entries for the week:\n"
-        + "\n".join(bullets)
-        + "\n\nBased on these entries, provide a thoughtful weekly summary "
-        "that reflects on their themes and emotional journey. "
-        "Keep it warm, encouraging, and validating, and under 3 short paragraphs."
-    )
 
-    response = call_companion(user_prompt, max_tokens=300)
-    if response and not response.startswith("Companion"):
-        return response.strip()
-    
-    return generate_weekly_summary_rule(entries)
+    return _companion_weekly_text(entries) or generate_weekly_summary_rule(entries)
 
 # Public function to generate weekly summary
 def generate_weekly_summary(entries: List[Dict]) -> str:
     if has_claude():
         return generate_weekly_summary_companion(entries)
-    return generate_weekly_summary_rule(entries)
\ No newline at end of file
+    return generate_weekly_summary_rule(entries)
+
+# Generate and store summaries for each week whose entries changed, returns the weeks regenerated;
+# with the companion available, weeks stored without a companion summary are tried again
+def refresh_weekly_summaries(weeks: Optional[List[str]] = None) -> List[str]:
+    companion = has_claude()
+    regenerated: List[str] = []
+    for iso_week in weeks if weeks is not None else list_entry_weeks():
+        content_hash, entry_count = week_content_hash(iso_week)
+        stored = load_weekly_summary(iso_week)
+        if entry_count == 0:
+            continue
+        if stored is not None and stored["content_hash"] == content_hash and (stored["companion_summary"] or not companion):
+            continue
+
+        start, end = iso_week_bounds(iso_week)
+        rule_summary = generate_weekly_summary_rule_range(start, end)
+        companion_summary = None
+        if companion:
+            companion_summary = _companion_weekly_text(load_entries(start=start, end=end))
+
+        save_weekly_summary(iso_week, content_hash, entry_count, rule_summary, companion_summary)
+        regenerated.append(iso_week)
+    return regenerated
+
+# weeks asked for since the worker last ran, and whether every week should be checked
+_refresh_requested = threading.Event()
+_requested_weeks: Set[str] = set()
+_catch_up_requested = False
+_refresh_thread: Optional[threading.Thread] = None
+_refresh_lock = threading.Lock()
+
+# Background loop that refreshes the requested weeks, or all of them after start_summary_job
+def _summary_worker() -> None:
+    global _catch_up_requested
+    while True:
+        _refresh_requested.wait()
+        _refresh_requested.clear()
+        with _refresh_lock:
+            weeks = None if _catch_up_requested else sorted(_requested_weeks)
+            _requested_weeks.clear()
+            _catch_up_requested = False
+        try:
+            started = time.perf_counter()
+            weeks = refresh_weekly_summaries(weeks)
+            if weeks:
+                print(f"Weekly summaries regenerated for {', '.join(weeks)} in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            print("Weekly summary refresh failed:", e)
+
+# Start the background job once per process, with an initial catch-up over every week
+def start_summary_job() -> None:
+    global _refresh_thread, _catch_up_requested
+    with _refresh_lock:
+        if _refresh_thread is None:
+            _refresh_thread = threading.Thread(target=_summary_worker, name="weekly-summaries", daemon=True)
+            _refresh_thread.start()
+            _catch_up_requested = True
+            _refresh_requested.set()
+
+# Ask the background job to bring one week's summary up to date, by default the current week after a save
+def request_summary_refresh(iso_week: Optional[str] = None) -> None:
+    start_summary_job()
+    with _refresh_lock:
+        _requested_weeks.add(iso_week or iso_week_of(datetime.now(timezone.utc).date()))
+    _refresh_requested.set()
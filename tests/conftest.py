@@ -0,0 +1,43 @@
+# shared fixtures: a throwaway journal database and a companion answered by StubBedrockRuntime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.synthetic import populate
+
+# A fresh database with a few synthetic entries, ids 1 to 3
+@pytest.fixture
+def journal_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "journal.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    populate(path, 3)
+    return path
+
+# Install a stub backed companion with its own reply cache, call with StubBedrockRuntime options
+@pytest.fixture
+def stub_companion(tmp_path, monkeypatch):
+    import ai_companion
+    import llm_cache
+    from bedrock_client import BedrockClient, StubBedrockRuntime, TokenBucket
+
+    def install(**options) -> StubBedrockRuntime:
+        stub = StubBedrockRuntime(**options)
+        client = BedrockClient(stub, rate_limiter=TokenBucket(rate=0), sleep=lambda secs: None)
+        monkeypatch.setattr(ai_companion, "_bedrock_client", client)
+        monkeypatch.setattr(llm_cache, "_companion_cache", llm_cache.CompanionCache(path=str(tmp_path / "companion_cache.db")))
+        return stub
+
+    return install
+
+# Record metrics into a fresh in-memory sink for the test
+@pytest.fixture
+def recorded_metrics(monkeypatch):
+    import metrics
+
+    sink = metrics.RingBufferSink()
+    monkeypatch.setattr(metrics, "_sinks", [sink])
+    return sink
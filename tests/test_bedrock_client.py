@@ -0,0 +1,86 @@
+# BedrockClient retries and throttling, the token bucket and concurrent invoke_many, against StubBedrockRuntime
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("botocore")
+
+import bedrock_client
+from bedrock_client import BedrockClient, StubBedrockRuntime, TokenBucket, throttling_error
+from botocore.exceptions import ClientError
+
+def reply_text(payload):
+    return payload["content"][0]["text"]
+
+def test_throttling_is_retried_with_backoff(monkeypatch):
+    # full jitter picks anywhere up to the cap, taking the cap makes the delays exact
+    monkeypatch.setattr(bedrock_client.random, "uniform", lambda low, high: high)
+    sleeps = []
+    stub = StubBedrockRuntime(replies="Made it.", errors=[throttling_error(), throttling_error()])
+    client = BedrockClient(stub, rate_limiter=TokenBucket(rate=0), sleep=sleeps.append)
+
+    assert reply_text(client.invoke("model", {"messages": []})) == "Made it."
+    assert len(stub.calls) == 3
+    assert sleeps == [bedrock_client.BEDROCK_BACKOFF_BASE, bedrock_client.BEDROCK_BACKOFF_BASE * 2]
+
+def test_throttling_gives_up_after_max_attempts():
+    sleeps = []
+    stub = StubBedrockRuntime(errors=[throttling_error()] * 3)
+    client = BedrockClient(stub, rate_limiter=TokenBucket(rate=0), max_attempts=3, sleep=sleeps.append)
+
+    with pytest.raises(ClientError):
+        client.invoke("model", {"messages": []})
+    assert len(stub.calls) == 3 and len(sleeps) == 2
+
+def test_non_retryable_error_is_raised_at_once():
+    validation = ClientError(
+        {"Error": {"Code": "ValidationException", "Message": "bad body"}, "ResponseMetadata": {"HTTPStatusCode": 400}},
+        "InvokeModel",
+    )
+    sleeps = []
+    stub = StubBedrockRuntime(errors=[validation])
+    client = BedrockClient(stub, rate_limiter=TokenBucket(rate=0), sleep=sleeps.append)
+
+    with pytest.raises(ClientError) as raised:
+        client.invoke("model", {"messages": []})
+    assert raised.value is validation
+    assert len(stub.calls) == 1 and sleeps == []
+
+def test_token_bucket_holds_its_rate():
+    now = [0.0]
+    bucket = TokenBucket(rate=4, capacity=2, clock=lambda: now[0], sleep=lambda secs: now.__setitem__(0, now[0] + secs))
+
+    # the burst is free, every call after it waits a quarter second
+    for _ in range(10):
+        bucket.acquire()
+    assert now[0] == pytest.approx((10 - 2) / 4)
+
+def test_token_bucket_holds_its_rate_across_threads():
+    bucket = TokenBucket(rate=100, capacity=1)
+    started = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - started >= (20 - 1) / 100 * 0.95
+
+def test_invoke_many_keeps_input_order():
+    finished = []
+
+    # later requests finish first
+    def reply(body):
+        time.sleep(body["delay"])
+        finished.append(body["n"])
+        return f"reply {body['n']}"
+
+    client = BedrockClient(StubBedrockRuntime(replies=reply), rate_limiter=TokenBucket(rate=0), max_workers=4)
+    bodies = [{"n": n, "delay": (3 - n) * 0.05} for n in range(4)]
+    try:
+        payloads = client.invoke_many("model", bodies)
+    finally:
+        client.shutdown()
+
+    assert finished == [3, 2, 1, 0]
+    assert [reply_text(payload) for payload in payloads] == ["reply 0", "reply 1", "reply 2", "reply 3"]
@@ -0,0 +1,32 @@
+# companion prompts: the history prefix stays the same whatever the per-call part holds
+from datetime import datetime, timedelta, timezone
+
+import context_builder
+from context_builder import build_prompt_context, build_weekly_context, estimate_tokens
+
+DAY = datetime(2026, 3, 9, 18, tzinfo=timezone.utc)
+
+def entry(day_offset: int, themes=("Work",), label="neutral"):
+    return {"created_at": (DAY + timedelta(days=day_offset)).isoformat(), "sentiment_label": label, "themes": list(themes)}
+
+HISTORY = [f"history line {n} " + "x" * 40 for n in range(40)]
+
+def test_prompt_prefix_does_not_depend_on_the_suffix(monkeypatch):
+    monkeypatch.setattr(context_builder, "history_lines", lambda start, end: HISTORY)
+    few = build_prompt_context([entry(0)], related=[])
+    many = build_prompt_context([entry(0)] + [entry(0, themes=["Work", "Family", "Health"] * 3)] * 20,
+                                related=[entry(-30)] * 3)
+
+    assert few.prefix == many.prefix
+    assert estimate_tokens(few.prefix) <= context_builder.PROMPT_CONTEXT_TOKENS * context_builder.HISTORY_SHARE
+    assert many.estimated_tokens <= context_builder.PROMPT_CONTEXT_TOKENS
+    assert len(many.suffix.splitlines()) < 22
+
+def test_weekly_prefix_does_not_depend_on_the_week(monkeypatch):
+    monkeypatch.setattr(context_builder, "history_lines", lambda start, end: HISTORY if start < DAY - timedelta(days=7) else ["stats"])
+    quiet = build_weekly_context([entry(0)])
+    busy = build_weekly_context([entry(n % 5, themes=["Work", "Friends"] * 4) for n in range(200)])
+
+    assert quiet.prefix == busy.prefix
+    assert busy.estimated_tokens <= context_builder.WEEKLY_CONTEXT_TOKENS
+    assert "earlier entries left out" in busy.suffix
@@ -0,0 +1,84 @@
+# schema migrations and the shared writer under concurrent use
+import threading
+
+import numpy as np
+
+import database
+
+def test_concurrent_migrations_apply_each_step_once(tmp_path):
+    path = str(tmp_path / "journal.db")
+    start = threading.Barrier(4)
+    versions, errors = [], []
+
+    # separate connections, like the app, a job worker and a CLI starting together
+    def migrate() -> None:
+        connection = database._open_connection(path)
+        start.wait()
+        try:
+            versions.append(database.migrate(connection))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=migrate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert versions == [database.MIGRATIONS[-1][0]] * 4
+
+# Score texts without the sentiment model, every entry gets the same unit vector
+def fake_sentiment(texts):
+    vector = np.full(8, 1 / np.sqrt(8), dtype=np.float32)
+    return [(0.5, "positive") for _ in texts], [vector for _ in texts]
+
+def test_concurrent_writers_share_grouped_commits(journal_db, monkeypatch):
+    monkeypatch.setattr(database, "compute_sentiment_embeddings_batch", fake_sentiment)
+    # a short window so writes from different threads reliably meet in one batch
+    monkeypatch.setattr(database._write_queue, "window_secs", 0.005)
+    threads_count, writes_per_thread = 8, 20
+    before = database.writer_stats()
+    start = threading.Barrier(threads_count)
+    saved, errors = [], []
+
+    # half the threads save entries, the others queue raw writes into a scratch table,
+    # and one more writes through its own connection the way the command line tools do
+    def writer(number: int) -> None:
+        start.wait()
+        try:
+            for index in range(writes_per_thread):
+                if number % 2:
+                    saved.append(database.save_entry(f"entry {number}-{index}", prompt="prompt"))
+                elif number == 0:
+                    with database.transaction(database.get_connection()) as connection:
+                        connection.execute("INSERT INTO scratch (key) VALUES (?)", (f"cli-{index}",))
+                else:
+                    database.run_write(lambda connection, key=f"{number}-{index}": connection.execute(
+                        "INSERT INTO scratch (key) VALUES (?)", (key,)
+                    ))
+        except Exception as e:
+            errors.append(e)
+
+    database.run_write(lambda connection: connection.execute("CREATE TABLE scratch (key TEXT PRIMARY KEY)"))
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    connection = database.get_connection()
+    expected = threads_count * writes_per_thread // 2
+    assert len(set(saved)) == expected
+    assert connection.execute(
+        f"SELECT COUNT(*) FROM journal_entries WHERE id IN ({','.join('?' * len(saved))})", saved
+    ).fetchone()[0] == expected
+    assert connection.execute("SELECT COUNT(*) FROM scratch").fetchone()[0] == expected
+
+    after = database.writer_stats()
+    writes = after["writes"] - before["writes"]
+    assert writes == (threads_count - 1) * writes_per_thread + 1
+    assert after["batches"] - before["batches"] < writes
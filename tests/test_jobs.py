@@ -0,0 +1,88 @@
+# companion reply jobs run against the stub runtime: straight success, success after a retry, and dead letter
+import pytest
+
+pytest.importorskip("botocore")
+
+import jobs
+from database import get_entry, get_write_generation, run_write
+
+REPLY = "You showed up for yourself today, and that matters."
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(jobs, "retry_delay", lambda attempt: 0.0)
+
+def test_reply_job_succeeds(journal_db, stub_companion):
+    stub = stub_companion(replies=REPLY)
+    jobs.request_reply(1)
+
+    assert jobs.run_one() == "done"
+    assert get_entry(1)["ai_reply"] == REPLY
+    assert jobs.job_progress(1) == {"status": "done", "progress": None, "attempts": 1, "last_error": None}
+    assert len(stub.calls) == 1
+    assert jobs.run_one() is None
+
+def test_reply_job_retries_after_a_failure(journal_db, stub_companion):
+    stub = stub_companion(replies=REPLY, errors=[ValueError("bad gateway")])
+    jobs.request_reply(2)
+
+    assert jobs.run_one() == "pending"
+    job = jobs.job_progress(2)
+    assert job["attempts"] == 1 and job["last_error"]
+    assert get_entry(2)["ai_reply"] is None
+
+    assert jobs.run_one() == "done"
+    assert get_entry(2)["ai_reply"] == REPLY
+    assert len(stub.calls) == 2
+
+def test_reply_job_goes_dead_after_max_attempts(journal_db, stub_companion):
+    stub_companion(errors=[ValueError("bad gateway")] * 3)
+    jobs.request_reply(3)
+
+    assert [jobs.run_one(max_attempts=3) for _ in range(3)] == ["pending", "pending", "dead"]
+    assert jobs.run_one(max_attempts=3) is None
+    assert jobs.job_progress(3)["status"] == "dead"
+    assert get_entry(3)["ai_reply"] is None
+
+    assert jobs.requeue_dead("companion_reply") == 1
+    assert jobs.run_one() == "done"
+
+def test_streamed_progress_is_visible_without_database_writes(journal_db, stub_companion, monkeypatch):
+    stub_companion(replies=REPLY)
+    jobs.request_reply(1)
+    seen = []
+    save_progress = jobs.save_progress
+
+    # each delta is published, then read back the way the journal tab polls it
+    def record(job, progress):
+        save_progress(job, progress)
+        seen.append((jobs.job_progress(1)["progress"], get_write_generation()))
+
+    monkeypatch.setattr(jobs, "save_progress", record)
+    assert jobs.run_one() == "done"
+
+    assert [progress for progress, _ in seen][-1] == REPLY
+    assert len(seen) > 1 and len({generation for _, generation in seen}) == 1
+    assert jobs.job_progress(1)["progress"] is None
+
+def test_worker_that_lost_its_lease_does_not_finish_the_job(journal_db, stub_companion, monkeypatch):
+    stub_companion(replies=REPLY)
+    jobs.request_reply(1)
+    reclaimed = []
+
+    # halfway through the stream the lease runs out and another worker claims the job
+    def expire_and_reclaim(job, progress):
+        if not reclaimed:
+            run_write(lambda connection: connection.execute("UPDATE jobs SET locked_until = 0 WHERE id = ?", (job["id"],)))
+            reclaimed.append(run_write(lambda connection: jobs._claim(connection, ["companion_reply"])))
+
+    monkeypatch.setattr(jobs, "save_progress", expire_and_reclaim)
+    assert jobs.run_one() == "lost"
+    assert get_entry(1)["ai_reply"] is None
+    assert jobs.job_progress(1)["status"] == "running"
+
+    second = reclaimed[0]
+    assert second["attempts"] == 2
+    jobs.HANDLERS["companion_reply"](second)
+    assert jobs._finish(second, None, jobs.JOB_MAX_ATTEMPTS) == "done"
+    assert get_entry(1)["ai_reply"] == REPLY
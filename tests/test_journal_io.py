@@ -0,0 +1,58 @@
+# import and export round trips through a throwaway database
+import numpy as np
+
+import database
+import journal_io
+
+# Score every text the same without loading the model
+def fake_sentiment(texts, batch_size=None):
+    vector = np.full(8, 1 / np.sqrt(8), dtype=np.float32)
+    return [(0.5, "positive") for _ in texts], [vector for _ in texts]
+
+def stored_replies():
+    rows = database.get_connection().execute("SELECT text, ai_reply FROM journal_entries ORDER BY id").fetchall()
+    return {text: ai_reply for text, ai_reply in rows}
+
+def reply_jobs():
+    return database.get_connection().execute(
+        "SELECT COUNT(*) FROM jobs WHERE kind = 'companion_reply'"
+    ).fetchone()[0]
+
+def test_export_import_keeps_replies(journal_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(journal_io, "compute_sentiment_embeddings_batch", fake_sentiment)
+    with database.transaction(database.get_connection()) as connection:
+        database.set_entry_reply(connection, 1, "A stored reply")
+    original = stored_replies()
+    for fmt, path in (("jsonl", tmp_path / "out.jsonl"), ("csv", tmp_path / "out.csv"), ("markdown", tmp_path / "md")):
+        journal_io.export_entries(str(path), fmt)
+        monkeypatch.setattr(database, "DB_PATH", str(tmp_path / f"{fmt}.db"))
+        result = journal_io.import_entries(journal_io.read_entries(str(path), fmt))
+        assert result["imported"] == len(original)
+        assert result["replies_requested"] == 0
+        assert stored_replies() == original
+        assert reply_jobs() == 0
+        monkeypatch.setattr(database, "DB_PATH", journal_db)
+
+def test_with_replies_queues_only_missing_replies(journal_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(journal_io, "compute_sentiment_embeddings_batch", fake_sentiment)
+    path = tmp_path / "in.jsonl"
+    path.write_text(
+        '{"created_at": "2024-01-01T08:00:00Z", "text": "Answered already", "ai_reply": "Kept reply"}\n'
+        '{"created_at": "2024-01-02T08:00:00Z", "text": "Still waiting"}\n',
+        encoding="utf-8",
+    )
+    before = reply_jobs()
+    result = journal_io.import_entries(journal_io.read_entries(str(path)), request_replies=True)
+    assert result["replies_requested"] == 1
+    assert reply_jobs() == before + 1
+    replies = stored_replies()
+    assert replies["Answered already"] == "Kept reply"
+    assert replies["Still waiting"] is None
+
+def test_bad_front_matter_skips_only_that_file(tmp_path, capsys):
+    (tmp_path / "2024-01-01.md").write_text('---\nprompt: "unterminated \\"\n---\nFirst day\n', encoding="utf-8")
+    (tmp_path / "2024-01-02.md").write_text('---\nprompt: "How was it?"\n---\nSecond day\n', encoding="utf-8")
+    entries = list(journal_io.read_markdown_dir(str(tmp_path)))
+    assert [entry["text"] for entry in entries] == ["Second day"]
+    assert entries[0]["prompt"] == "How was it?"
+    assert "Skipping" in capsys.readouterr().out
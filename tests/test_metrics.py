@@ -0,0 +1,34 @@
+# metric sinks under concurrent use
+import os
+import threading
+
+import metrics
+
+def test_concurrent_prometheus_flushes(tmp_path):
+    path = str(tmp_path / "journal.prom")
+    # flush on every emit so threads keep racing on the file
+    sink = metrics.PrometheusFileSink(path=path, flush_secs=0)
+    threads_count, events_per_thread = 8, 50
+    start = threading.Barrier(threads_count)
+    errors = []
+
+    def work():
+        start.wait()
+        try:
+            for _ in range(events_per_thread):
+                sink.emit({"kind": "count", "name": "test.flush", "value": 1})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert not os.path.exists(f"{path}.tmp")
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    # the last flush saw every event
+    assert f"journal_test_flush_total {threads_count * events_per_thread}\n" in text
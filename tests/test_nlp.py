@@ -0,0 +1,14 @@
+# sentiment backend configuration, checked before any model is loaded
+import pytest
+
+import nlp
+
+def test_torchscript_lengths_always_cover_a_full_window():
+    assert nlp.parse_torchscript_lengths("128,256") == (128, 256, nlp.WINDOW_TOKENS)
+    assert nlp.parse_torchscript_lengths(f"{nlp.WINDOW_TOKENS},64, 64,") == (64, nlp.WINDOW_TOKENS)
+
+@pytest.mark.parametrize("lengths", ["0,128", "-8", f"{nlp.WINDOW_TOKENS + 1}"])
+def test_torchscript_rejects_lengths_outside_a_window(lengths, monkeypatch):
+    monkeypatch.setattr(nlp, "TORCHSCRIPT_LENGTHS", nlp.parse_torchscript_lengths(lengths))
+    with pytest.raises(ValueError, match="TORCHSCRIPT_LENGTHS"):
+        nlp.build_sentiment_backend("torchscript")
@@ -0,0 +1,90 @@
+# stream_companion against the stub runtime: chunk order, time to first token, caching and a stream that breaks off
+import pytest
+
+pytest.importorskip("botocore")
+
+import jobs
+from ai_companion import stream_companion
+from database import get_entry
+
+REPLY = "It sounds like today asked a lot of you, and you still made room to write it down."
+
+# Stub whose stream breaks off after a few text events, the way a dropped connection does
+def aborting_runtime(stub_companion, after: int):
+    stub = stub_companion(replies=REPLY)
+    full_stream = stub._event_stream
+
+    def event_stream(body, text, words_per_event=3):
+        deltas = 0
+        for event in full_stream(body, text, words_per_event):
+            if b"content_block_delta" in event["chunk"]["bytes"]:
+                if deltas == after:
+                    raise ConnectionError("stream closed by peer")
+                deltas += 1
+            yield event
+
+    stub._event_stream = event_stream
+    return stub
+
+def spans(sink, name):
+    return [event for event in sink.events() if event["kind"] == "span" and event["name"] == name]
+
+def test_chunks_arrive_in_order(stub_companion):
+    stub_companion(replies=REPLY)
+    chunks = list(stream_companion("How was today?"))
+
+    words = REPLY.split(" ")
+    assert chunks == [" ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "") for i in range(0, len(words), 3)]
+    assert "".join(chunks) == REPLY
+
+def test_time_to_first_token_is_recorded(stub_companion, recorded_metrics):
+    stub_companion(replies=REPLY, stream_delay=0.01)
+    list(stream_companion("How was today?"))
+
+    first_token = spans(recorded_metrics, "companion.first_token")
+    stream = spans(recorded_metrics, "companion.stream")
+    assert len(first_token) == 1 and len(stream) == 1
+    assert 0.01 <= first_token[0]["secs"] < stream[0]["secs"]
+    assert len(spans(recorded_metrics, "bedrock.first_token")) == 1
+
+def test_finished_stream_is_cached(stub_companion):
+    stub = stub_companion(replies=REPLY)
+    list(stream_companion("How was today?"))
+
+    assert list(stream_companion("How was today?")) == [REPLY]
+    assert len(stub.calls) == 1
+
+def test_aborted_stream_raises_after_its_partial_text(stub_companion, recorded_metrics):
+    stub = aborting_runtime(stub_companion, after=2)
+    chunks = []
+    with pytest.raises(ConnectionError):
+        for chunk in stream_companion("How was today?"):
+            chunks.append(chunk)
+
+    assert len(chunks) == 2
+    assert [event["labels"] for event in recorded_metrics.events() if event["name"] == "companion.stream_failed"] == [
+        {"error": "ConnectionError"}
+    ]
+    assert spans(recorded_metrics, "companion.stream") == []
+
+    # the partial text was not cached, the next call goes to the runtime again
+    stub._event_stream = type(stub)._event_stream.__get__(stub)
+    assert "".join(stream_companion("How was today?")) == REPLY
+    assert len(stub.calls) == 2
+
+def test_aborted_stream_fails_the_reply_job(journal_db, stub_companion):
+    aborting_runtime(stub_companion, after=2)
+    jobs.request_reply(1)
+
+    assert jobs.run_one() == "pending"
+    job = jobs.job_progress(1)
+    assert "stream closed" in job["last_error"]
+    assert job["progress"] is None
+    assert get_entry(1)["ai_reply"] is None
+
+def test_stream_logs_estimated_and_actual_input_tokens(stub_companion, caplog):
+    stub_companion(replies=REPLY)
+    with caplog.at_level("INFO", logger="ai_companion"):
+        list(stream_companion("How was today?"))
+
+    assert any(record.getMessage().startswith("Companion input tokens: estimated") for record in caplog.records)
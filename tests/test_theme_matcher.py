@@ -0,0 +1,48 @@
+# stemming and theme matching: inflected forms meet the taxonomy term they come from
+import pytest
+
+from nlp import THEME_KEYWORDS, extract_themes
+from theme_matcher import ThemeMatcher, light_stem
+
+@pytest.mark.parametrize("forms", [
+    ("meeting", "meetings", "meet"),
+    ("exercise", "exercised", "exercises", "exercising"),
+    ("boss", "bosses"),
+    ("walk", "walks", "walked", "walking"),
+    ("run", "runs", "running"),
+    ("worry", "worries", "worried"),
+    ("party", "parties"),
+    ("expense", "expenses"),
+    ("stress", "stressed", "stresses"),
+    ("lunch", "lunches"),
+])
+def test_forms_share_a_stem(forms):
+    assert len({light_stem(form) for form in forms}) == 1
+
+@pytest.mark.parametrize("word", ["news", "this", "bus", "anxious", "boss", "was", "feel"])
+def test_short_and_uninflected_words_are_left_alone(word):
+    assert light_stem(word) == word
+
+@pytest.mark.parametrize("text, themes", [
+    ("I had three meetings today", ["Work"]),
+    ("I exercised before breakfast", ["Health"]),
+    ("my bosses are mean", ["Work"]),
+    ("went running after my deadlines", ["Work", "Health"]),
+    ("Too many bills and expenses this month", ["Finance"]),
+    ("my friends threw a party for my brother", ["Family", "Friends"]),
+    ("no news is good news, this is fine", ["General"]),
+])
+def test_extract_themes(text, themes):
+    assert extract_themes(text) == themes
+
+def test_every_taxonomy_term_matches_its_own_theme():
+    for theme, terms in THEME_KEYWORDS.items():
+        for term in terms:
+            assert theme in extract_themes(term), term
+
+def test_phrases_match_whole_and_inflected():
+    matcher = ThemeMatcher({"Rest": ["day off", "long walk"], "Outdoors": ["walk"]})
+
+    assert matcher.theme_counts("Took a day off and two long walks") == {"Rest": 2, "Outdoors": 1}
+    assert matcher.match("an off day") == []
+    assert matcher.match("a long day") == []
@@ -0,0 +1,120 @@
+# this file matches journal text against a theme taxonomy of words and phrases in one pass
+import json
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+# bump when tokenizing or stemming changes, so stored themes get reprocessed
+MATCHER_VERSION = "stem-2"
+
+# words that only look inflected
+_UNSTEMMED = frozenset({"news", "series", "species"})
+
+# Drop a plural ending: parties -> party, bosses -> boss, lunches -> lunch, meetings -> meeting
+def _strip_plural(token: str) -> str:
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith(("sses", "xes", "ches", "shes", "zes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+# Drop a past or progressive ending: worried -> worry, walked -> walk, running -> run
+def _strip_verb_ending(token: str) -> str:
+    if token.endswith("ied") and len(token) > 4:
+        return token[:-3] + "y"
+    for suffix, min_length in (("ing", 6), ("ed", 5)):
+        if token.endswith(suffix) and len(token) >= min_length:
+            stem = token[:-len(suffix)]
+            # running -> runn -> run, but keep stress, fall, buzz and feel
+            if len(stem) > 2 and stem[-1] == stem[-2] and stem[-1] not in "aeioulsz":
+                stem = stem[:-1]
+            return stem
+    return token
+
+# Strip common English inflections so "walks", "walked" and "walking" all match "walk"; a final "e"
+# is dropped from every stem, so "exercise", "exercised" and "exercises" all become "exercis"
+def light_stem(token: str) -> str:
+    if len(token) <= 3 or token in _UNSTEMMED or token.endswith(("ss", "us", "is")):
+        return token
+    stem = _strip_verb_ending(_strip_plural(token))
+    if len(stem) > 3 and stem.endswith("e"):
+        stem = stem[:-1]
+    return stem
+
+# distinct words seen across journals, bounded so a long running app does not keep every token forever
+STEM_CACHE_SIZE = 65536
+
+# Memoized light_stem, most words in a journal repeat
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def _cached_stem(token: str) -> str:
+    return light_stem(token)
+
+# Lowercase, tokenize and stem a piece of text
+def stem_tokens(text: str) -> List[str]:
+    return [_cached_stem(token) for token in TOKEN_RE.findall(text.lower())]
+
+# Read a {theme: [terms]} taxonomy from a JSON file
+def load_taxonomy(path: str) -> Dict[str, List[str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        taxonomy = json.load(f)
+    if not isinstance(taxonomy, dict) or not all(isinstance(terms, list) for terms in taxonomy.values()):
+        raise ValueError(f"{path} must map each theme name to a list of terms")
+    return taxonomy
+
+# Taxonomy compiled into a stemmed-term index, matching cost depends on text length only
+class ThemeMatcher:
+    def __init__(self, taxonomy: Dict[str, List[str]]):
+        self.themes: List[str] = list(taxonomy)
+        # single words are looked up by string, phrases by token tuple
+        self._words: Dict[str, List[str]] = {}
+        self._phrases: Dict[Tuple[str, ...], List[str]] = {}
+        prefixes = set()
+
+        for theme, terms in taxonomy.items():
+            for term in terms:
+                key = tuple(stem_tokens(term))
+                if not key:
+                    continue
+                if len(key) == 1:
+                    owners = self._words.setdefault(key[0], [])
+                else:
+                    owners = self._phrases.setdefault(key, [])
+                    for length in range(1, len(key)):
+                        prefixes.add(key[:length])
+                if theme not in owners:
+                    owners.append(theme)
+
+        # phrase prefixes let the scan stop as soon as no longer term can match
+        self._prefixes: FrozenSet[Tuple[str, ...]] = frozenset(prefixes)
+        self._phrase_starts: FrozenSet[str] = frozenset(prefix[0] for prefix in prefixes)
+        self.max_terms = max((len(key) for key in self._phrases), default=1)
+
+    # Count how many term hits each theme gets in the text
+    def theme_counts(self, text: str) -> Dict[str, int]:
+        tokens = stem_tokens(text)
+        counts: Counter = Counter()
+        words, phrase_starts = self._words, self._phrase_starts
+        for start, token in enumerate(tokens):
+            owners = words.get(token)
+            if owners:
+                counts.update(owners)
+            if token not in phrase_starts:
+                continue
+            for end in range(start + 2, min(start + self.max_terms, len(tokens)) + 1):
+                key = tuple(tokens[start:end])
+                owners = self._phrases.get(key)
+                if owners:
+                    counts.update(owners)
+                if key not in self._prefixes:
+                    break
+        return dict(counts)
+
+    # Themes with at least one hit, in taxonomy order
+    def match(self, text: str) -> List[str]:
+        counts = self.theme_counts(text)
+        return [theme for theme in self.themes if theme in counts]
@@ -0,0 +1,77 @@
+# this file loads the sentiment model and bedrock client in the background once the UI is up
+import threading
+import time
+from typing import Dict, Optional
+
+_warmup_thread: Optional[threading.Thread] = None
+_warmup_lock = threading.Lock()
+_warmup_done = threading.Event()
+
+# what the diagnostics caption shows, one entry per dependency
+_status: Dict[str, str] = {"sentiment_model": "not started", "companion": "not started"}
+_timings: Dict[str, float] = {}
+
+# Load each heavy dependency in turn, recording how long it took
+def _run_warmup() -> None:
+    try:
+        _status["sentiment_model"] = "loading"
+        started = time.perf_counter()
+        try:
+            from inference_server import server_available
+            from nlp import get_sentiment_backend
+
+            # with a shared inference server up, this process does not need its own model copy
+            if server_available():
+                _status["sentiment_model"] = "served by inference server"
+            else:
+                get_sentiment_backend()
+                _status["sentiment_model"] = "ready"
+        except Exception as e:
+            _status["sentiment_model"] = f"failed: {e}"
+        _timings["sentiment_model_secs"] = time.perf_counter() - started
+
+        _status["companion"] = "loading"
+        started = time.perf_counter()
+        try:
+            from ai_companion import has_claude
+
+            _status["companion"] = "ready" if has_claude() else "unavailable"
+        except Exception as e:
+            _status["companion"] = f"failed: {e}"
+        _timings["companion_secs"] = time.perf_counter() - started
+
+        print(
+            "Warmup finished: "
+            f"sentiment model {_timings['sentiment_model_secs']:.2f}s, "
+            f"companion {_timings['companion_secs']:.2f}s"
+        )
+    finally:
+        _warmup_done.set()
+
+# Start the warmup thread once per process, later calls are no-ops
+def start_warmup() -> None:
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_run_warmup, name="warmup", daemon=True)
+            _warmup_thread.start()
+
+# Block until warmup finishes, returns immediately if it was never started
+def wait_for_warmup(timeout: Optional[float] = None) -> bool:
+    if _warmup_thread is None:
+        return True
+    return _warmup_done.wait(timeout)
+
+# Record startup timings measured by the app, only the first value of each is kept
+def record_timing(name: str, seconds: float) -> None:
+    if name not in _timings:
+        _timings[name] = seconds
+        print(f"Startup {name}: {seconds:.2f}s")
+
+# Whether warmup has found the companion reachable, False until it has checked
+def companion_ready() -> bool:
+    return _status["companion"] == "ready"
+
+# Readiness of each dependency plus the timings recorded so far
+def warmup_status() -> Dict:
+    return {"status": dict(_status), "timings": dict(_timings), "done": _warmup_done.is_set()}